@@ -0,0 +1,253 @@
+"""Fair-share admission control for n8n transcript calls across workers.
+
+At most ADMISSION_SLOTS transcript workflows run on n8n at once, whichever
+gunicorn worker starts them. A call takes one of the fixed rows in
+`admission_slots` with a conditional UPDATE, so the cap holds without locks.
+When every slot is busy the caller leaves a ticket in `admission_tickets`
+and waits; a freed slot goes to the ticket ranked first by weighted fair
+queuing, i.e. the user with the least (running + queued ahead) / weight, so
+one user's playlist cannot starve everyone else. Callers that cannot be
+admitted within their wait budget get AdmissionRejected with a queue
+position and a Retry-After estimate instead of timing out.
+
+Slots and tickets expire, so a crashed worker cannot hold capacity forever.
+"""
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, AdmissionSlot, AdmissionTicket
+
+log = logging.getLogger(__name__)
+
+ADMISSION_SLOTS = int(os.environ.get('ADMISSION_SLOTS', 4))
+ADMISSION_SYNC_WAIT_SECONDS = float(os.environ.get('ADMISSION_SYNC_WAIT_SECONDS', 20))
+ADMISSION_JOB_WAIT_SECONDS = float(os.environ.get('ADMISSION_JOB_WAIT_SECONDS', 600))
+ADMISSION_USER_MAX_WAITING = int(os.environ.get('ADMISSION_USER_MAX_WAITING', 5))
+ADMISSION_POLL_SECONDS = float(os.environ.get('ADMISSION_POLL_SECONDS', 1.0))
+# A slot lease must outlast a whole n8n call: one N8N_TIMEOUT read plus the
+# connect attempts and backoff, about 317s with the defaults
+ADMISSION_SLOT_SECONDS = int(os.environ.get('ADMISSION_SLOT_SECONDS', 330))
+# Typical n8n workflow duration, used for Retry-After estimates
+ADMISSION_ESTIMATE_SECONDS = int(os.environ.get('ADMISSION_ESTIMATE_SECONDS', 60))
+TICKET_TTL_SECONDS = max(10, ADMISSION_POLL_SECONDS * 5)
+
+
+def _parse_weights(value):
+    """"7:4,12:2" -> {7: 4.0, 12: 2.0}; users not listed weigh 1"""
+    weights = {}
+    for pair in filter(None, (p.strip() for p in value.split(','))):
+        user_id, _, weight = pair.partition(':')
+        try:
+            weights[int(user_id)] = max(float(weight), 0.01)
+        except ValueError:
+            log.warning("Ignoring invalid ADMISSION_WEIGHTS entry: %s", pair)
+    return weights
+
+
+ADMISSION_WEIGHTS = _parse_weights(os.environ.get('ADMISSION_WEIGHTS', ''))
+
+
+class AdmissionRejected(Exception):
+    """No n8n slot within the caller's wait budget, or too many queued calls"""
+
+    def __init__(self, position, retry_after):
+        super().__init__(f'Admission rejected at queue position {position}')
+        self.position = position
+        self.retry_after = retry_after
+
+
+# Per-worker counters
+_stats_lock = threading.Lock()
+_stats = {'admitted': 0, 'queued': 0, 'rejected': 0, 'errors': 0}
+_slots_ready = False
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def weight_for(user_id):
+    return ADMISSION_WEIGHTS.get(user_id, 1.0)
+
+
+def retry_after(position):
+    """Seconds until a caller at this (1-based) queue position is likely admitted"""
+    return math.ceil(max(position, 1) / ADMISSION_SLOTS) * ADMISSION_ESTIMATE_SECONDS
+
+
+def _ensure_slots():
+    global _slots_ready
+    if _slots_ready:
+        return
+    existing = {row.slot for row in db.session.query(AdmissionSlot.slot)}
+    for slot in range(ADMISSION_SLOTS):
+        if slot not in existing:
+            try:
+                db.session.add(AdmissionSlot(slot=slot))
+                db.session.commit()
+            except IntegrityError:
+                # Another worker created it first
+                db.session.rollback()
+    _slots_ready = True
+
+
+def _running_by_user(now):
+    rows = db.session.query(AdmissionSlot.user_id, func.count()).filter(
+        AdmissionSlot.slot < ADMISSION_SLOTS,
+        AdmissionSlot.holder.isnot(None),
+        AdmissionSlot.expires_at >= now
+    ).group_by(AdmissionSlot.user_id)
+    return dict(rows)
+
+
+def _position(ticket_id, now):
+    """0-based rank of a ticket under weighted fair queuing, or None if gone"""
+    running = _running_by_user(now)
+    queued = {}
+    ranked = []
+    for ticket in AdmissionTicket.query.filter(AdmissionTicket.expires_at >= now).order_by(
+        AdmissionTicket.enqueued_at, AdmissionTicket.id
+    ):
+        # A user's k-th waiting ticket ranks as if their earlier ones were already running
+        queued[ticket.user_id] = queued.get(ticket.user_id, 0) + 1
+        share = (running.get(ticket.user_id, 0) + queued[ticket.user_id]) / ticket.weight
+        ranked.append((share, ticket.enqueued_at, ticket.id))
+    ranked.sort()
+    order = [ticket_id_ for _, _, ticket_id_ in ranked]
+    return order.index(ticket_id) if ticket_id in order else None
+
+
+def _claim(ticket_id, user_id, now):
+    """Take a free (or expired) slot for the ticket; True on success"""
+    free = db.session.query(AdmissionSlot.slot).filter(
+        AdmissionSlot.slot < ADMISSION_SLOTS,
+        or_(AdmissionSlot.holder.is_(None), AdmissionSlot.expires_at < now)
+    ).order_by(AdmissionSlot.slot).all()
+    for (slot,) in free:
+        taken = AdmissionSlot.query.filter(
+            AdmissionSlot.slot == slot,
+            or_(AdmissionSlot.holder.is_(None), AdmissionSlot.expires_at < now)
+        ).update({
+            'holder': ticket_id,
+            'user_id': user_id,
+            'acquired_at': now,
+            'expires_at': now + timedelta(seconds=ADMISSION_SLOT_SECONDS)
+        }, synchronize_session=False)
+        db.session.commit()
+        if taken:
+            return True
+    return False
+
+
+def acquire(user_id, max_wait, on_wait=None):
+    """Wait for an n8n slot; returns the holder token for release().
+
+    on_wait(position) is called with the 1-based queue position on every
+    poll while the caller is queued. Raises AdmissionRejected when the user
+    already has ADMISSION_USER_MAX_WAITING calls queued or max_wait runs out.
+    """
+    _ensure_slots()
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+
+    AdmissionTicket.query.filter(AdmissionTicket.expires_at < now).delete(synchronize_session=False)
+    waiting = AdmissionTicket.query.filter(
+        AdmissionTicket.user_id == user_id,
+        AdmissionTicket.expires_at >= now
+    ).count()
+    if waiting >= ADMISSION_USER_MAX_WAITING:
+        db.session.commit()
+        _count('rejected')
+        raise AdmissionRejected(waiting + 1, retry_after(waiting + 1))
+
+    db.session.add(AdmissionTicket(
+        id=token, user_id=user_id, weight=weight_for(user_id), enqueued_at=now,
+        expires_at=now + timedelta(seconds=TICKET_TTL_SECONDS)
+    ))
+    db.session.commit()
+
+    deadline = time.monotonic() + max_wait
+    queued = False
+    try:
+        while True:
+            now = datetime.utcnow()
+            # Heartbeat, so the ticket outlives only its waiter
+            AdmissionTicket.query.filter_by(id=token).update(
+                {'expires_at': now + timedelta(seconds=TICKET_TTL_SECONDS)}, synchronize_session=False
+            )
+            db.session.commit()
+
+            position = _position(token, now)
+            if position == 0 and _claim(token, user_id, now):
+                _count('admitted')
+                return token
+
+            position = (position or 0) + 1
+            if not queued:
+                _count('queued')
+                queued = True
+            if on_wait:
+                on_wait(position)
+
+            if time.monotonic() >= deadline:
+                _count('rejected')
+                raise AdmissionRejected(position, retry_after(position))
+            # Don't keep a transaction open while sleeping
+            db.session.rollback()
+            time.sleep(ADMISSION_POLL_SECONDS)
+    finally:
+        try:
+            AdmissionTicket.query.filter_by(id=token).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            _count('errors')
+            log.warning("Admission ticket cleanup error: %s", e)
+
+
+def release(token):
+    try:
+        AdmissionSlot.query.filter_by(holder=token).update(
+            {'holder': None, 'user_id': None, 'acquired_at': None, 'expires_at': None},
+            synchronize_session=False
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _count('errors')
+        log.warning("Admission release error: %s", e)
+
+
+@contextmanager
+def slot(user_id, max_wait, on_wait=None):
+    """Hold one of the global n8n slots for the duration of the block"""
+    token = acquire(user_id, max_wait, on_wait)
+    try:
+        yield
+    finally:
+        release(token)
+
+
+def stats():
+    """This worker's counters plus the shared slot and queue occupancy"""
+    with _stats_lock:
+        result = dict(_stats)
+    now = datetime.utcnow()
+    try:
+        result['slots'] = ADMISSION_SLOTS
+        result['in_use'] = sum(_running_by_user(now).values())
+        result['waiting'] = AdmissionTicket.query.filter(AdmissionTicket.expires_at >= now).count()
+    except Exception as e:
+        db.session.rollback()
+        log.warning("Admission stats error: %s", e)
+    return result
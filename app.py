@@ -1,28 +1,56 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, Response, stream_with_context
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from models import db, User, Transcript
+from transcript_service import process_transcript, is_youtube_url, TranscriptError
+import transcript_cache
+import singleflight
+import admission
+import jobs
+import upstream
+import chat_stream
+import pagination
+import search
+import compression
+import http_cache
+import exporter
+import playlists
+import metrics
+import logs
+import migrations
+import identity
+import database
+import archive
+import assets
+import retrieval
+import segments
+from sse import SSE_HEADERS
 import requests
+import click
+import json
 import os
-import time
 import secrets
+import sys
 import logging
 from datetime import datetime, timedelta
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(24).hex()
-database_url = os.environ.get('DATABASE_URL')
-if database_url and database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///youtube_transcripts.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = database.normalize_url(os.environ.get('DATABASE_URL')) or 'sqlite:///youtube_transcripts.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool sizing, pre-ping and the optional read replica (DATABASE_REPLICA_URL)
+database.configure(app)
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
 # Only use secure cookies in production (HTTPS)
 app.config['SESSION_COOKIE_SECURE'] = os.environ.get('FLASK_ENV') == 'production'
 app.config['SESSION_COOKIE_HTTPONLY'] = True  # Prevent XSS
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF protection
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', 'true').lower() != 'false'
 
 # CORS Configuration - Only allow specific origins
 CORS(app, resources={
@@ -34,83 +62,70 @@ CORS(app, resources={
     }
 })
 
-# Rate Limiting
+# Rate Limiting (RATELIMIT_ENABLED=false for local load tests). memory:// counts per worker; point RATELIMIT_STORAGE_URI at a
+# shared store (e.g. redis://) so the limits hold across gunicorn workers.
+# Load on n8n itself is capped by the admission controller in admission.py.
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
 )
 
-# Security Logging
-logging.basicConfig(
-    filename='security.log',
-    level=logging.WARNING,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Logging goes through a background queue; audit events go to security.log
+logs.configure()
+log = logging.getLogger(__name__)
+security_log = logging.getLogger('security')
 
 db.init_app(app)
+jobs.init_app(app)
+exporter.init_app(app)
+assets.init_app(app)
+metrics.init_app(app)
+metrics.register_collector('transcript_cache', 'Shared transcript result cache counters', transcript_cache.stats)
+metrics.register_collector('transcript_lru', 'Serialized transcript LRU counters', http_cache.transcripts.stats)
+metrics.register_collector('singleflight', 'Single-flight coalescing counters', singleflight.stats)
+metrics.register_collector('admission', 'n8n admission control counters and occupancy', admission.stats)
+metrics.register_collector('identity', 'Authenticated user cache counters', identity.stats)
+metrics.register_collector('jobs', 'Background job pool state', jobs.stats)
+metrics.register_collector('db_pool', 'Database connection pool occupancy per engine', database.pool_stats)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
-# Seed a default user so Render deployments always have credentials
-def ensure_default_user():
-    try:
-        default_username = 'sos'
-        default_email = 'sos@example.com'
-        default_password = 'Ghgh@0011'
+# Schema changes run once per deploy (python migrations.py); a worker only checks the version
+with app.app_context():
+    migrations.check()
 
-        # Check both username and email
-        existing_user = User.query.filter(
-            (User.username == default_username) | (User.email == default_email)
-        ).first()
-        
-        if existing_user:
-            print(f"Default user already exists: {existing_user.username}")
-            return
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations"""
+    applied = migrations.upgrade()
+    print(f"Applied migrations: {applied}" if applied else 'Schema is up to date')
 
-        user = User(username=default_username, email=default_email)
-        user.set_password(default_password)
-        db.session.add(user)
-        db.session.commit()
-        print('Created default user sos for initial access')
-        logging.info('Created default user sos for initial access')
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error creating default user: {e}")
+def _archive_user(email):
+    user = User.query.filter_by(email=email.strip().lower()).first()
+    if user is None:
+        raise click.ClickException(f'No user with email {email}')
+    return user
 
-def initialize_database():
-    with app.app_context():
-        # Check if tables exist first
-        from sqlalchemy import inspect, text
-        inspector = inspect(db.engine)
-        tables = inspector.get_table_names()
-        
-        # If users table exists, migrate it first
-        if 'users' in tables:
-            try:
-                columns = [col['name'] for col in inspector.get_columns('users')]
-                
-                # Add reset_token column if missing
-                if 'reset_token' not in columns:
-                    with db.engine.connect() as conn:
-                        conn.execute(text('ALTER TABLE users ADD COLUMN reset_token VARCHAR(255)'))
-                        conn.commit()
-                    print("Added reset_token column")
-                
-                # Add reset_token_expiry column if missing
-                if 'reset_token_expiry' not in columns:
-                    with db.engine.connect() as conn:
-                        conn.execute(text('ALTER TABLE users ADD COLUMN reset_token_expiry TIMESTAMP'))
-                        conn.commit()
-                    print("Added reset_token_expiry column")
-            except Exception as e:
-                print(f"Migration warning: {e}")
-        
-        # Now create all tables (will skip existing ones)
-        db.create_all()
-        
-        ensure_default_user()
+@app.cli.command('transcripts-export')
+@click.argument('email')
+def transcripts_export_command(email):
+    """Write a user's transcript archive (NDJSON) to stdout"""
+    for line in archive.export_lines(_archive_user(email).id):
+        sys.stdout.buffer.write(line)
 
-initialize_database()
+@app.cli.command('transcripts-import')
+@click.argument('email')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def transcripts_import_command(email, path):
+    """Import a transcript archive (NDJSON) for a user"""
+    user = _archive_user(email)
+    try:
+        with open(path, 'rb') as f:
+            result = archive.import_lines(user.id, f)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(json.dumps(result.to_dict(), ensure_ascii=False))
 
 # Security Headers
 @app.after_request
@@ -124,6 +139,11 @@ def set_security_headers(response):
     response.headers['Content-Security-Policy'] = "default-src 'self' https://cdn.tailwindcss.com https://cdnjs.cloudflare.com https://fonts.googleapis.com https://fonts.gstatic.com; script-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com https://cdnjs.cloudflare.com; style-src 'self' 'unsafe-inline' https://cdn.tailwindcss.com https://fonts.googleapis.com; img-src 'self' data:; font-src 'self' https://fonts.gstatic.com data:;"
     return response
 
+# Response compression (gzip/brotli, negotiated via Accept-Encoding)
+@app.after_request
+def compress_response(response):
+    return compression.compress_response(response, request.headers.get('Accept-Encoding'))
+
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -131,11 +151,14 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity.load(int(user_id))
 
 # n8n webhook URLs
-N8N_WEBHOOK_URL = "https://n8n.srv968786.hstgr.cloud/webhook/youtube_text"
-N8N_CHAT_WEBHOOK_URL = "https://n8n.srv968786.hstgr.cloud/webhook/9e11a381-b5b2-4ff6-97ad-a9a2abd17784/chat"
+N8N_CHAT_WEBHOOK_URL = os.environ.get(
+    'N8N_CHAT_WEBHOOK_URL',
+    'https://n8n.srv968786.hstgr.cloud/webhook/9e11a381-b5b2-4ff6-97ad-a9a2abd17784/chat'
+)
+N8N_CHAT_TIMEOUT = float(os.environ.get('N8N_CHAT_TIMEOUT', 60))
 
 @app.route('/')
 @login_required
@@ -159,13 +182,13 @@ def login():
         if user and user.check_password(password):
             # Remember me functionality
             login_user(user, remember=remember)
-            logging.info(f"Successful login for email: {email} from IP: {request.remote_addr}")
+            security_log.info(f"Successful login for email: {email} from IP: {request.remote_addr}")
             if request.is_json:
                 return jsonify({'success': True, 'message': 'تم تسجيل الدخول بنجاح'})
             return redirect(url_for('index'))
         
         # Log failed login attempt
-        logging.warning(f"Failed login attempt for email: {email} from IP: {request.remote_addr}")
+        security_log.warning(f"Failed login attempt for email: {email} from IP: {request.remote_addr}")
         
         if request.is_json:
             return jsonify({'success': False, 'message': 'البريد الإلكتروني أو كلمة المرور غير صحيحة'}), 401
@@ -231,6 +254,7 @@ def register():
 @app.route('/logout')
 @login_required
 def logout():
+    identity.invalidate(current_user.id)
     logout_user()
     return redirect(url_for('login'))
 
@@ -241,164 +265,469 @@ def profile():
 
 @app.route('/my-files')
 @login_required
+@database.replica_reads
 def my_files():
-    transcripts = Transcript.query.filter_by(user_id=current_user.id).order_by(Transcript.created_at.desc()).all()
-    return render_template('my_files.html', transcripts=transcripts)
+    try:
+        cursor = pagination.decode_cursor(request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('my_files'))
+    
+    # The cards only show title, link, date and summary
+    query = pagination.project(
+        Transcript.query.filter_by(user_id=current_user.id),
+        ['video_url', 'videoTitle', 'summary']
+    )
+    transcripts, next_cursor = pagination.transcript_page(query, pagination.DEFAULT_PAGE_SIZE, cursor)
+    return render_template('my_files.html', transcripts=transcripts, next_cursor=next_cursor, is_first_page=cursor is None)
 
 @app.route('/api/my-transcripts')
 @login_required
+@database.replica_reads
 def get_my_transcripts():
-    transcripts = Transcript.query.filter_by(user_id=current_user.id).order_by(Transcript.created_at.desc()).all()
-    return jsonify([t.to_dict() for t in transcripts])
+    try:
+        fields = pagination.parse_fields(request.args.get('fields'))
+        limit = pagination.parse_limit(request.args.get('limit'))
+        cursor = pagination.decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = pagination.project(Transcript.query.filter_by(user_id=current_user.id), fields)
+    transcripts, next_cursor = pagination.transcript_page(query, limit, cursor)
+    
+    # The body stays a plain list; the next page is advertised in headers
+    response = jsonify([t.to_dict(fields) for t in transcripts])
+    if next_cursor:
+        next_args = dict(request.args, cursor=next_cursor)
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for("get_my_transcripts", **next_args)}>; rel="next"'
+    return response
+
+@app.route('/api/search')
+@login_required
+@database.replica_reads
+def search_transcripts():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit = pagination.parse_limit(request.args.get('limit'))
+        offset = int(request.args.get('offset', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    results = search.search(current_user.id, q, limit=limit, offset=offset)
+    return jsonify({'query': q, 'results': results})
 
 @app.route('/api/transcript/<int:transcript_id>')
 @login_required
+@database.replica_reads
 def get_single_transcript(transcript_id):
-    transcript = Transcript.query.filter_by(id=transcript_id, user_id=current_user.id).first()
-    if not transcript:
+    # ?fields= leaves out the heavy columns; the UI then pages fullContent from /content
+    if request.args.get('fields'):
+        try:
+            fields = pagination.parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        transcript = _find_transcript(transcript_id, fields)
+        if not transcript:
+            return jsonify({'error': 'Transcript not found'}), 404
+        body = app.json.dumps(transcript.to_dict(fields)).encode('utf-8') + b'\n'
+        entry = http_cache.CachedBody(transcript.user_id, body, http_cache.make_etag(transcript.id, body))
+        return _conditional_json(entry)
+    
+    entry = http_cache.transcripts.get(transcript_id)
+    if entry is None or entry.user_id != current_user.id:
+        transcript = _find_transcript(transcript_id)
+        if not transcript:
+            return jsonify({'error': 'Transcript not found'}), 404
+        body = app.json.dumps(transcript.to_dict()).encode('utf-8') + b'\n'
+        entry = http_cache.CachedBody(transcript.user_id, body, http_cache.make_etag(transcript.id, body))
+        http_cache.transcripts.put(transcript_id, entry)
+    return _conditional_json(entry)
+
+def _find_transcript(transcript_id, fields=None):
+    """The user's transcript; a replica miss is retried on the primary in case it lags"""
+    def find():
+        return pagination.project(
+            Transcript.query.filter_by(id=transcript_id, user_id=current_user.id), fields
+        ).first()
+    
+    transcript = find()
+    if transcript is None and database.replica_active():
+        with database.primary():
+            transcript = find()
+    return transcript
+
+def _conditional_json(entry, status=200):
+    """A cached JSON body, or 304 when the client already holds its ETag"""
+    matched = http_cache.matching_etag(request.headers.get('If-None-Match'), entry.etag)
+    if matched:
+        response = Response(status=304)
+        response.headers['ETag'] = matched
+    else:
+        response = Response(entry.body, status=status, mimetype='application/json')
+        response.headers['ETag'] = entry.etag
+    response.headers['Cache-Control'] = http_cache.TRANSCRIPT_CACHE_CONTROL
+    return response
+
+@app.route('/api/transcript/<int:transcript_id>/content')
+@login_required
+def get_transcript_content(transcript_id):
+    """A page of a transcript's full content, by ?offset=&limit= or a segments Range"""
+    owned = db.session.query(Transcript.id).filter_by(id=transcript_id, user_id=current_user.id).first()
+    if owned is None:
         return jsonify({'error': 'Transcript not found'}), 404
-    return jsonify(transcript.to_dict())
+    
+    total, length = segments.summary(transcript_id)
+    try:
+        requested = segments.parse_range(request.headers.get('Range'), total)
+    except ValueError as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 416
+        response.headers['Content-Range'] = f'segments */{total}'
+        return response
+    if requested:
+        first, last = requested
+        count = min(last - first + 1, segments.MAX_SEGMENT_PAGE)
+    else:
+        try:
+            first = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            return jsonify({'error': 'offset must be an integer'}), 400
+        try:
+            limit = pagination.parse_limit(request.args.get('limit'), segments.DEFAULT_SEGMENT_PAGE)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        count = min(limit, segments.MAX_SEGMENT_PAGE)
+    
+    rows = segments.page(transcript_id, first, count)
+    following = first + len(rows)
+    body = app.json.dumps({
+        'transcriptId': transcript_id,
+        'total': total,
+        'length': length,
+        'offset': first,
+        'segments': [row.to_dict() for row in rows],
+        'next_offset': following if following < total else None
+    }).encode('utf-8') + b'\n'
+    entry = http_cache.CachedBody(current_user.id, body, http_cache.make_etag(f'{transcript_id}-{first}', body))
+    response = _conditional_json(entry, 206 if requested else 200)
+    response.headers['Accept-Ranges'] = 'segments'
+    if requested and rows:
+        response.headers['Content-Range'] = f'segments {first}-{following - 1}/{total}'
+    return response
+
+@app.route('/api/archive')
+@login_required
+@database.replica_reads
+def export_archive():
+    filename = f"transcripts-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.ndjson"
+    return Response(
+        stream_with_context(archive.export_lines(current_user.id)),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'}
+    )
+
+@app.route('/api/archive', methods=['POST'])
+@login_required
+@limiter.limit("10 per hour")
+def import_archive():
+    # Read line by line straight from the request body; never buffer the whole archive
+    try:
+        result = archive.import_lines(current_user.id, request.stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if result.imported:
+        database.mark_written()
+    log.info("Archive import for user %s: %s", current_user.id, result.to_dict())
+    return jsonify(result.to_dict())
+
+@app.route('/api/export')
+@login_required
+def export_transcripts():
+    fmt = request.args.get('format', 'md')
+    if fmt not in exporter.EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(exporter.EXPORT_FORMATS)}"}), 400
+    if fmt == 'pdf' and not exporter.pdf_available():
+        return jsonify({'error': 'تصدير PDF غير متاح على الخادم حالياً'}), 400
+    
+    query = db.session.query(Transcript.id, Transcript.video_title, Transcript.created_at).filter(
+        Transcript.user_id == current_user.id
+    )
+    ids = request.args.get('ids', 'all')
+    if ids != 'all':
+        try:
+            ids = [int(i) for i in ids.split(',') if i.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of integers or "all"'}), 400
+        query = query.filter(Transcript.id.in_(ids))
+    entries = [tuple(row) for row in query.order_by(Transcript.created_at.desc(), Transcript.id.desc())]
+    if not entries:
+        return jsonify({'error': 'لا توجد ملفات للتصدير'}), 404
+    
+    user_id = current_user.id
+    
+    def load_batch(batch_ids):
+        rows = Transcript.query.filter(Transcript.user_id == user_id, Transcript.id.in_(batch_ids)).all()
+        data = {}
+        for t in rows:
+            data[t.id] = t.to_dict()
+            db.session.expunge(t)  # keep the identity map from growing with the export
+        return data
+    
+    filename = f"transcripts-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{fmt}.zip"
+    return Response(
+        stream_with_context(exporter.stream_zip(entries, fmt, load_batch)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'}
+    )
 
 @app.route('/api/transcript', methods=['POST'])
 @login_required
 def get_transcript():
     try:
-        print("=== Received transcript request ===")
         data = request.get_json()
-        print(f"Request data: {data}")
+        log.debug("Transcript request data: %s", logs.payload(data))
         
         url = data.get('url') if data else None
         
         if not url:
-            print("ERROR: No URL provided")
             return jsonify({'error': 'URL is required'}), 400
         
-        # Validate YouTube URL
-        import re
-        youtube_regex = r'(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+'
-        if not re.match(youtube_regex, url):
-            print("ERROR: Invalid YouTube URL")
-            return jsonify({'error': 'رابط يوتيوب غير صحيح'}), 400
-        
-        print(f"Video URL: {url}")
-        print(f"Sending to n8n: {N8N_WEBHOOK_URL}")
-        
-        # Send to n8n webhook (using GET as n8n expects)
-        response = requests.get(
-            N8N_WEBHOOK_URL,
-            params={'url': url},
-            timeout=300  # 5 minutes timeout
-        )
-        
-        print(f"n8n Response Status: {response.status_code}")
-        print(f"n8n Response Headers: {dict(response.headers)}")
-        print(f"n8n Response Body: {response.text}")
-        
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                print(f"Parsed JSON: {data}")
-                
-                # Check if it's just a workflow started message
-                if isinstance(data, dict) and data.get('message') == 'Workflow was started':
-                    print("WARNING: n8n returned 'Workflow was started' - webhook might be async")
-                    return jsonify({
-                        'error': 'n8n workflow بدأ لكن لم يرجع البيانات. تأكد من إعدادات Respond to Webhook في n8n'
-                    }), 500
-                
-                # Handle array response from n8n
-                if isinstance(data, list) and len(data) > 0:
-                    data = data[0]
-                
-                # Save to database
-                transcript = Transcript(
-                    user_id=current_user.id,
-                    video_url=url,
-                    video_title=data.get('videoTitle') or data.get('output', {}).get('subject'),
-                    introduction=data.get('introduction') or data.get('output', {}).get('introduction'),
-                    summary=data.get('summary'),
-                    main_points=data.get('mainPoints'),
-                    full_content=data.get('fullContent') or data.get('fullcontent')
-                )
-                db.session.add(transcript)
-                db.session.commit()
-                print(f"Saved transcript ID: {transcript.id}")
-                print(f"Video Title: {transcript.video_title}")
-                print(f"Has Introduction: {bool(transcript.introduction)}")
-                print(f"Has Summary: {bool(transcript.summary)}")
-                print(f"Has Main Points: {bool(transcript.main_points)}")
-                
-                return jsonify(data)
-            except Exception as json_error:
-                print(f"JSON Parse Error: {json_error}")
-                return jsonify({'fullContent': response.text})
-        else:
-            print(f"ERROR: n8n returned {response.status_code}")
-            return jsonify({
-                'error': f'n8n returned status {response.status_code}',
-                'details': response.text[:500]
-            }), response.status_code
-            
-    except requests.exceptions.Timeout:
-        print("ERROR: Request timeout")
-        return jsonify({'error': 'Request timeout - video processing takes too long'}), 504
+        log.info("Transcript request for %s", url)
+        result, transcript = process_transcript(current_user.id, url, refresh=bool(data.get('refresh')))
+        if transcript:
+            log.info("Transcript %s ready: %s", transcript.id, transcript.video_title)
+            # My Files is usually opened next; read it from the primary until the replica has the row
+            database.mark_written()
+        return jsonify(result)
+    
+    except TranscriptError as e:
+        response = jsonify(e.to_dict())
+        if e.retry_after:
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.status_code
     except Exception as e:
-        print(f"ERROR: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        db.session.rollback()
+        log.exception("Transcript request failed")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    data = request.get_json(silent=True) or {}
+    url = data.get('url')
+    
+    if not url:
+        return jsonify({'error': 'URL is required'}), 400
+    if not is_youtube_url(url):
+        return jsonify({'error': 'رابط يوتيوب غير صحيح'}), 400
+    
+    try:
+        job = jobs.submit(current_user.id, url, refresh=bool(data.get('refresh')))
+    except jobs.QueueFullError:
+        response = jsonify({'error': 'الخادم مشغول حالياً، يرجى المحاولة بعد قليل'})
+        response.headers['Retry-After'] = '30'
+        return response, 429
+    
+    result = job.to_dict(include_result=False)
+    result['poll_url'] = url_for('get_job', job_id=job.id)
+    result['stream_url'] = url_for('stream_job', job_id=job.id)
+    return jsonify(result), 202
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+@limiter.exempt
+def get_job(job_id):
+    job = jobs.get_job(job_id, current_user.id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status == 'done':
+        database.mark_written()
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/stream')
+@login_required
+@limiter.exempt
+def stream_job(job_id):
+    return Response(
+        stream_with_context(jobs.stream_events(job_id, current_user.id)),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+@app.route('/api/batches', methods=['POST'])
+@login_required
+def submit_batch():
+    data = request.get_json(silent=True) or {}
+    urls_value = data.get('urls') or []
+    playlist_url = data.get('playlist_url')
+    if not isinstance(urls_value, list) or not all(isinstance(u, str) for u in urls_value):
+        return jsonify({'error': 'urls must be a list of URL strings'}), 400
+    if playlist_url is not None and not isinstance(playlist_url, str):
+        return jsonify({'error': 'playlist_url must be a string'}), 400
+    sources = urls_value + ([playlist_url] if playlist_url else [])
+    if not sources:
+        return jsonify({'error': 'urls or playlist_url is required'}), 400
+    
+    urls = []
+    source_url = None
+    for source in sources:
+        source = source.strip()
+        if playlists.is_playlist_url(source):
+            try:
+                expanded = playlists.resolve(source)
+            except playlists.PlaylistTooLongError:
+                return jsonify({
+                    'error': f'قائمة التشغيل تحتوي على أكثر من {playlists.BATCH_MAX_ITEMS} فيديو',
+                    'url': source
+                }), 400
+            except playlists.PlaylistError as e:
+                return jsonify({'error': 'تعذر قراءة قائمة التشغيل', 'details': str(e), 'url': source}), 502
+            source_url = source_url or source
+        elif is_youtube_url(source):
+            expanded = [source]
+        else:
+            return jsonify({'error': 'رابط يوتيوب غير صحيح', 'url': source}), 400
+        urls += [u for u in expanded if u not in urls]
+    
+    if not urls:
+        return jsonify({'error': 'قائمة التشغيل فارغة'}), 400
+    if len(urls) > playlists.BATCH_MAX_ITEMS:
+        return jsonify({'error': f'الحد الأقصى {playlists.BATCH_MAX_ITEMS} فيديو في الدفعة الواحدة'}), 400
+    
+    try:
+        batch = jobs.submit_batch(current_user.id, urls, source_url=source_url, refresh=bool(data.get('refresh')))
+    except jobs.BatchLimitError:
+        response = jsonify({'error': 'لديك عدد كبير من الفيديوهات قيد المعالجة، يرجى الانتظار حتى ينتهي بعضها'})
+        response.headers['Retry-After'] = '60'
+        return response, 429
+    
+    result = batch.to_dict()
+    result['poll_url'] = url_for('get_batch', batch_id=batch.id)
+    result['stream_url'] = url_for('stream_batch', batch_id=batch.id)
+    return jsonify(result), 202
+
+@app.route('/api/batches/<batch_id>')
+@login_required
+@limiter.exempt
+def get_batch(batch_id):
+    batch = jobs.get_batch(batch_id, current_user.id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(batch.to_dict())
+
+@app.route('/api/batches/<batch_id>/stream')
+@login_required
+@limiter.exempt
+def stream_batch(batch_id):
+    return Response(
+        stream_with_context(jobs.stream_batch_events(batch_id, current_user.id)),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+@app.route('/api/cache/stats')
+@login_required
+def cache_stats():
+    result = transcript_cache.stats()
+    result['singleflight'] = singleflight.stats()
+    result['transcript_lru'] = http_cache.transcripts.stats()
+    result['identity'] = identity.stats()
+    return jsonify(result)
+
+@app.route('/api/upstream/stats')
+@login_required
+def upstream_stats():
+    result = upstream.client.stats()
+    result['admission'] = admission.stats()
+    return jsonify(result)
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    if not METRICS_TOKEN:
+        # Without a token only a scraper on the same host may read it
+        if request.remote_addr not in ('127.0.0.1', '::1'):
+            return jsonify({'error': 'Forbidden'}), 403
+    elif not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
-        print("=== Received chat request ===")
         data = request.get_json()
-        print(f"Chat data: {data}")
+        log.debug("Chat request data: %s", logs.payload(data))
         
         message = data.get('message')
         session_id = data.get('sessionId')
+        transcript_id = data.get('transcriptId')
+        # Stream tokens over SSE when the client asks for it, otherwise buffer
+        wants_stream = bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
         
         if not message:
-            print("ERROR: No message provided")
             return jsonify({'error': 'Message is required'}), 400
         
-        print(f"Message: {message}")
-        print(f"Session ID: {session_id}")
-        print(f"Sending to n8n: {N8N_CHAT_WEBHOOK_URL}")
+        log.info("Chat message for session %s: %s", session_id, logs.payload(message))
         
         # Send to n8n chat webhook
+        session_id = session_id or f'session-{int(time.time())}'
         payload = {
             'chatInput': message,
-            'sessionId': session_id or f'session-{int(time.time())}'
+            'sessionId': session_id
         }
         
-        response = requests.post(
+        # Ground the turn in a saved transcript: send only its most relevant passages
+        if transcript_id:
+            if not current_user.is_authenticated:
+                return jsonify({'error': 'Login required'}), 401
+            transcript = db.session.query(Transcript.id, Transcript.video_title).filter_by(
+                id=transcript_id, user_id=current_user.id
+            ).first()
+            if transcript is None:
+                return jsonify({'error': 'Transcript not found'}), 404
+            passages = retrieval.select_context(transcript.id, message)
+            payload['transcriptId'] = transcript.id
+            payload['videoTitle'] = transcript.video_title
+            payload['context'] = '\n\n'.join(p['content'] for p in passages)
+            log.info("Chat grounded in transcript %s with %s passages", transcript.id, len(passages))
+        
+        # Don't hold a pooled DB connection while n8n answers (or streams)
+        db.session.rollback()
+        response = upstream.client.post(
             N8N_CHAT_WEBHOOK_URL,
+            read_timeout=N8N_CHAT_TIMEOUT,
             json=payload,
             headers={'Content-Type': 'application/json'},
-            timeout=60
+            stream=wants_stream
         )
         
-        print(f"Chat Response Status: {response.status_code}")
-        print(f"Chat Response: {response.text[:500]}")
+        log.info("Chat webhook returned %s", response.status_code)
         
         if response.status_code == 200:
-            result = response.json()
-            # Handle array response
-            if isinstance(result, list) and len(result) > 0:
-                result = result[0]
-            return jsonify(result)
+            if wants_stream:
+                return Response(
+                    stream_with_context(chat_stream.relay(response, session_id)),
+                    mimetype='text/event-stream',
+                    headers=SSE_HEADERS
+                )
+            return jsonify(chat_stream.collect(response))
         else:
-            print(f"ERROR: Chat webhook returned {response.status_code}")
             return jsonify({
                 'error': f'Chat webhook returned status {response.status_code}',
                 'details': response.text[:200]
             }), response.status_code
             
+    except upstream.CircuitOpenError as e:
+        response = jsonify({'error': 'خدمة الشات غير متاحة حالياً، يرجى المحاولة لاحقاً'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    except requests.exceptions.Timeout:
+        log.warning("Chat request timeout")
+        return jsonify({'error': 'Chat request timeout'}), 504
     except Exception as e:
-        print(f"Chat Error: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Chat request failed")
         return jsonify({'error': str(e)}), 500
 
 # Password Reset Routes
@@ -431,7 +760,7 @@ def forgot_password():
                 db.session.commit()
             except Exception as token_error:
                 db.session.rollback()
-                print(f"Error setting reset token: {token_error}")
+                log.error("Error setting reset token: %s", token_error)
                 return jsonify({'error': 'حدث خطأ، يرجى المحاولة مرة أخرى'}), 500
             
             # In production, send email here
@@ -440,7 +769,7 @@ def forgot_password():
             # TODO: Send email with reset_link
             # For development only - log the link
             if os.environ.get('FLASK_ENV') != 'production':
-                logging.info(f"Password reset link for {email}: {reset_link}")
+                security_log.info(f"Password reset link for {email}: {reset_link}")
             
             return jsonify({
                 'success': True,
@@ -453,8 +782,8 @@ def forgot_password():
                 'message': 'إذا كان البريد الإلكتروني موجوداً، سيتم إرسال رابط إعادة التعيين'
             })
             
-    except Exception as e:
-        print(f"Forgot password error: {str(e)}")
+    except Exception:
+        log.exception("Forgot password error")
         return jsonify({'error': 'حدث خطأ، يرجى المحاولة مرة أخرى'}), 500
 
 @app.route('/reset-password/<token>', methods=['GET', 'POST'])
@@ -463,7 +792,7 @@ def reset_password(token):
     try:
         user = User.query.filter_by(reset_token=token).first()
     except Exception as e:
-        print(f"Error querying reset token: {e}")
+        log.error("Error querying reset token: %s", e)
         return render_template('reset_password.html', error='حدث خطأ، يرجى المحاولة مرة أخرى', token=token)
     
     if not user:
@@ -473,7 +802,7 @@ def reset_password(token):
         if not user.reset_token_expiry or user.reset_token_expiry < datetime.utcnow():
             return render_template('reset_password.html', error='رابط إعادة التعيين منتهي الصلاحية', token=token)
     except Exception as e:
-        print(f"Error checking token expiry: {e}")
+        log.error("Error checking token expiry: %s", e)
         return render_template('reset_password.html', error='حدث خطأ، يرجى المحاولة مرة أخرى', token=token)
     
     if request.method == 'POST':
@@ -496,15 +825,19 @@ def reset_password(token):
             return render_template('login.html', success='تم تغيير كلمة المرور بنجاح! يمكنك الآن تسجيل الدخول')
         except Exception as e:
             db.session.rollback()
-            print(f"Error resetting password: {e}")
+            log.error("Error resetting password: %s", e)
             return render_template('reset_password.html', error='حدث خطأ، يرجى المحاولة مرة أخرى', token=token)
     
     return render_template('reset_password.html', token=token)
 
+# Import-to-ready time of this worker, the cold-start cost before it can serve
+STARTUP_SECONDS = time.perf_counter() - _import_started
+metrics.register_collector('startup', 'Worker import-to-ready time in seconds', lambda: {'seconds': STARTUP_SECONDS})
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
-        print("Database tables created successfully!")
+        migrations.upgrade()
+        print("Database schema is up to date!")
     
     # استخدام PORT من البيئة (مطلوب لـ Render)
     port = int(os.environ.get('PORT', 5000))
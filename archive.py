@@ -0,0 +1,181 @@
+"""Streaming NDJSON archive of a user's transcripts, for moving and backups.
+
+An archive is one JSON object per line: a header naming the format, then
+one transcript per line in the to_dict shape without the instance-local id.
+
+    GET  /api/archive                         download the user's archive
+    POST /api/archive                         import one (application/x-ndjson body)
+    flask --app app transcripts-export EMAIL  > archive.ndjson
+    flask --app app transcripts-import EMAIL archive.ndjson
+
+Export reads rows through a server-side cursor (yield_per) and yields each
+line as it is encoded; import reads the body line by line and inserts in
+transactions of ARCHIVE_BATCH_SIZE rows. Neither holds more than one batch,
+so memory stays flat however large the archive is. Videos the user already
+has, or that appear earlier in the archive, are skipped by video ID.
+"""
+import json
+import os
+from datetime import datetime
+
+from models import db, Transcript
+from transcript_service import is_youtube_url
+import transcript_cache
+
+ARCHIVE_FORMAT = 'youtubetotext-archive'
+ARCHIVE_VERSION = 1
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 200))
+MAX_ERROR_SAMPLES = 20
+
+# API field -> column, everything but the id
+FIELDS = {name: column for name, column in Transcript.API_FIELDS.items() if name != 'id'}
+TEXT_LIMITS = {'video_url': 500, 'videoTitle': 500}
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _line(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def export_lines(user_id):
+    """Yield the user's archive as encoded NDJSON lines, oldest first"""
+    yield _line({
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'exported_at': datetime.utcnow().strftime(DATE_FORMAT)
+    })
+    # Plain rows, not entities: nothing accumulates in the session's identity map
+    rows = db.session.query(*[getattr(Transcript, column) for column in FIELDS.values()]).filter(
+        Transcript.user_id == user_id
+    ).order_by(Transcript.id).yield_per(ARCHIVE_BATCH_SIZE)
+    for row in rows:
+        record = dict(zip(FIELDS, row))
+        if record['created_at'] is not None:
+            record['created_at'] = record['created_at'].strftime(DATE_FORMAT)
+        yield _line(record)
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.error_samples = []
+
+    def error(self, line_number, message):
+        self.errors += 1
+        if len(self.error_samples) < MAX_ERROR_SAMPLES:
+            self.error_samples.append({'line': line_number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+            'error_samples': self.error_samples
+        }
+
+
+def _parse(line):
+    """A Transcript column dict from one archive line; ValueError if unusable"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise ValueError('not valid JSON')
+    if not isinstance(record, dict):
+        raise ValueError('not a JSON object')
+
+    url = record.get('video_url')
+    if not isinstance(url, str) or not is_youtube_url(url):
+        raise ValueError('video_url is not a YouTube URL')
+    video_id = transcript_cache.extract_video_id(url)
+    if not video_id:
+        raise ValueError('video_url has no video ID')
+
+    values = {'video_id': video_id}
+    for name, column in FIELDS.items():
+        value = record.get(name)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f'{name} must be a string')
+        if value and name in TEXT_LIMITS and len(value) > TEXT_LIMITS[name]:
+            raise ValueError(f'{name} is longer than {TEXT_LIMITS[name]} characters')
+        values[column] = value
+    try:
+        values['created_at'] = datetime.strptime(values['created_at'], DATE_FORMAT) if values['created_at'] else None
+    except ValueError:
+        raise ValueError(f'created_at must look like {DATE_FORMAT}')
+    if values['created_at'] is None:
+        del values['created_at']  # the column default, i.e. now
+    return values
+
+
+def _insert_batch(user_id, batch, result):
+    existing = {
+        video_id for (video_id,) in db.session.query(Transcript.video_id).filter(
+            Transcript.user_id == user_id,
+            Transcript.video_id.in_({values['video_id'] for values in batch})
+        )
+    }
+    for values in batch:
+        if values['video_id'] in existing:
+            result.duplicates += 1
+            continue
+        existing.add(values['video_id'])
+        db.session.add(Transcript(user_id=user_id, **values))
+        result.imported += 1
+    db.session.commit()
+    # The inserted rows are not needed again; keep the identity map at one batch
+    db.session.expunge_all()
+
+
+def import_lines(user_id, lines):
+    """Import an archive from an iterable of lines (bytes or str)"""
+    result = ImportResult()
+    batch = []
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if not line.strip():
+            continue
+        if line_number == 1 and '"format"' in line:
+            try:
+                header = json.loads(line)
+            except ValueError:
+                header = None
+            if isinstance(header, dict) and header.get('format') == ARCHIVE_FORMAT:
+                if header.get('version') != ARCHIVE_VERSION:
+                    raise ValueError(f"Unsupported archive version {header.get('version')}")
+                continue
+        try:
+            batch.append(_parse(line))
+        except ValueError as e:
+            result.error(line_number, str(e))
+            continue
+        if len(batch) >= ARCHIVE_BATCH_SIZE:
+            _insert_batch(user_id, batch, result)
+            batch = []
+    if batch:
+        _insert_batch(user_id, batch, result)
+    return result
+
+
+def backfill_video_ids(batch_size=500):
+    """Fill Transcript.video_id for rows saved before it existed; returns rows updated"""
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.query(Transcript.id, Transcript.video_url).filter(
+            Transcript.id > last_id, Transcript.video_id.is_(None)
+        ).order_by(Transcript.id).limit(batch_size).all()
+        if not rows:
+            return updated
+        values = [
+            {'id': row.id, 'video_id': transcript_cache.extract_video_id(row.video_url)}
+            for row in rows
+        ]
+        values = [v for v in values if v['video_id']]
+        if values:
+            db.session.execute(db.update(Transcript), values)
+        db.session.commit()
+        updated += len(values)
+        last_id = rows[-1].id
@@ -0,0 +1,185 @@
+"""Fingerprinted, precompressed static bundle with long-lived caching.
+
+Build once per deploy, before starting gunicorn (the Dockerfile and
+render.yaml do this):
+
+    python assets.py
+
+The build compiles static_src/app.css with the Tailwind CLI (TAILWIND_BIN),
+purged against the live templates and minified. It copies the page scripts
+in JS_ENTRIES, minified when rjsmin is installed. Every output is written to
+static/dist under a content-hashed name with .gz and .br siblings, and
+static/dist/manifest.json maps each logical name to its file.
+
+Templates reference assets through asset_url('js/chat-stream.js') and
+asset_built('app.css'). Files under /static/dist/ are served with
+`Cache-Control: immutable` for a year, from the precompressed sibling the
+client accepts. Before the first build, asset_url falls back to the source
+file and the templates fall back to the Tailwind CDN, so a fresh checkout
+still renders.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import wraps
+
+from flask import abort, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+import compression
+
+try:
+    import brotli
+except ImportError:  # .br variants are optional; gzip is always written
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # scripts ship unminified, still hashed and compressed
+    rjsmin = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, 'static_src')
+STATIC_DIR = os.path.join(ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+TAILWIND_BIN = os.environ.get('TAILWIND_BIN', 'tailwindcss')
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Scripts the templates load; anything else in static/js stays out of the bundle
+JS_ENTRIES = ('js/chat-stream.js', 'js/pdf-export-new.js')
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+log = logging.getLogger(__name__)
+
+_manifest = {}
+
+
+# Build
+
+def _write_variants(path, body):
+    with open(path, 'wb') as f:
+        f.write(body)
+    # mtime=0 keeps the .gz byte-identical across builds of the same input
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(body, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(body, quality=11))
+
+
+def _emit(logical_name, body):
+    """Write body under a content-hashed name; returns that name"""
+    stem, ext = os.path.splitext(os.path.basename(logical_name))
+    hashed = f'{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}'
+    _write_variants(os.path.join(DIST_DIR, hashed), body)
+    return hashed
+
+
+def _tailwind_css(tailwind_bin):
+    """The compiled, purged and minified stylesheet, or None without the CLI"""
+    if shutil.which(tailwind_bin) is None:
+        log.warning("Tailwind CLI %r not found; pages keep using the Tailwind CDN", tailwind_bin)
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'app.css')
+        subprocess.run([
+            tailwind_bin,
+            '--config', os.path.join(SOURCE_DIR, 'tailwind.config.js'),
+            '--input', os.path.join(SOURCE_DIR, 'app.css'),
+            '--output', output,
+            '--minify'
+        ], cwd=ROOT, check=True)
+        with open(output, 'rb') as f:
+            return f.read()
+
+
+def build(tailwind_bin=TAILWIND_BIN):
+    """Rebuild static/dist from scratch; returns the manifest"""
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    css = _tailwind_css(tailwind_bin)
+    if css is not None:
+        manifest['app.css'] = _emit('app.css', css)
+    for name in JS_ENTRIES:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            body = f.read()
+        if rjsmin is not None:
+            body = rjsmin.jsmin(body)
+        manifest[name] = _emit(name, body)
+
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+# Serving
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_built(name):
+    return name in _manifest
+
+
+def asset_url(name):
+    """URL of the fingerprinted build of a static asset, or of its source before a build"""
+    hashed = _manifest.get(name)
+    if hashed is None:
+        return url_for('static', filename=name)
+    return url_for('static', filename=f'dist/{hashed}')
+
+
+def _send_dist(name):
+    path = safe_join(DIST_DIR, name)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    available = [encoding for encoding, suffix in PRECOMPRESSED if os.path.isfile(path + suffix)]
+    encoding = compression.choose_encoding(request.headers.get('Accept-Encoding'), available)
+    served = name + dict(PRECOMPRESSED)[encoding] if encoding else name
+
+    response = send_from_directory(
+        DIST_DIR, served, mimetype=mimetypes.guess_type(name)[0], max_age=ASSET_MAX_AGE
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # The name changes whenever the content does, so browsers never need to revalidate
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    return response
+
+
+def init_app(app):
+    global _manifest
+    _manifest = _load_manifest()
+    app.jinja_env.globals.update(asset_url=asset_url, asset_built=asset_built)
+
+    static_view = app.view_functions['static']
+
+    @wraps(static_view)
+    def static_with_dist(filename):
+        if filename.startswith('dist/') and filename != 'dist/manifest.json':
+            return _send_dist(filename[len('dist/'):])
+        return static_view(filename)
+
+    app.view_functions['static'] = static_with_dist
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    for logical, hashed in sorted(build().items()):
+        print(f"{logical} -> dist/{hashed}")
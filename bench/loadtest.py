@@ -0,0 +1,272 @@
+"""Closed-loop load test for the main routes, with saved baselines.
+
+Start the stub and the app, seed the database, then drive it:
+
+    python bench/stub_n8n.py --latency 0.5 &
+    export DATABASE_URL=sqlite:///bench.db RATELIMIT_ENABLED=false
+    export N8N_WEBHOOK_URL=http://127.0.0.1:5678/webhook/youtube_text
+    export N8N_CHAT_WEBHOOK_URL=http://127.0.0.1:5678/webhook/chat
+    python bench/seed.py --users 10 --transcripts 100
+    gunicorn app:app &
+    python bench/loadtest.py --concurrency 16 --duration 60 --save-baseline
+
+Each of --concurrency threads logs in as one of the seeded users and loops
+over the scenario mix until --duration runs out. Latency percentiles and
+throughput are reported per scenario; with a baseline present the run
+fails (exit 1) when p95 or throughput regress by more than --tolerance.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.seed import BENCH_PASSWORD, EMAIL_TEMPLATE  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+SCENARIOS = ('login', 'transcript', 'chat', 'my_files', 'transcript_read')
+REQUEST_TIMEOUT = 330
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {name: [] for name in SCENARIOS}
+        self.errors = {name: 0 for name in SCENARIOS}
+        self.statuses = {name: {} for name in SCENARIOS}
+
+    def record(self, scenario, seconds, status):
+        with self.lock:
+            self.samples[scenario].append(seconds)
+            self.statuses[scenario][str(status)] = self.statuses[scenario].get(str(status), 0) + 1
+            # A redirect is the login page answering for a lost session
+            if not isinstance(status, int) or status >= 300:
+                self.errors[scenario] += 1
+
+    def summary(self, elapsed):
+        result = {}
+        with self.lock:
+            for name, samples in self.samples.items():
+                if not samples:
+                    continue
+                ordered = sorted(samples)
+                result[name] = {
+                    'requests': len(ordered),
+                    'errors': self.errors[name],
+                    'error_rate': round(self.errors[name] / len(ordered), 4),
+                    'rps': round(len(ordered) / elapsed, 2),
+                    'p50_ms': round(percentile(ordered, 0.50) * 1000, 1),
+                    'p95_ms': round(percentile(ordered, 0.95) * 1000, 1),
+                    'p99_ms': round(percentile(ordered, 0.99) * 1000, 1),
+                    'max_ms': round(ordered[-1] * 1000, 1),
+                    'statuses': dict(self.statuses[name])
+                }
+        return result
+
+
+class VirtualUser:
+    def __init__(self, args, index, recorder):
+        self.args = args
+        self.base = args.base_url.rstrip('/')
+        self.email = EMAIL_TEMPLATE.format(index % args.users)
+        self.recorder = recorder
+        self.session = None
+        self.transcript_ids = []
+        self.rng = random.Random(index)
+
+    def _timed(self, scenario, method, path, session=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = (session or self.session).request(
+                method, self.base + path, timeout=REQUEST_TIMEOUT, allow_redirects=False, **kwargs
+            )
+            response.content  # include the body transfer in the timing
+            status = response.status_code
+        except requests.RequestException as e:
+            response, status = None, type(e).__name__
+        self.recorder.record(scenario, time.perf_counter() - started, status)
+        return response
+
+    def _login(self, session, scenario='login'):
+        return self._timed(
+            scenario, 'POST', '/login', session=session,
+            json={'email': self.email, 'password': BENCH_PASSWORD}
+        )
+
+    def setup(self):
+        self.session = requests.Session()
+        response = self._login(self.session)
+        if response is None or response.status_code != 200:
+            raise RuntimeError(f'Login failed for {self.email}; run bench/seed.py first')
+        listing = self.session.get(
+            self.base + '/api/my-transcripts', params={'fields': 'id', 'limit': 100}, timeout=REQUEST_TIMEOUT
+        )
+        if listing.ok:
+            self.transcript_ids = [row['id'] for row in listing.json()]
+
+    def run_scenario(self, name):
+        if name == 'login':
+            # A fresh session each time, so the full login cost is measured
+            with requests.Session() as session:
+                self._login(session)
+        elif name == 'transcript':
+            if self.args.unique_videos:
+                video = f'u{self.rng.getrandbits(40):010x}'
+            else:
+                video = f'pool{self.rng.randrange(self.args.video_pool):07d}'
+            self._timed('transcript', 'POST', '/api/transcript',
+                        json={'url': f'https://www.youtube.com/watch?v={video}'})
+        elif name == 'chat':
+            self._timed('chat', 'POST', '/api/chat',
+                        json={'message': 'ما هي النقاط الرئيسية؟', 'sessionId': f'bench-{self.email}'})
+        elif name == 'my_files':
+            self._timed('my_files', 'GET', '/my-files')
+        elif name == 'transcript_read' and self.transcript_ids:
+            transcript_id = self.rng.choice(self.transcript_ids)
+            self._timed('transcript_read', 'GET', f'/api/transcript/{transcript_id}')
+
+
+def parse_mix(value):
+    """"transcript=1,my_files=4" -> weighted scenario list"""
+    weights = {}
+    for part in filter(None, (p.strip() for p in value.split(','))):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'unknown scenario {name}; choose from {", ".join(SCENARIOS)}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def run(args):
+    recorder = Recorder()
+    users = [VirtualUser(args, i, recorder) for i in range(args.concurrency)]
+    for user in users:
+        user.setup()
+    # Setup logins are not part of the measured window
+    recorder = Recorder()
+    for user in users:
+        user.recorder = recorder
+
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    deadline = time.monotonic() + args.duration
+
+    def loop(user):
+        while time.monotonic() < deadline:
+            user.run_scenario(user.rng.choices(names, weights)[0])
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=loop, args=(user,), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.monotonic() - started)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions against a saved baseline"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['rps']} req/s vs baseline {base['rps']} req/s")
+        if current['error_rate'] > base['error_rate'] + 0.01:
+            regressions.append(f"{name}: error rate {current['error_rate']} vs baseline {base['error_rate']}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scenario':<16}{'reqs':>8}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in SCENARIOS:
+        row = results.get(name)
+        if row:
+            print(f"{name:<16}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9}"
+                  f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the app against seeded data')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=10, help='seeded users to log in as')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(','.join(SCENARIOS)),
+                        help='weighted scenarios, e.g. transcript=1,my_files=4,transcript_read=4')
+    parser.add_argument('--video-pool', type=int, default=50, help='distinct videos for /api/transcript')
+    parser.add_argument('--unique-videos', action='store_true', help='never repeat a video (cold cache)')
+    parser.add_argument('--name', default='default', help='baseline name under bench/baselines')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--output', help='also write this run to a JSON file')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_table(results)
+    report = {
+        'name': args.name,
+        'recorded_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'revision': git_revision(),
+        'params': {
+            'concurrency': args.concurrency, 'duration': args.duration, 'users': args.users,
+            'mix': args.mix, 'video_pool': args.video_pool, 'unique_videos': args.unique_videos
+        },
+        'scenarios': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = os.path.join(BASELINE_DIR, f'{args.name}.json')
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline {baseline_path}")
+        return 0
+
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != report['params']:
+            print(f"Note: baseline {args.name} was recorded with different parameters")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('Regressions against baseline ' + str(baseline.get('revision')) + ':')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print(f"No regressions against baseline {baseline.get('revision')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
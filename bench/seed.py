@@ -0,0 +1,75 @@
+"""Seed the configured database with benchmark users and transcripts.
+
+    DATABASE_URL=sqlite:///bench.db python bench/seed.py --users 20 --transcripts 200
+
+Creates bench-user-<i>@example.com (password BENCH_PASSWORD) with M
+transcripts each, skipping users that already exist, so it is safe to rerun.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.stub_n8n import make_transcript  # noqa: E402
+
+BENCH_PASSWORD = 'Bench@Passw0rd'
+EMAIL_TEMPLATE = 'bench-user-{}@example.com'
+INSERT_BATCH = 500
+
+
+def seed(users, transcripts, payload_kb):
+    from app import app
+    from models import db, User, Transcript
+    import migrations
+
+    created = 0
+    started = time.monotonic()
+    with app.app_context():
+        migrations.upgrade()
+        for i in range(users):
+            email = EMAIL_TEMPLATE.format(i)
+            if User.query.filter_by(email=email).first():
+                continue
+            user = User(username=f'bench-user-{i}', email=email)
+            user.set_password(BENCH_PASSWORD)
+            db.session.add(user)
+            db.session.flush()
+
+            now = datetime.utcnow()
+            for j in range(transcripts):
+                video_id = f'bench{i:03d}{j:03d}'
+                url = f'https://www.youtube.com/watch?v={video_id}'
+                data = make_transcript(url, payload_kb * 1024)
+                db.session.add(Transcript(
+                    user_id=user.id,
+                    video_url=url,
+                    video_id=video_id,
+                    video_title=data['videoTitle'],
+                    introduction=data['introduction'],
+                    summary=data['summary'],
+                    main_points=data['mainPoints'],
+                    full_content=data['fullContent'],
+                    created_at=now - timedelta(minutes=random.randint(0, 60 * 24 * 90))
+                ))
+                if (j + 1) % INSERT_BATCH == 0:
+                    db.session.commit()
+            db.session.commit()
+            created += 1
+    print(f"Seeded {created} users x {transcripts} transcripts in {time.monotonic() - started:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed benchmark users and transcripts')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transcripts', type=int, default=100, help='transcripts per user')
+    parser.add_argument('--payload-kb', type=int, default=20, help='size of each fullContent in KiB')
+    args = parser.parse_args(argv)
+    seed(args.users, args.transcripts, args.payload_kb)
+
+
+if __name__ == '__main__':
+    main()
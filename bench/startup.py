@@ -0,0 +1,79 @@
+"""Measure a worker's time-to-first-request.
+
+Each run starts a fresh interpreter that imports the app and serves one
+GET /login through the test client, which is what a gunicorn worker does
+after fork before its health check passes:
+
+    export DATABASE_URL=sqlite:////tmp/bench.db
+    python bench/startup.py --runs 10
+    python bench/startup.py --runs 10 --ref HEAD~1
+
+--ref also times that git revision (checked out in a temporary worktree)
+against the same database, to show the gain or loss of a change. Use an
+absolute SQLite path so both checkouts open the same file.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/login')
+assert response.status_code == 200, response.status_code
+print(imported - started, time.perf_counter() - started)
+"""
+
+
+def measure(source_dir, runs):
+    imports, firsts = [], []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=source_dir, text=True)
+        imported, first = map(float, output.strip().splitlines()[-1].split())
+        imports.append(imported)
+        firsts.append(first)
+    return imports, firsts
+
+
+def report(label, imports, firsts):
+    print(f"{label:<12} import median {statistics.median(imports) * 1000:8.1f} ms   "
+          f"first request median {statistics.median(firsts) * 1000:8.1f} ms   "
+          f"min {min(firsts) * 1000:8.1f} ms")
+    return statistics.median(firsts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time worker import and first request')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--ref', help='git revision to compare against')
+    args = parser.parse_args(argv)
+
+    if not os.environ.get('DATABASE_URL'):
+        parser.error('set DATABASE_URL to a migrated database so both runs use the same one')
+
+    current = report('working tree', *measure(ROOT, args.runs))
+    if not args.ref:
+        return
+
+    worktree = tempfile.mkdtemp(prefix='startup-bench-')
+    try:
+        subprocess.check_call(['git', 'worktree', 'add', '--detach', worktree, args.ref], cwd=ROOT,
+                              stdout=subprocess.DEVNULL)
+        previous = report(args.ref, *measure(worktree, args.runs))
+        print(f"Time to first request changed by {(current - previous) * 1000:+.1f} ms "
+              f"({(current / previous - 1) * 100:+.0f}%)")
+    finally:
+        subprocess.call(['git', 'worktree', 'remove', '--force', worktree], cwd=ROOT)
+        shutil.rmtree(worktree, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
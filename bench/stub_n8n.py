@@ -0,0 +1,174 @@
+"""Local stand-in for the n8n transcript and chat webhooks.
+
+Serves the same shapes the app parses, with tunable latency, payload size
+and error rate, so load tests never touch the real n8n instance:
+
+    python bench/stub_n8n.py --port 5678 --latency 0.5 --jitter 0.2 \
+        --payload-kb 40 --error-rate 0.02 --shape mixed
+
+then run the app with
+    N8N_WEBHOOK_URL=http://127.0.0.1:5678/webhook/youtube_text
+    N8N_CHAT_WEBHOOK_URL=http://127.0.0.1:5678/webhook/chat
+
+GET  /webhook/youtube_text?url=...   transcript (object or [object])
+POST /webhook/chat                   {"output": ...}, or NDJSON items with --chat-stream
+GET  /stats                          requests served, errors injected
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = ('النص', 'الفيديو', 'ملخص', 'نقطة', 'المحتوى', 'transcript', 'video', 'summary', 'point', 'content')
+
+
+def make_text(size, seed):
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word.encode('utf-8')) + 1
+    return ' '.join(words)
+
+
+def make_transcript(url, payload_bytes):
+    seed = url or 'video'
+    return {
+        'videoTitle': f'Stub video {zlib.crc32(seed.encode()) % 100000}',
+        'introduction': make_text(200, seed + 'intro'),
+        'summary': make_text(600, seed + 'summary'),
+        'mainPoints': '\n'.join(f'{i + 1}. ' + make_text(80, f'{seed}point{i}') for i in range(5)),
+        'fullContent': make_text(payload_bytes, seed)
+    }
+
+
+class StubState:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.counts = {'transcript': 0, 'chat': 0, 'errors': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def delay(self):
+        latency = self.args.latency + random.uniform(-self.args.jitter, self.args.jitter)
+        time.sleep(max(0.0, latency))
+
+    def should_fail(self):
+        if random.random() < self.args.error_rate:
+            self.count('errors')
+            return True
+        return False
+
+
+def make_handler(state):
+    args = state.args
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *values):
+            if args.verbose:
+                super().log_message(format, *values)
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path == '/stats':
+                with state.lock:
+                    return self._send_json(200, dict(state.counts))
+            if parsed.path != args.transcript_path:
+                return self._send_json(404, {'message': 'not found'})
+
+            state.count('transcript')
+            state.delay()
+            if state.should_fail():
+                return self._send_json(args.error_status, {'message': 'stub error'})
+
+            url = parse_qs(parsed.query).get('url', [''])[0]
+            data = make_transcript(url, args.payload_kb * 1024)
+            shape = args.shape if args.shape != 'mixed' else random.choice(('object', 'array'))
+            self._send_json(200, [data] if shape == 'array' else data)
+
+        def do_POST(self):
+            parsed = urlparse(self.path)
+            if parsed.path != args.chat_path:
+                return self._send_json(404, {'message': 'not found'})
+            length = int(self.headers.get('Content-Length') or 0)
+            message = json.loads(self.rfile.read(length) or b'{}').get('chatInput', '')
+
+            state.count('chat')
+            state.delay()
+            if state.should_fail():
+                return self._send_json(args.error_status, {'message': 'stub error'})
+
+            reply = make_text(args.chat_bytes, message)
+            if not args.chat_stream:
+                return self._send_json(200, {'output': reply})
+
+            # n8n streaming mode: one JSON object per line, sent as chunks
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            lines = [{'type': 'begin'}]
+            lines += [{'type': 'item', 'content': word + ' '} for word in reply.split(' ')]
+            lines.append({'type': 'end'})
+            for line in lines:
+                chunk = (json.dumps(line, ensure_ascii=False) + '\n').encode('utf-8')
+                self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+                if args.token_delay:
+                    time.sleep(args.token_delay)
+            self.wfile.write(b'0\r\n\r\n')
+
+    return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5678)
+    parser.add_argument('--latency', type=float, default=0.5, help='mean response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='uniform +/- jitter in seconds')
+    parser.add_argument('--payload-kb', type=int, default=20, help='size of fullContent in KiB')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls that fail')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--shape', choices=('object', 'array', 'mixed'), default='object')
+    parser.add_argument('--chat-bytes', type=int, default=400, help='size of a chat reply')
+    parser.add_argument('--chat-stream', action='store_true', help='answer chat as NDJSON stream items')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='delay between streamed chat items')
+    parser.add_argument('--transcript-path', default='/webhook/youtube_text')
+    parser.add_argument('--chat-path', default='/webhook/chat')
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def serve(args):
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(StubState(args)))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server = serve(args)
+    print(f"Stub n8n listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,119 @@
+"""Compare gunicorn worker classes on webhook-bound routes.
+
+Starts the stub n8n with a slow workflow, then for each worker class starts
+gunicorn (through gunicorn.conf.py), drives /api/transcript and /api/chat
+with loadtest.py and prints the results side by side:
+
+    export DATABASE_URL=postgresql://localhost/bench RATELIMIT_ENABLED=false
+    python bench/seed.py --users 50 --transcripts 10
+    python bench/workers.py --concurrency 200 --latency 3 --duration 60
+
+Every virtual user keeps one request in flight, so with gthread at most
+WEB_CONCURRENCY x THREADS of them reach n8n at once and the rest queue in
+front of the workers; with gevent they all wait on the stub together.
+Admission slots and the upstream pool are opened up to --concurrency so
+that the worker model is the only limit being measured. Use PostgreSQL:
+SQLite serializes the writers long before the worker model matters.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+SCENARIOS = ('transcript', 'chat')
+
+
+def wait_for(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+def run_class(worker_class, args, stub_url):
+    env = dict(
+        os.environ,
+        WORKER_CLASS=worker_class,
+        PORT=str(args.port),
+        RATELIMIT_ENABLED='false',
+        # Without a shared key each worker signs sessions with its own random one
+        SECRET_KEY=os.environ.get('SECRET_KEY') or 'workers-bench',
+        N8N_WEBHOOK_URL=f'{stub_url}/webhook/youtube_text',
+        N8N_CHAT_WEBHOOK_URL=f'{stub_url}/webhook/chat',
+        ADMISSION_SLOTS=str(args.concurrency),
+        ADMISSION_USER_MAX_WAITING=str(args.concurrency),
+        UPSTREAM_POOL_MAXSIZE=str(args.concurrency)
+    )
+    server = subprocess.Popen(['gunicorn', 'app:app'], cwd=ROOT, env=env)
+    try:
+        base_url = f'http://127.0.0.1:{args.port}'
+        wait_for(f'{base_url}/login')
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        subprocess.check_call([
+            sys.executable, os.path.join(BENCH_DIR, 'loadtest.py'),
+            '--base-url', base_url, '--users', str(args.users),
+            '--concurrency', str(args.concurrency), '--duration', str(args.duration),
+            '--mix', args.mix, '--unique-videos', '--name', f'workers-{worker_class}',
+            '--output', output
+        ], cwd=ROOT)
+        with open(output, encoding='utf-8') as f:
+            report = json.load(f)
+        os.unlink(output)
+        return report['scenarios']
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare gunicorn worker classes against the stub n8n')
+    parser.add_argument('--classes', default='gthread,gevent', help='worker classes to run, in order')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=60, help='seconds per worker class')
+    parser.add_argument('--latency', type=float, default=3, help='stub workflow latency in seconds')
+    parser.add_argument('--users', type=int, default=50, help='seeded users to log in as')
+    parser.add_argument('--mix', default='transcript=1,chat=1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--stub-port', type=int, default=5678)
+    args = parser.parse_args(argv)
+
+    if not os.environ.get('DATABASE_URL'):
+        parser.error('set DATABASE_URL to a seeded database (bench/seed.py)')
+
+    stub_url = f'http://127.0.0.1:{args.stub_port}'
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, 'stub_n8n.py'),
+        '--port', str(args.stub_port), '--latency', str(args.latency)
+    ])
+    try:
+        wait_for(f'{stub_url}/stats')
+        results = {name: run_class(name, args, stub_url) for name in args.classes.split(',')}
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    print(f"\n{args.concurrency} users, {args.latency}s n8n latency, {args.duration:.0f}s per class")
+    print(f"{'class':<10}{'scenario':<12}{'reqs':>7}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, scenarios in results.items():
+        for scenario in SCENARIOS:
+            row = scenarios.get(scenario)
+            if row:
+                print(f"{name:<10}{scenario:<12}{row['requests']:>7}{row['errors']:>6}{row['rps']:>9}"
+                      f"{row['p50_ms']:>10}{row['p95_ms']:>10}")
+
+
+if __name__ == '__main__':
+    main()
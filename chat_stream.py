@@ -0,0 +1,94 @@
+"""Relay n8n chat webhook replies to the browser as Server-Sent Events.
+
+When the n8n chat workflow runs in streaming mode it answers with one JSON
+object per line ({"type": "begin" | "item" | "end" | "error", "content": ...}),
+optionally framed as SSE `data:` lines. Each item is forwarded as a `token`
+event as soon as it arrives. A buffered workflow answers with a single JSON
+document instead, which is forwarded whole in the final `done` event.
+"""
+import json
+import logging
+
+import requests
+
+from sse import format_event
+
+log = logging.getLogger(__name__)
+
+STREAM_ITEM_TYPES = ('begin', 'item', 'end', 'error')
+
+
+def iter_chunks(response):
+    """Yield ('token', text), ('error', message) or ('message', dict) pieces"""
+    buffered = []
+    streaming = False
+
+    for line in response.iter_lines():
+        text = line.decode('utf-8', errors='replace').strip()
+        if not text:
+            continue
+        if text.startswith('data:'):
+            text = text[5:].strip()
+
+        try:
+            item = json.loads(text)
+        except ValueError:
+            item = None
+
+        if isinstance(item, dict) and item.get('type') in STREAM_ITEM_TYPES:
+            streaming = True
+            if item['type'] == 'item' and item.get('content'):
+                yield 'token', item['content']
+            elif item['type'] == 'error':
+                yield 'error', item.get('content') or 'Chat workflow error'
+            continue
+        buffered.append(line)
+
+    if buffered and not streaming:
+        result = json.loads(b'\n'.join(buffered))
+        # Handle array response
+        if isinstance(result, list) and len(result) > 0:
+            result = result[0]
+        yield 'message', result
+
+
+def collect(response):
+    """Assemble the whole reply dict, for clients that did not ask to stream"""
+    parts = []
+    final = {}
+    for kind, value in iter_chunks(response):
+        if kind == 'token':
+            parts.append(value)
+        elif kind == 'error':
+            raise ValueError(value)
+        else:
+            final = value
+    if parts:
+        final['output'] = ''.join(parts)
+    return final
+
+
+def relay(response, session_id):
+    """SSE generator: `token` events while streaming, then `done` or `error`"""
+    parts = []
+    final = {}
+    try:
+        for kind, value in iter_chunks(response):
+            if kind == 'token':
+                parts.append(value)
+                yield format_event('token', {'content': value})
+            elif kind == 'error':
+                yield format_event('error', {'error': value})
+                return
+            elif isinstance(value, dict):
+                final = value
+
+        if parts:
+            final['output'] = ''.join(parts)
+        final.setdefault('sessionId', session_id)
+        yield format_event('done', final)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log.warning("Chat stream error: %s: %s", type(e).__name__, e)
+        yield format_event('error', {'error': 'انقطع الاتصال بالشات بوت'})
+    finally:
+        response.close()
@@ -0,0 +1,88 @@
+"""Negotiated gzip/brotli compression of JSON and HTML responses.
+
+Transcripts are long, repetitive text and compress several times over, which
+cuts egress on every /api/transcript/<id>, listing and page response.
+Streamed responses (SSE, file downloads) are passed through untouched.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+COMPRESS_LEVEL_GZIP = 6
+COMPRESS_LEVEL_BROTLI = 5
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'application/javascript',
+    'text/javascript'
+}
+
+
+def _accepted_encodings(header):
+    """Map of encodings the client accepts (q > 0)"""
+    accepted = {}
+    for part in (header or '').split(','):
+        pieces = part.strip().split(';')
+        name = pieces[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return {name for name, quality in accepted.items() if quality > 0}
+
+
+def choose_encoding(accept_encoding, available=None):
+    """Preferred encoding the client accepts, among available (default: what we can compress)"""
+    if available is None:
+        available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in ('br', 'gzip'):
+        if encoding in available and encoding in accepted:
+            return encoding
+    return None
+
+
+def compress_response(response, accept_encoding):
+    """Compress a buffered response in place when the client allows it"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=COMPRESS_LEVEL_BROTLI)
+    else:
+        compressed = gzip.compress(body, compresslevel=COMPRESS_LEVEL_GZIP)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+
+    # A strong ETag names exact bytes, so each encoding gets its own tag
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/') and etag.endswith('"'):
+        response.headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    return response
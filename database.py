@@ -0,0 +1,154 @@
+"""Connection pooling and read/write routing.
+
+Pool size, overflow, checkout timeout, recycling and pre-ping come from the
+environment, so a free-tier PostgreSQL with a low connection limit can be
+budgeted: each gunicorn worker opens at most DB_POOL_SIZE + DB_MAX_OVERFLOW
+connections per engine. Pre-ping replaces connections the server or a proxy
+dropped while idle instead of failing the next request on them.
+
+With DATABASE_REPLICA_URL set, views wrapped in @replica_reads send their
+reads to the replica. Writes and flushes always go to the primary. After a
+user writes something they will read back (mark_written), their reads stay
+on the primary for DB_READ_YOUR_WRITES_SECONDS, which covers replication lag.
+Lookups by id that miss on the replica can retry on the primary with
+`with primary():`.
+
+Checkout waits and timeouts are recorded per pool in /metrics; pool_stats()
+exports the pool occupancy.
+"""
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+import metrics
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() != 'false'
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL') or None
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 10))
+
+REPLICA_BIND = 'replica'
+PRIMARY_UNTIL_KEY = 'db_primary_until'
+
+
+def normalize_url(url):
+    """Heroku/Render style postgres:// URLs are spelled postgresql:// by SQLAlchemy"""
+    if url and url.startswith('postgres://'):
+        return url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        name = getattr(self, 'logging_name', None) or 'primary'
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            metrics.observe_pool_checkout(name, time.perf_counter() - started, timed_out=True)
+            raise
+        metrics.observe_pool_checkout(name, time.perf_counter() - started)
+        return connection
+
+
+def engine_options(url, name):
+    """SQLAlchemy engine options for the primary or replica URL"""
+    if url in ('sqlite://', 'sqlite:///:memory:'):
+        return {}  # Flask-SQLAlchemy picks the single-connection pool in-memory SQLite needs
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_logging_name': name,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING
+    }
+
+
+def configure(app):
+    """Set the engine options, and the replica bind when one is configured"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], 'primary')
+    if DATABASE_REPLICA_URL:
+        replica_url = normalize_url(DATABASE_REPLICA_URL)
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: {'url': replica_url, **engine_options(replica_url, REPLICA_BIND)}
+        }
+
+
+def _reading_from_replica():
+    if not has_request_context() or not g.get('db_replica_reads'):
+        return False
+    return session.get(PRIMARY_UNTIL_KEY, 0) <= time.time()
+
+
+class RoutingSession(Session):
+    """Session that sends reads in @replica_reads views to the replica engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _reading_from_replica():
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_reads(view):
+    """Serve the view's queries from the replica, when there is one"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_replica_reads = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, e.g. to retry a replica miss"""
+    previous = g.get('db_replica_reads', False)
+    g.db_replica_reads = False
+    try:
+        yield
+    finally:
+        g.db_replica_reads = previous
+
+
+def replica_active():
+    """Whether this request's reads are currently going to a replica"""
+    return bool(DATABASE_REPLICA_URL) and _reading_from_replica()
+
+
+def mark_written():
+    """Keep this user's reads on the primary until the replica has caught up"""
+    if DATABASE_REPLICA_URL:
+        session[PRIMARY_UNTIL_KEY] = time.time() + DB_READ_YOUR_WRITES_SECONDS
+
+
+def pool_stats():
+    """Occupancy of each engine's pool in this worker"""
+    stats = {}
+    for key, engine in current_app.extensions['sqlalchemy'].engines.items():
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        name = key or 'primary'
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        checked_out = pool.checkedout()
+        stats[f'{name}_size'] = pool.size()
+        stats[f'{name}_capacity'] = capacity
+        stats[f'{name}_checked_out'] = checked_out
+        stats[f'{name}_idle'] = pool.checkedin()
+        stats[f'{name}_overflow'] = max(pool.overflow(), 0)
+        stats[f'{name}_saturation'] = round(checked_out / capacity, 4) if capacity else 0.0
+    return stats
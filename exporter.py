@@ -0,0 +1,320 @@
+"""Server-side bulk export of transcripts as a streamed ZIP archive.
+
+Transcripts are rendered to Markdown, DOCX or PDF in a small process pool,
+so CPU-heavy rendering never blocks the web worker's threads. The ZIP is
+written to a non-seekable buffer and yielded entry by entry, so memory stays
+bounded by one batch no matter how many transcripts are exported.
+
+Rendered files are cached on disk per transcript and format. Transcripts
+never change once saved, so repeat exports only read the cached files.
+
+Arabic stays readable (see ARABIC_PDF_FIX.md): DOCX paragraphs and runs are
+marked bidi/RTL so Word shapes the text itself, and PDFs are typeset with
+fpdf2's HarfBuzz shaping engine and an Arabic-capable TrueType font
+(EXPORT_PDF_FONT) instead of the client-side html2canvas rasterizing.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from xml.sax.saxutils import escape as xml_escape
+
+try:
+    from fpdf import FPDF
+except ImportError:  # PDF export is optional
+    FPDF = None
+
+log = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('md', 'docx', 'pdf')
+RENDER_VERSION = 1  # bump when the rendered layout changes, to skip stale cache files
+EXPORT_PROCESSES = int(os.environ.get('EXPORT_PROCESSES', 2))
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 8))
+EXPORT_CACHE_DIR = os.environ.get('EXPORT_CACHE_DIR')
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+EXPORT_PDF_FONT = os.environ.get('EXPORT_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+SECTIONS = (
+    ('introduction', 'المقدمة'),
+    ('summary', 'الملخص'),
+    ('mainPoints', 'أهم النقاط'),
+    ('fullContent', 'المحتوى الكامل')
+)
+
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_UNSAFE_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+_WHITESPACE = re.compile(r'\s+')
+
+_cache_dir = None
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def init_app(app):
+    global _cache_dir
+    _cache_dir = EXPORT_CACHE_DIR or os.path.join(app.instance_path, 'export_cache')
+
+
+def pdf_available():
+    return FPDF is not None and os.path.exists(EXPORT_PDF_FONT)
+
+
+# Renderers (run inside the process pool, so they only take plain dicts)
+
+def _title(data):
+    return data.get('videoTitle') or 'تفريغ محتوى يوتيوب'
+
+
+def render_markdown(data):
+    lines = [f"# {_title(data)}", '']
+    if data.get('video_url'):
+        lines += [f"رابط الفيديو: <{data['video_url']}>", '']
+    for key, label in SECTIONS:
+        if data.get(key):
+            lines += [f'## {label}', '', data[key].strip(), '']
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _docx_paragraph(text, size=22, bold=False, color=None, justify=False):
+    # Child elements follow the order the OOXML schema requires; Word rejects others
+    props = '<w:rFonts w:ascii="Arial" w:hAnsi="Arial" w:cs="Arial"/>'
+    if bold:
+        props += '<w:b/><w:bCs/>'
+    if color:
+        props += f'<w:color w:val="{color}"/>'
+    props += f'<w:sz w:val="{size}"/><w:szCs w:val="{size}"/><w:rtl/>'
+    align = '<w:jc w:val="both"/>' if justify else ''
+    text = xml_escape(_INVALID_XML_CHARS.sub('', text))
+    return (
+        f'<w:p><w:pPr><w:bidi/><w:spacing w:after="120"/>{align}</w:pPr>'
+        f'<w:r><w:rPr>{props}</w:rPr><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+    )
+
+
+def render_docx(data):
+    paragraphs = [_docx_paragraph(_title(data), size=36, bold=True, color='FF0000')]
+    if data.get('video_url'):
+        paragraphs.append(_docx_paragraph(data['video_url'], size=18, color='0066CC'))
+    for key, label in SECTIONS:
+        if data.get(key):
+            paragraphs.append(_docx_paragraph(label, size=28, bold=True, color='FF0000'))
+            for line in data[key].splitlines():
+                if line.strip():
+                    paragraphs.append(_docx_paragraph(line, justify=True))
+
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{"".join(paragraphs)}'
+        '<w:sectPr><w:pgSz w:w="11906" w:h="16838"/><w:bidi/></w:sectPr>'
+        '</w:body></w:document>'
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '</Types>'
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('[Content_Types].xml', content_types)
+        docx.writestr('_rels/.rels', rels)
+        docx.writestr('word/document.xml', document)
+    return buffer.getvalue()
+
+
+def render_pdf(data):
+    pdf = FPDF(format='A4')
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_font('Body', fname=EXPORT_PDF_FONT)
+    pdf.set_text_shaping(use_shaping_engine=True, direction='rtl')
+    pdf.add_page()
+
+    def block(text, size, color=(0, 0, 0), align='R', height=None):
+        pdf.set_font('Body', size=size)
+        pdf.set_text_color(*color)
+        pdf.multi_cell(0, height or size * 0.6, text, align=align, new_x='LMARGIN', new_y='NEXT')
+
+    block(_title(data), 18, color=(255, 0, 0))
+    if data.get('video_url'):
+        pdf.set_text_shaping(use_shaping_engine=True, direction='ltr')
+        block(data['video_url'], 9, color=(0, 102, 204), align='L')
+        pdf.set_text_shaping(use_shaping_engine=True, direction='rtl')
+    for key, label in SECTIONS:
+        if data.get(key):
+            pdf.ln(4)
+            block(label, 14, color=(255, 0, 0))
+            block(data[key].strip(), 11, height=7)
+    return bytes(pdf.output())
+
+
+RENDERERS = {'md': render_markdown, 'docx': render_docx, 'pdf': render_pdf}
+
+
+def render(fmt, data):
+    return RENDERERS[fmt](data)
+
+
+# Artifact cache
+
+def _cache_path(transcript_id, fmt):
+    return os.path.join(_cache_dir, f'{transcript_id}-v{RENDER_VERSION}.{fmt}')
+
+
+def _read_cached(transcript_id, fmt):
+    path = _cache_path(transcript_id, fmt)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.utime(path)  # keep recently exported files at the back of the prune order
+        return data
+    except OSError:
+        return None
+
+
+def _write_cached(transcript_id, fmt, data):
+    path = _cache_path(transcript_id, fmt)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(_cache_dir, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning("Export cache write error: %s", e)
+
+
+def prune_cache():
+    """Delete least recently used artifacts until the cache fits its budget"""
+    try:
+        entries = [e for e in os.scandir(_cache_dir) if e.is_file()]
+    except OSError:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    total = sum(e.stat().st_size for e in entries)
+    for entry in entries:
+        if total <= EXPORT_CACHE_MAX_BYTES:
+            break
+        try:
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# Process pool and ZIP streaming
+
+def _get_pool():
+    # spawn, not fork: forking a threaded gunicorn worker can deadlock the child
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=EXPORT_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _submit(fmt, data):
+    try:
+        return _get_pool().submit(render, fmt, data)
+    except BrokenProcessPool:
+        # A render process died (e.g. OOM); start a fresh pool instead of failing every export
+        global _pool
+        with _pool_lock:
+            _pool = None
+        return _get_pool().submit(render, fmt, data)
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, non-seekable sink; zipfile then emits data descriptors"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def archive_name(transcript_id, title, fmt):
+    safe = _UNSAFE_FILENAME_CHARS.sub('', title or '').strip()[:60].strip() or 'transcript'
+    return f'{transcript_id}_{_WHITESPACE.sub("_", safe)}.{fmt}'
+
+
+def stream_zip(entries, fmt, load_batch):
+    """Yield a ZIP of rendered transcripts.
+
+    entries is a list of (id, title, created_at); load_batch(ids) returns
+    {id: to_dict()} for transcripts that must be rendered.
+    """
+    sink = _ZipStream()
+    archive = zipfile.ZipFile(sink, 'w')
+    errors = []
+
+    for start in range(0, len(entries), EXPORT_BATCH_SIZE):
+        batch = entries[start:start + EXPORT_BATCH_SIZE]
+        rendered = {tid: _read_cached(tid, fmt) for tid, _, _ in batch}
+
+        missing = [tid for tid, content in rendered.items() if content is None]
+        if missing:
+            rows = load_batch(missing)
+            futures = {tid: _submit(fmt, rows[tid]) for tid in missing if tid in rows}
+            for tid, future in futures.items():
+                try:
+                    rendered[tid] = future.result()
+                    _write_cached(tid, fmt, rendered[tid])
+                except Exception as e:
+                    log.warning("Export render error for transcript %s: %s: %s", tid, type(e).__name__, e)
+                    errors.append(f'{tid}: {e}')
+
+        for tid, title, created_at in batch:
+            content = rendered.get(tid)
+            if content is None:
+                continue
+            info = zipfile.ZipInfo(archive_name(tid, title, fmt), date_time=created_at.timetuple()[:6])
+            # PDF and DOCX are already compressed
+            info.compress_type = zipfile.ZIP_DEFLATED if fmt == 'md' else zipfile.ZIP_STORED
+            archive.writestr(info, content)
+        yield sink.drain()
+
+    if errors:
+        info = zipfile.ZipInfo('export_errors.txt', date_time=datetime.utcnow().timetuple()[:6])
+        archive.writestr(info, '\n'.join(errors))
+    archive.close()
+    yield sink.drain()
+    prune_cache()
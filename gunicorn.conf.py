@@ -0,0 +1,42 @@
+"""Gunicorn settings; gunicorn reads this file from the working directory.
+
+WORKER_CLASS=gthread (the default) serves each request on one of THREADS
+threads per worker. A request waiting on n8n holds its thread for the whole
+workflow, so an instance serves WEB_CONCURRENCY x THREADS webhook-bound
+requests at once and queues the rest in the socket backlog.
+
+WORKER_CLASS=gevent runs each request as a greenlet instead. The worker
+monkey-patches sockets, time.sleep and threading when it starts, so the
+requests-based client in upstream.py, the admission and single-flight polls
+and, through psycogreen, psycopg2 all yield while they wait, and a worker
+holds up to WORKER_CONNECTIONS requests in flight. Flask-SQLAlchemy scopes
+sessions to the app context, a context variable and therefore per greenlet;
+the code releases its pooled connection before each n8n wait. Needs the
+gevent and psycogreen packages. bench/workers.py compares the two.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('THREADS', 4))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 500))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning("psycogreen is not installed; PostgreSQL queries will block the gevent loop")
+        return
+    # Make psycopg2 wait on the gevent hub instead of blocking the whole worker
+    patch_psycopg()
+
+
+def worker_exit(server, worker):
+    # Flush and close the log handlers before gevent tears its hub down
+    import logs
+    logs.shutdown()
@@ -0,0 +1,119 @@
+"""Conditional GET support and a per-worker LRU of serialized transcripts.
+
+Transcripts never change after they are saved, so /api/transcript/<id>
+keeps the encoded JSON body and its strong ETag in memory. Repeat reads
+(PDF/Word export, "view details") skip both the query and the JSON
+encoding, and clients that send If-None-Match get a 304 without a body.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from models import Transcript
+
+TRANSCRIPT_LRU_ENTRIES = int(os.environ.get('TRANSCRIPT_LRU_ENTRIES', 256))
+TRANSCRIPT_LRU_BYTES = int(os.environ.get('TRANSCRIPT_LRU_BYTES', 32 * 1024 * 1024))
+
+# Browsers must revalidate every time: the response is per-user and a shared
+# machine could otherwise show it to the next person after logout
+TRANSCRIPT_CACHE_CONTROL = 'private, no-cache'
+
+# Suffixes compression.py appends to ETags of encoded variants
+ENCODING_SUFFIXES = ('-gzip', '-br')
+
+
+class CachedBody:
+    __slots__ = ('user_id', 'body', 'etag')
+
+    def __init__(self, user_id, body, etag):
+        self.user_id = user_id
+        self.body = body
+        self.etag = etag
+
+
+class LRUCache:
+    """Thread-safe LRU bounded by entry count and total body bytes"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._data[key] = entry
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self._stats['evictions'] += 1
+
+    def pop(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['entries'] = len(self._data)
+            snapshot['bytes'] = self._bytes
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
+
+
+transcripts = LRUCache(TRANSCRIPT_LRU_ENTRIES, TRANSCRIPT_LRU_BYTES)
+
+
+def make_etag(key, body):
+    return f'"{key}-{hashlib.sha256(body).hexdigest()[:20]}"'
+
+
+def matching_etag(if_none_match, etag):
+    """Return the client's tag that matches etag (any encoding variant), or None"""
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == '*':
+        return etag
+    base = etag.strip('"')
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        opaque = tag[2:] if tag.startswith('W/') else tag
+        opaque = opaque.strip('"')
+        for suffix in ENCODING_SUFFIXES:
+            if opaque.endswith(suffix):
+                opaque = opaque[:-len(suffix)]
+                break
+        if opaque == base:
+            return tag
+    return None
+
+
+@event.listens_for(Transcript, 'after_update')
+@event.listens_for(Transcript, 'after_delete')
+def _invalidate_transcript(mapper, connection, target):
+    transcripts.pop(target.id)
@@ -0,0 +1,93 @@
+"""Per-worker cache of the identity behind each authenticated request.
+
+Flask-Login calls the user loader on every @login_required request; without
+a cache that is a full `users` row (password hash and reset token included)
+read before the route runs its own query. Here the loader keeps a small
+CachedUser with only the fields requests use, for IDENTITY_CACHE_TTL
+seconds, so an authenticated API call costs one query instead of two.
+
+Entries are dropped on logout, password reset and other account changes in
+this worker; other workers pick the change up when their entry expires.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from models import db, User
+
+IDENTITY_CACHE_TTL = float(os.environ.get('IDENTITY_CACHE_TTL', 60))
+IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get('IDENTITY_CACHE_MAX_ENTRIES', 10000))
+
+IDENTITY_COLUMNS = (User.id, User.username, User.email, User.created_at)
+
+
+class CachedUser(UserMixin):
+    """The fields of a User that requests read; never the credentials"""
+
+    def __init__(self, id, username, email, created_at):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.created_at = created_at
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # user id -> (expires at, CachedUser)
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+
+def load(user_id):
+    """The cached identity for user_id, loading it on a miss; None if gone"""
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            _entries.move_to_end(user_id)
+            _stats['hits'] += 1
+            return entry[1]
+        _stats['misses'] += 1
+
+    row = db.session.query(*IDENTITY_COLUMNS).filter(User.id == user_id).first()
+    if row is None:
+        invalidate(user_id)
+        return None
+
+    user = CachedUser(row.id, row.username, row.email, row.created_at)
+    with _lock:
+        _entries[user_id] = (now + IDENTITY_CACHE_TTL, user)
+        _entries.move_to_end(user_id)
+        while len(_entries) > IDENTITY_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+    return user
+
+
+def invalidate(user_id):
+    with _lock:
+        if _entries.pop(user_id, None) is not None:
+            _stats['invalidations'] += 1
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    # Password resets, reset tokens and any other account change
+    invalidate(target.id)
+
+
+def stats():
+    """Snapshot of this worker's identity cache counters"""
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot['entries'] = len(_entries)
+    lookups = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_ratio'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+    snapshot['ttl_seconds'] = IDENTITY_CACHE_TTL
+    return snapshot
@@ -0,0 +1,364 @@
+"""Background transcript jobs.
+
+POST /api/jobs stores a Job row and hands it to a bounded per-worker thread
+pool, so the request returns at once instead of holding a gunicorn thread for
+the whole n8n call. Clients poll /api/jobs/<id> or follow
+/api/jobs/<id>/stream (Server-Sent Events) until the job is done or failed.
+
+A batch (POST /api/batches) stores one queued Job per video and releases them
+into the same pool a few at a time: at most BATCH_CONCURRENCY per batch and
+BATCH_USER_CONCURRENCY per user are in flight on a worker, so one playlist
+cannot occupy every n8n slot. Each finished item dispatches the next one.
+That dispatch state lives in the worker that accepted the batch; if the
+worker restarts, the next poll of the batch finds queued items that no
+worker is handing out and resumes dispatching them from the database.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from models import db, Job, Batch
+from sse import format_event
+import admission
+from transcript_service import process_transcript, TranscriptError
+
+log = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', 50))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 900))  # 15 minutes
+JOB_STREAM_MAX_SECONDS = int(os.environ.get('JOB_STREAM_MAX_SECONDS', 55))
+JOB_STREAM_POLL_SECONDS = float(os.environ.get('JOB_STREAM_POLL_SECONDS', 1.0))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 2))
+BATCH_USER_CONCURRENCY = int(os.environ.get('BATCH_USER_CONCURRENCY', 3))
+BATCH_USER_MAX_PENDING = int(os.environ.get('BATCH_USER_MAX_PENDING', 100))
+# Quiet time after which queued batch items with nothing running are taken over
+BATCH_RESUME_SECONDS = int(os.environ.get('BATCH_RESUME_SECONDS', 30))
+
+
+class QueueFullError(Exception):
+    """Raised when this worker already has JOB_QUEUE_LIMIT jobs pending"""
+
+
+class BatchLimitError(QueueFullError):
+    """Raised when a user already has BATCH_USER_MAX_PENDING unfinished videos"""
+
+
+_app = None
+_executor = None
+_lock = threading.Lock()
+_pending = 0
+
+# Batch dispatch state for this worker
+_dispatched = set()   # batch item ids handed to the pool
+_batch_running = {}   # batch id -> items in flight
+_user_running = {}    # user id -> batch items in flight
+_user_batches = {}    # user id -> {batch id: True} with items still to dispatch
+
+
+def init_app(app):
+    global _app
+    _app = app
+
+
+def _get_executor():
+    # Created lazily so each gunicorn worker gets its own pool after fork
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='transcript-job')
+        return _executor
+
+
+def _release():
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def submit(user_id, url, refresh=False):
+    """Persist a new job and queue it on this worker's pool"""
+    global _pending
+    with _lock:
+        if _pending >= JOB_QUEUE_LIMIT:
+            raise QueueFullError()
+        _pending += 1
+
+    try:
+        job = Job(id=uuid.uuid4().hex, user_id=user_id, video_url=url, refresh=refresh)
+        db.session.add(job)
+        db.session.commit()
+        _get_executor().submit(_run, job.id)
+    except Exception:
+        _release()
+        raise
+    return job
+
+
+def _run(job_id, batch_id=None, user_id=None):
+    try:
+        with _app.app_context():
+            # Claim the job so a batch item dispatched twice (stale read in _pump) runs once
+            claimed = Job.query.filter_by(id=job_id, status='queued').update(
+                {'status': 'running', 'started_at': datetime.utcnow()}, synchronize_session=False
+            )
+            db.session.commit()
+            if not claimed:
+                return
+            job = db.session.get(Job, job_id)
+
+            def on_stage(name):
+                job.stage = name
+                if name != 'admission':
+                    job.queue_position = None
+                db.session.commit()
+
+            def on_queue(position):
+                job.queue_position = position
+                db.session.commit()
+
+            try:
+                data, transcript = process_transcript(
+                    job.user_id, job.video_url, refresh=job.refresh, on_stage=on_stage,
+                    on_queue=on_queue, admission_wait=admission.ADMISSION_JOB_WAIT_SECONDS
+                )
+                if transcript is None:
+                    job.status = 'failed'
+                    job.error = 'تعذر قراءة رد n8n'
+                else:
+                    job.status = 'done'
+                    job.transcript_id = transcript.id
+            except TranscriptError as e:
+                db.session.rollback()
+                job.status = 'failed'
+                job.error = e.message
+            except Exception as e:
+                db.session.rollback()
+                log.exception("Job %s failed", job_id)
+                job.status = 'failed'
+                job.error = str(e)
+
+            job.stage = job.status
+            job.queue_position = None
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+    finally:
+        _release()
+        if batch_id is not None:
+            _finish_batch_item(job_id, batch_id, user_id)
+
+
+def submit_batch(user_id, urls, source_url=None, refresh=False):
+    """Persist a batch with one queued job per URL and start dispatching it"""
+    unfinished = Job.query.filter(Job.user_id == user_id, Job.status.in_(('queued', 'running'))).count()
+    if unfinished + len(urls) > BATCH_USER_MAX_PENDING:
+        raise BatchLimitError()
+
+    batch = Batch(id=uuid.uuid4().hex, user_id=user_id, source_url=source_url)
+    db.session.add(batch)
+    for position, url in enumerate(urls):
+        db.session.add(Job(
+            id=uuid.uuid4().hex, user_id=user_id, video_url=url, refresh=refresh,
+            batch_id=batch.id, position=position
+        ))
+    db.session.commit()
+
+    with _lock:
+        _user_batches.setdefault(user_id, {})[batch.id] = True
+    _pump(user_id)
+    return batch
+
+
+def _pump(user_id):
+    """Hand queued batch items to the pool while the user's limits allow"""
+    global _pending
+    with _lock:
+        batch_ids = list(_user_batches.get(user_id, ()))
+
+    for batch_id in batch_ids:
+        queued = [row.id for row in db.session.query(Job.id).filter(
+            Job.batch_id == batch_id, Job.status == 'queued'
+        ).order_by(Job.position)]
+
+        started = []
+        with _lock:
+            waiting = [job_id for job_id in queued if job_id not in _dispatched]
+            for job_id in waiting:
+                if (_batch_running.get(batch_id, 0) >= BATCH_CONCURRENCY
+                        or _user_running.get(user_id, 0) >= BATCH_USER_CONCURRENCY):
+                    break
+                _dispatched.add(job_id)
+                _batch_running[batch_id] = _batch_running.get(batch_id, 0) + 1
+                _user_running[user_id] = _user_running.get(user_id, 0) + 1
+                _pending += 1
+                started.append(job_id)
+            if len(started) == len(waiting):
+                _user_batches.get(user_id, {}).pop(batch_id, None)
+
+        for job_id in started:
+            _get_executor().submit(_run, job_id, batch_id, user_id)
+
+
+def _finish_batch_item(job_id, batch_id, user_id):
+    with _lock:
+        _dispatched.discard(job_id)
+        _batch_running[batch_id] -= 1
+        if not _batch_running[batch_id]:
+            del _batch_running[batch_id]
+        _user_running[user_id] -= 1
+        if not _user_running[user_id]:
+            del _user_running[user_id]
+        if not _user_batches.get(user_id):
+            _user_batches.pop(user_id, None)
+            return
+    try:
+        with _app.app_context():
+            _pump(user_id)
+    except Exception:
+        log.exception("Batch dispatch error for user %s", user_id)
+
+
+def _fail_stale(job):
+    job.status = 'failed'
+    job.stage = 'failed'
+    job.error = 'انتهت مهلة المهمة'
+    job.finished_at = datetime.utcnow()
+
+
+def get_job(job_id, user_id):
+    """Load a user's job, failing it if its worker died before finishing"""
+    job = Job.query.filter_by(id=job_id, user_id=user_id).first()
+    if job and not job.is_finished:
+        # Queued batch items wait their turn; get_batch resumes them if their dispatcher is gone
+        started = job.started_at or (job.created_at if job.batch_id is None else None)
+        if started and started < datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS):
+            _fail_stale(job)
+            db.session.commit()
+    return job
+
+
+def _orphaned(user_id):
+    """True when no worker is dispatching the user's queued batch items"""
+    with _lock:
+        if user_id in _user_batches or _user_running.get(user_id):
+            return False
+    items = Job.query.filter(Job.user_id == user_id, Job.batch_id.isnot(None))
+    if items.filter(Job.status == 'running').first() is not None:
+        return False
+    # A dispatcher starts the next item as soon as one finishes; allow it that moment
+    latest = items.with_entities(db.func.max(Job.finished_at)).scalar()
+    return latest is None or latest < datetime.utcnow() - timedelta(seconds=BATCH_RESUME_SECONDS)
+
+
+def _resume(batch_id, user_id):
+    """Dispatch a batch's queued items from this worker"""
+    log.info("Resuming dispatch of batch %s for user %s", batch_id, user_id)
+    with _lock:
+        _user_batches.setdefault(user_id, {})[batch_id] = True
+    _pump(user_id)
+
+
+def get_batch(batch_id, user_id):
+    """Load a user's batch, failing items that died with their worker and
+    resuming queued items that no worker is dispatching any more"""
+    batch = Batch.query.filter_by(id=batch_id, user_id=user_id).first()
+    if batch and not batch.is_finished:
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        changed = False
+        for item in batch.items:
+            if item.status == 'running' and item.started_at and item.started_at < cutoff:
+                _fail_stale(item)
+                changed = True
+        if changed:
+            db.session.commit()
+        settled = batch.created_at < datetime.utcnow() - timedelta(seconds=BATCH_RESUME_SECONDS)
+        if settled and any(item.status == 'queued' for item in batch.items) and _orphaned(user_id):
+            _resume(batch.id, user_id)
+    return batch
+
+
+def stream_events(job_id, user_id):
+    """Yield SSE progress events until the job finishes.
+
+    The stream closes after JOB_STREAM_MAX_SECONDS so it never outlives the
+    gunicorn timeout; EventSource reconnects on its own and resumes.
+    """
+    deadline = time.monotonic() + JOB_STREAM_MAX_SECONDS
+    last_state = None
+    yield 'retry: 2000\n\n'
+
+    while True:
+        job = get_job(job_id, user_id)
+        if job is None:
+            yield format_event('error', {'error': 'Job not found'})
+            return
+
+        state = (job.status, job.stage, job.queue_position)
+        if job.is_finished:
+            yield format_event(job.status, job.to_dict())
+            return
+        if state != last_state:
+            yield format_event('progress', job.to_dict(include_result=False))
+            last_state = state
+
+        # End the read transaction so the next poll sees the worker's commits
+        db.session.rollback()
+
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(JOB_STREAM_POLL_SECONDS)
+
+
+def stream_batch_events(batch_id, user_id):
+    """Yield SSE events for a batch: `item` when an item changes state,
+    `progress` with the aggregate counts, and `done` once every item finished.
+
+    Like stream_events it closes after JOB_STREAM_MAX_SECONDS; on reconnect
+    the current state of every item is sent again.
+    """
+    deadline = time.monotonic() + JOB_STREAM_MAX_SECONDS
+    item_states = {}
+    last_progress = None
+    yield 'retry: 2000\n\n'
+
+    while True:
+        batch = get_batch(batch_id, user_id)
+        if batch is None:
+            yield format_event('error', {'error': 'Batch not found'})
+            return
+
+        for item in batch.items:
+            state = (item.status, item.stage, item.queue_position)
+            if item_states.get(item.id) != state:
+                yield format_event('item', item.to_dict(include_result=False))
+                item_states[item.id] = state
+
+        progress = batch.progress()
+        if progress != last_progress:
+            yield format_event('progress', progress)
+            last_progress = progress
+
+        if batch.is_finished:
+            yield format_event('done', batch.to_dict(include_items=False))
+            return
+
+        db.session.rollback()
+
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(JOB_STREAM_POLL_SECONDS)
+
+
+def stats():
+    with _lock:
+        return {
+            'pending': _pending,
+            'workers': JOB_WORKERS,
+            'queue_limit': JOB_QUEUE_LIMIT,
+            'batch_items_running': sum(_batch_running.values()),
+            'batches_dispatching': sum(len(b) for b in _user_batches.values())
+        }
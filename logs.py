@@ -0,0 +1,89 @@
+"""Non-blocking log output.
+
+Every record goes through a QueueHandler; a QueueListener thread does the
+actual writes to stdout and security.log, so request threads never block on
+a slow terminal or disk. Request and response bodies are only logged when
+LOG_PAYLOADS is set, and even then truncated to LOG_PAYLOAD_MAX_CHARS.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_PAYLOADS = os.environ.get('LOG_PAYLOADS', '').lower() in ('1', 'true', 'yes')
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get('LOG_PAYLOAD_MAX_CHARS', 500))
+SECURITY_LOG_FILE = os.environ.get('SECURITY_LOG_FILE', 'security.log')
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class _LoggerFilter(logging.Filter):
+    """Pass records from one logger (and its children) only"""
+
+    def __init__(self, name, include=True):
+        super().__init__(name)
+        self.include = include
+
+    def filter(self, record):
+        return super().filter(record) == self.include
+
+
+def configure():
+    """Route the root logger through a queue; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+    console.addFilter(_LoggerFilter('security', include=False))
+
+    # security.log keeps the audit trail (logins, password resets) only
+    security = logging.FileHandler(SECURITY_LOG_FILE)
+    security.setFormatter(logging.Formatter(LOG_FORMAT))
+    security.setLevel(logging.WARNING)
+    security.addFilter(_LoggerFilter('security'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, console, security, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out queued records, then stop the listener and close its handlers.
+
+    Runs at exit; under gevent gunicorn.conf.py calls it from worker_exit
+    instead, while the hub is still running. Handlers left for interpreter
+    teardown are finalized after gevent's greenlets, and logging's cleanup
+    then fails with "greenlet is being finalized".
+    """
+    global _listener
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def payload(value):
+    """A log-safe rendering of a request/response body"""
+    if not LOG_PAYLOADS:
+        size = len(value) if isinstance(value, (str, bytes)) else len(str(value))
+        return f'<{size} chars>'
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) > LOG_PAYLOAD_MAX_CHARS:
+        return text[:LOG_PAYLOAD_MAX_CHARS] + f'... <{len(text)} chars>'
+    return text
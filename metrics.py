@@ -0,0 +1,225 @@
+"""Prometheus-style metrics for the hot paths, served at /metrics.
+
+Request latency, payload sizes and database work are recorded per Flask
+endpoint, and checkout waits per database pool; the pooled n8n client
+records upstream latency, status codes and response sizes per host. The existing per-module stats (result cache, LRU,
+single-flight, admission, jobs) are exported as gauges at scrape time.
+
+Samples are kept in this worker's memory, like every other stats endpoint
+here; scrape each gunicorn worker (or run one) for complete numbers.
+Streamed responses are timed to their first byte.
+"""
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labelnames, key, ('le', bound))
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labelnames, key, ('le', '+Inf'))
+                lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {series[-2]}')
+                lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+http_requests = Counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status', ('endpoint', 'method', 'status')
+)
+http_latency = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response', ('endpoint', 'method')
+)
+http_request_bytes = Histogram(
+    'http_request_size_bytes', 'Request body size', ('endpoint',), buckets=SIZE_BUCKETS
+)
+http_response_bytes = Histogram(
+    'http_response_size_bytes', 'Response body size (unstreamed responses)', ('endpoint',), buckets=SIZE_BUCKETS
+)
+db_queries = Histogram(
+    'db_queries_per_request', 'Database statements executed per request', ('endpoint',), buckets=COUNT_BUCKETS
+)
+db_time = Histogram(
+    'db_time_per_request_seconds', 'Time spent in database statements per request', ('endpoint',)
+)
+db_pool_wait = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled database connection', ('pool',)
+)
+db_pool_timeouts = Counter(
+    'db_pool_checkout_timeouts_total', 'Checkouts that gave up after DB_POOL_TIMEOUT', ('pool',)
+)
+upstream_latency = Histogram(
+    'upstream_request_duration_seconds', 'Upstream call latency per attempt', ('host', 'method')
+)
+upstream_responses = Counter(
+    'upstream_responses_total', 'Upstream responses by status code, or error type', ('host', 'status')
+)
+upstream_bytes = Histogram(
+    'upstream_response_size_bytes', 'Upstream response size from Content-Length', ('host',), buckets=SIZE_BUCKETS
+)
+
+_registry = [
+    http_requests, http_latency, http_request_bytes, http_response_bytes, db_queries, db_time,
+    db_pool_wait, db_pool_timeouts, upstream_latency, upstream_responses, upstream_bytes
+]
+_collectors = []
+
+
+def register_collector(name, documentation, collect):
+    """Export collect() -> {label value: number} as gauge `name` labelled by `key`"""
+    _collectors.append((name, documentation, collect))
+
+
+def observe_upstream(host, method, seconds, status, size=None):
+    upstream_latency.observe(seconds, host=host, method=method)
+    upstream_responses.inc(host=host, status=status)
+    if size is not None:
+        upstream_bytes.observe(size, host=host)
+
+
+def observe_pool_checkout(pool, seconds, timed_out=False):
+    db_pool_wait.observe(seconds, pool=pool)
+    if timed_out:
+        db_pool_timeouts.inc(pool=pool)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _statement_done(conn):
+    started = conn.info.get('metrics_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if has_request_context() and 'metrics_db' in g:
+        g.metrics_db[0] += 1
+        g.metrics_db[1] += elapsed
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _statement_done(conn)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; without this its
+    # start time would stay behind on the pooled connection
+    if context.connection is not None and context.execution_context is not None:
+        _statement_done(context.connection)
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def init_app(app):
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_db = [0, 0.0]
+
+    @app.after_request
+    def _record(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        endpoint = _endpoint()
+        http_latency.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        if request.content_length:
+            http_request_bytes.observe(request.content_length, endpoint=endpoint)
+        if not response.is_streamed and response.content_length is not None:
+            http_response_bytes.observe(response.content_length, endpoint=endpoint)
+        count, seconds = g.pop('metrics_db', (0, 0.0))
+        db_queries.observe(count, endpoint=endpoint)
+        db_time.observe(seconds, endpoint=endpoint)
+        return response
+
+
+def render():
+    """Current samples in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    for name, documentation, collect in _collectors:
+        try:
+            values = collect()
+        except Exception as e:
+            lines.append(f'# {name} unavailable: {type(e).__name__}')
+            continue
+        lines += [f'# HELP {name} {documentation}', f'# TYPE {name} gauge']
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f'{name}{_format_labels(("key",), (key,))} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,178 @@
+"""Versioned schema migrations, applied once per deploy instead of per worker.
+
+Run before starting gunicorn (the release step in render.yaml, the Docker
+CMD and docker-compose do this):
+
+    python migrations.py            # or: flask --app app db-upgrade
+
+Applied versions are recorded in `schema_migrations`. A worker only reads
+the highest applied version on boot (one query) and warns if the database
+is behind; AUTO_MIGRATE=true makes it upgrade instead, which is handy for a
+single local process but should stay off under gunicorn.
+
+Step 2 creates missing tables from the current models, so a fresh database
+gets later columns straight away; every step must therefore be idempotent
+and check before it alters.
+"""
+import logging
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db, User, Transcript, TranscriptChunk, TranscriptSegment, Job, SchemaMigration
+import archive
+import retrieval
+import search
+import segments
+
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '').lower() in ('1', 'true', 'yes')
+
+log = logging.getLogger(__name__)
+security_log = logging.getLogger('security')
+
+
+def _add_columns(table, columns):
+    """ALTER TABLE ... ADD COLUMN for each (name, ddl) the table lacks"""
+    inspector = inspect(db.engine)
+    if table not in inspector.get_table_names():
+        return
+    existing = {col['name'] for col in inspector.get_columns(table)}
+    with db.engine.begin() as conn:
+        for name, ddl in columns:
+            if name not in existing:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+                log.info("Added %s.%s", table, name)
+
+
+def _user_reset_columns():
+    _add_columns('users', [('reset_token', 'VARCHAR(255)'), ('reset_token_expiry', 'TIMESTAMP')])
+
+
+def _create_tables():
+    db.create_all()
+
+
+def _job_columns():
+    _add_columns('jobs', [
+        ('batch_id', 'VARCHAR(32) REFERENCES batches(id)'),
+        ('position', 'INTEGER'),
+        ('queue_position', 'INTEGER')
+    ])
+
+
+def _indexes():
+    # create_all skips indexes on tables that already existed; indexes on
+    # columns added by a later step are created by that step
+    inspector = inspect(db.engine)
+    for index in list(Transcript.__table__.indexes) + list(Job.__table__.indexes):
+        existing = {col['name'] for col in inspector.get_columns(index.table.name)}
+        if all(column.name in existing for column in index.columns):
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def _search_index():
+    search.ensure_index()
+
+
+def _transcript_chunks():
+    TranscriptChunk.__table__.create(bind=db.engine, checkfirst=True)
+    log.info("Chunked %s transcripts for chat retrieval", retrieval.backfill())
+
+
+def _transcript_segments():
+    TranscriptSegment.__table__.create(bind=db.engine, checkfirst=True)
+    log.info("Segmented %s transcripts for range reads", segments.backfill())
+
+
+def _transcript_video_ids():
+    _add_columns('transcripts', [('video_id', 'VARCHAR(20)')])
+    log.info("Filled video_id for %s transcripts", archive.backfill_video_ids())
+    for index in Transcript.__table__.indexes:
+        if index.name == 'ix_transcripts_user_id_video_id':
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def _default_user():
+    # Seed a default user so Render deployments always have credentials
+    default_username = 'sos'
+    default_email = 'sos@example.com'
+    default_password = 'Ghgh@0011'
+
+    existing_user = User.query.filter(
+        (User.username == default_username) | (User.email == default_email)
+    ).first()
+    if existing_user:
+        log.info("Default user already exists: %s", existing_user.username)
+        return
+
+    user = User(username=default_username, email=default_email)
+    user.set_password(default_password)
+    db.session.add(user)
+    db.session.commit()
+    security_log.info('Created default user sos for initial access')
+
+
+# (version, name, step) in order; never renumber or edit an applied step
+MIGRATIONS = [
+    (1, 'users password reset columns', _user_reset_columns),
+    (2, 'create tables', _create_tables),
+    (3, 'job batch and queue columns', _job_columns),
+    (4, 'transcript and job indexes', _indexes),
+    (5, 'full-text search index', _search_index),
+    (6, 'default user', _default_user),
+    (7, 'transcript chunks for chat retrieval', _transcript_chunks),
+    (8, 'transcript segments for range reads', _transcript_segments),
+    (9, 'transcript video ids for archive imports', _transcript_video_ids),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version():
+    """Highest applied version, or 0 for a database that was never migrated"""
+    try:
+        return db.session.query(db.func.max(SchemaMigration.version)).scalar() or 0
+    except Exception:
+        db.session.rollback()
+        return 0
+
+
+def upgrade():
+    """Apply pending migrations in order; returns the versions applied"""
+    SchemaMigration.__table__.create(bind=db.engine, checkfirst=True)
+    version = current_version()
+    applied = []
+    for number, name, step in MIGRATIONS:
+        if number <= version:
+            continue
+        started = time.monotonic()
+        step()
+        db.session.add(SchemaMigration(version=number, name=name, applied_at=datetime.utcnow()))
+        db.session.commit()
+        log.info("Applied migration %s (%s) in %.2fs", number, name, time.monotonic() - started)
+        applied.append(number)
+    return applied
+
+
+def check():
+    """Worker boot: one version query; upgrade only when AUTO_MIGRATE is set"""
+    version = current_version()
+    if version >= LATEST_VERSION:
+        return version
+    if AUTO_MIGRATE:
+        upgrade()
+        return LATEST_VERSION
+    log.warning(
+        "Database schema is at version %s of %s; run `python migrations.py` before starting workers",
+        version, LATEST_VERSION
+    )
+    return version
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        applied = upgrade()
+        print(f"Applied migrations: {applied}" if applied else f"Schema is up to date (version {LATEST_VERSION})")
@@ -2,8 +2,39 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import base64
+import zlib
 
-db = SQLAlchemy()
+from database import RoutingSession
+
+# Sessions route reads to the replica in views that opt in (see database.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Values stored by CompressedText start with this marker; anything else is plain text
+COMPRESSED_MARKER = '\x1fz1:'
+COMPRESS_MIN_LENGTH = 1024
+
+
+class CompressedText(db.TypeDecorator):
+    """Text column stored zlib-compressed (base64, behind a format marker).
+
+    The column stays TEXT in the database, so no migration is needed and rows
+    written before compression was enabled are returned unchanged.
+    """
+    impl = db.Text
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or len(value) < COMPRESS_MIN_LENGTH:
+            return value
+        packed = COMPRESSED_MARKER + base64.b64encode(zlib.compress(value.encode('utf-8'), 6)).decode('ascii')
+        # Only keep the compressed form when it actually saves space
+        return packed if len(packed) < len(value.encode('utf-8')) else value
+    
+    def process_result_value(self, value, dialect):
+        if value is None or not value.startswith(COMPRESSED_MARKER):
+            return value
+        return zlib.decompress(base64.b64decode(value[len(COMPRESSED_MARKER):])).decode('utf-8')
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -33,28 +64,250 @@ class User(UserMixin, db.Model):
 
 class Transcript(db.Model):
     __tablename__ = 'transcripts'
+    __table_args__ = (
+        # Serves the per-user, newest-first listings
+        db.Index('ix_transcripts_user_id_created_at', 'user_id', 'created_at'),
+        # Archive imports skip videos the user already has
+        db.Index('ix_transcripts_user_id_video_id', 'user_id', 'video_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     video_url = db.Column(db.String(500), nullable=False)
+    video_id = db.Column(db.String(20))  # YouTube ID parsed from video_url
     video_title = db.Column(db.String(500))
     introduction = db.Column(db.Text)
     summary = db.Column(db.Text)
-    main_points = db.Column(db.Text)
-    full_content = db.Column(db.Text)
+    main_points = db.Column(CompressedText)
+    full_content = db.Column(CompressedText)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # API field name -> column attribute, for to_dict and ?fields= projections
+    API_FIELDS = {
+        'id': 'id',
+        'video_url': 'video_url',
+        'videoTitle': 'video_title',
+        'introduction': 'introduction',
+        'summary': 'summary',
+        'mainPoints': 'main_points',
+        'fullContent': 'full_content',
+        'created_at': 'created_at'
+    }
+    
+    def to_dict(self, fields=None):
+        result = {}
+        for name in fields or self.API_FIELDS:
+            value = getattr(self, self.API_FIELDS[name])
+            if name == 'created_at':
+                value = value.strftime('%Y-%m-%d %H:%M:%S')
+            result[name] = value
+        return result
+    
+    def __repr__(self):
+        return f'<Transcript {self.video_title}>'
+
+
+class SchemaMigration(db.Model):
+    """A schema migration applied by migrations.upgrade()"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version} {self.name}>'
+
+
+class TranscriptChunk(db.Model):
+    """A passage of a transcript's full_content, indexed for chat retrieval"""
+    __tablename__ = 'transcript_chunks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    transcript_id = db.Column(db.Integer, db.ForeignKey('transcripts.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    # The passage is full_content[char_offset:char_offset + char_length]
+    char_offset = db.Column(db.Integer, nullable=False)
+    char_length = db.Column(db.Integer, nullable=False)
+    token_count = db.Column(db.Integer, nullable=False)
+    # Normalized term -> frequency in this chunk, for BM25 scoring
+    terms = db.Column(db.JSON, nullable=False)
+    length = db.Column(db.Integer, nullable=False)  # number of terms
+    
+    def __repr__(self):
+        return f'<TranscriptChunk {self.transcript_id}:{self.position}>'
+
+
+class TranscriptSegment(db.Model):
+    """A contiguous slice of a transcript's full_content, for range reads"""
+    __tablename__ = 'transcript_segments'
+    __table_args__ = (
+        db.UniqueConstraint('transcript_id', 'position', name='uq_transcript_segments_transcript_position'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    transcript_id = db.Column(db.Integer, db.ForeignKey('transcripts.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    char_offset = db.Column(db.Integer, nullable=False)  # where the segment starts in full_content
+    start_seconds = db.Column(db.Integer)  # video time, when the text carries timestamps
+    content = db.Column(CompressedText, nullable=False)
+    
     def to_dict(self):
         return {
+            'position': self.position,
+            'offset': self.char_offset,
+            'start': self.start_seconds,
+            'text': self.content
+        }
+    
+    def __repr__(self):
+        return f'<TranscriptSegment {self.transcript_id}:{self.position}>'
+
+
+class TranscriptCache(db.Model):
+    """Shared n8n result for a YouTube video, reused across users"""
+    __tablename__ = 'transcript_cache'
+    
+    video_id = db.Column(db.String(20), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    hit_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<TranscriptCache {self.video_id}>'
+
+
+class TranscriptLease(db.Model):
+    """Marks a video whose n8n workflow is currently running in some worker"""
+    __tablename__ = 'transcript_leases'
+    
+    video_id = db.Column(db.String(20), primary_key=True)
+    owner = db.Column(db.String(32), nullable=False)
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<TranscriptLease {self.video_id}>'
+
+
+class AdmissionSlot(db.Model):
+    """One of ADMISSION_SLOTS concurrent n8n calls allowed across all workers"""
+    __tablename__ = 'admission_slots'
+    
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    holder = db.Column(db.String(32))  # ticket id of the call using the slot
+    user_id = db.Column(db.Integer)
+    acquired_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<AdmissionSlot {self.slot} {self.holder or "free"}>'
+
+
+class AdmissionTicket(db.Model):
+    """A request waiting for an admission slot; kept alive by its waiter"""
+    __tablename__ = 'admission_tickets'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    weight = db.Column(db.Float, default=1.0, nullable=False)
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<AdmissionTicket {self.id} user={self.user_id}>'
+
+
+class Job(db.Model):
+    """Background transcript request submitted through /api/jobs"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    video_url = db.Column(db.String(500), nullable=False)
+    refresh = db.Column(db.Boolean, default=False, nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, failed
+    stage = db.Column(db.String(20), default='queued', nullable=False)
+    error = db.Column(db.Text)
+    transcript_id = db.Column(db.Integer, db.ForeignKey('transcripts.id'), nullable=True)
+    batch_id = db.Column(db.String(32), db.ForeignKey('batches.id'), nullable=True, index=True)
+    position = db.Column(db.Integer)  # order within the batch
+    queue_position = db.Column(db.Integer)  # place in the n8n admission queue while waiting
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    transcript = db.relationship('Transcript', lazy=True)
+    
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+    
+    def to_dict(self, include_result=True):
+        result = {
             'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
             'video_url': self.video_url,
-            'videoTitle': self.video_title,
-            'introduction': self.introduction,
-            'summary': self.summary,
-            'mainPoints': self.main_points,
-            'fullContent': self.full_content,
+            'error': self.error,
+            'transcript_id': self.transcript_id,
+            'batch_id': self.batch_id,
+            'position': self.position,
+            'queue_position': self.queue_position,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+        if include_result and self.status == 'done' and self.transcript:
+            result['result'] = self.transcript.to_dict()
+        return result
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.status}>'
+
+
+class Batch(db.Model):
+    """Several videos (a URL list or an expanded playlist) submitted together"""
+    __tablename__ = 'batches'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    source_url = db.Column(db.String(500))  # the playlist, when expanded from one
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    items = db.relationship('Job', lazy=True, order_by='Job.position')
+    
+    def progress(self):
+        """Aggregate counts over the batch's items"""
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        for item in self.items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+        total = len(self.items)
+        finished = counts['done'] + counts['failed']
+        return {
+            'total': total,
+            'finished': finished,
+            'percent': round(100 * finished / total) if total else 100,
+            **counts
+        }
+    
+    @property
+    def is_finished(self):
+        return all(item.is_finished for item in self.items)
+    
+    def to_dict(self, include_items=True):
+        result = {
+            'id': self.id,
+            'status': 'done' if self.is_finished else 'running',
+            'source_url': self.source_url,
+            'progress': self.progress(),
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
         }
+        if include_items:
+            result['items'] = [item.to_dict(include_result=False) for item in self.items]
+        return result
     
     def __repr__(self):
-        return f'<Transcript {self.video_title}>'
+        return f'<Batch {self.id} ({len(self.items)} items)>'
+
@@ -0,0 +1,79 @@
+"""Keyset (cursor) pagination and field projection for transcript listings.
+
+Pages are ordered newest first by (created_at, id) and continue from an
+opaque cursor naming the last row seen, so deep pages cost the same as the
+first one and rows inserted meanwhile never shift the page boundaries.
+"""
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+
+from models import Transcript
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(transcript):
+    raw = f'{transcript.created_at.isoformat()}|{transcript.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Return (created_at, id) from a cursor, None for no cursor; ValueError if malformed"""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, transcript_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(transcript_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE):
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def parse_fields(value):
+    """Parse ?fields=a,b into a list of API field names; None means all.
+
+    `id` is always included so clients can fetch the full transcript later.
+    """
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in Transcript.API_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(Transcript.API_FIELDS)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def project(query, fields):
+    """Load only the columns behind the requested API fields (plus the keyset columns)"""
+    names = {'id', 'created_at'}
+    names.update(Transcript.API_FIELDS[f] for f in (fields or Transcript.API_FIELDS))
+    return query.options(load_only(*[getattr(Transcript, n) for n in sorted(names)]))
+
+
+def transcript_page(query, limit, cursor=None):
+    """Return (rows, next_cursor) for one page of a Transcript query"""
+    if cursor:
+        created_at, transcript_id = cursor
+        query = query.filter(or_(
+            Transcript.created_at < created_at,
+            and_(Transcript.created_at == created_at, Transcript.id < transcript_id)
+        ))
+    rows = query.order_by(Transcript.created_at.desc(), Transcript.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
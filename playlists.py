@@ -0,0 +1,150 @@
+"""Expand playlist URLs into video URLs for batch submission.
+
+The resolver is pluggable so batches can be exercised offline:
+
+* PLAYLIST_RESOLVER="module:function" names any callable taking a playlist
+  URL and returning video IDs or URLs; set_resolver() does the same in code
+* playlists:stub_resolver reads PLAYLIST_STUB_FILE, a JSON object mapping
+  playlist IDs to video IDs
+* the default uses the YouTube Data API when YOUTUBE_API_KEY is set, and
+  otherwise reads the video IDs embedded in the public playlist page
+"""
+import importlib
+import json
+import logging
+import os
+import re
+from urllib.parse import urlparse, parse_qs
+
+import upstream
+
+log = logging.getLogger(__name__)
+
+PLAYLIST_RESOLVER = os.environ.get('PLAYLIST_RESOLVER')
+PLAYLIST_STUB_FILE = os.environ.get('PLAYLIST_STUB_FILE')
+PLAYLIST_TIMEOUT = float(os.environ.get('PLAYLIST_TIMEOUT', 20))
+YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY')
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 50))
+
+YOUTUBE_API_URL = 'https://www.googleapis.com/youtube/v3/playlistItems'
+YOUTUBE_PLAYLIST_PAGE = 'https://www.youtube.com/playlist'
+
+_VIDEO_ID_RE = re.compile(r'^[\w-]{11}$')
+_PAGE_VIDEO_RE = re.compile(r'"playlistVideoRenderer":\{"videoId":"([\w-]{11})"')
+
+_resolver = None
+
+
+class PlaylistError(Exception):
+    """Raised when a playlist cannot be expanded"""
+
+
+class PlaylistTooLongError(PlaylistError):
+    """Raised when a playlist has more than BATCH_MAX_ITEMS videos"""
+
+
+def playlist_id(url):
+    """The list= parameter of a YouTube URL, or None"""
+    values = parse_qs(urlparse(url or '').query).get('list')
+    return values[0] if values else None
+
+
+def is_playlist_url(url):
+    """True for /playlist?list=... links (a watch?v=...&list=... link is one video)"""
+    parsed = urlparse(url or '')
+    return parsed.path.rstrip('/') == '/playlist' and playlist_id(url) is not None
+
+
+def video_url(value):
+    """Turn a bare video ID into a watch URL; URLs pass through"""
+    if _VIDEO_ID_RE.match(value):
+        return f'https://www.youtube.com/watch?v={value}'
+    return value
+
+
+def youtube_api_resolver(url):
+    video_ids = []
+    params = {'part': 'contentDetails', 'maxResults': 50, 'playlistId': playlist_id(url), 'key': YOUTUBE_API_KEY}
+    # One past the cap is enough to tell the playlist is too long
+    while len(video_ids) <= BATCH_MAX_ITEMS:
+        response = upstream.client.get(YOUTUBE_API_URL, read_timeout=PLAYLIST_TIMEOUT, params=params)
+        if response.status_code != 200:
+            raise PlaylistError(f'YouTube API returned {response.status_code}')
+        data = response.json()
+        video_ids += [item['contentDetails']['videoId'] for item in data.get('items', [])]
+        if not data.get('nextPageToken'):
+            break
+        params['pageToken'] = data['nextPageToken']
+    return video_ids
+
+
+def youtube_page_resolver(url):
+    # Only the first page of the playlist (about 100 videos) is embedded in the HTML
+    response = upstream.client.get(
+        YOUTUBE_PLAYLIST_PAGE,
+        read_timeout=PLAYLIST_TIMEOUT,
+        params={'list': playlist_id(url)},
+        headers={'Accept-Language': 'en'}
+    )
+    if response.status_code != 200:
+        raise PlaylistError(f'YouTube returned {response.status_code}')
+    return _PAGE_VIDEO_RE.findall(response.text)
+
+
+def default_resolver(url):
+    if YOUTUBE_API_KEY:
+        return youtube_api_resolver(url)
+    return youtube_page_resolver(url)
+
+
+def stub_resolver(url):
+    """Offline resolver backed by PLAYLIST_STUB_FILE"""
+    if not PLAYLIST_STUB_FILE:
+        raise PlaylistError('PLAYLIST_STUB_FILE is not set')
+    with open(PLAYLIST_STUB_FILE, encoding='utf-8') as f:
+        playlists = json.load(f)
+    return playlists.get(playlist_id(url), [])
+
+
+def set_resolver(resolver):
+    global _resolver
+    _resolver = resolver
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        if PLAYLIST_RESOLVER:
+            module_name, _, attr = PLAYLIST_RESOLVER.partition(':')
+            _resolver = getattr(importlib.import_module(module_name), attr)
+        else:
+            _resolver = default_resolver
+    return _resolver
+
+
+def resolve(url):
+    """Return the playlist's video URLs, de-duplicated.
+
+    Raises PlaylistTooLongError for more than BATCH_MAX_ITEMS videos rather
+    than quietly submitting only the first ones.
+    """
+    if not playlist_id(url):
+        raise PlaylistError('Not a playlist URL')
+    try:
+        items = get_resolver()(url)
+    except PlaylistError:
+        raise
+    except upstream.CircuitOpenError:
+        raise PlaylistError('YouTube is temporarily unavailable')
+    except Exception as e:
+        log.warning("Playlist resolve error for %s: %s: %s", url, type(e).__name__, e)
+        raise PlaylistError('Could not read the playlist')
+
+    urls = []
+    for item in items:
+        item = video_url(str(item).strip())
+        if item and item not in urls:
+            urls.append(item)
+    if len(urls) > BATCH_MAX_ITEMS:
+        raise PlaylistTooLongError(f'The playlist has more than {BATCH_MAX_ITEMS} videos')
+    return urls
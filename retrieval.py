@@ -0,0 +1,205 @@
+"""Transcript-grounded chat context.
+
+When a transcript is saved its full_content is split once into passages of
+about CHAT_CHUNK_TOKENS tokens, stored in `transcript_chunks` as character
+ranges of full_content together with their normalized term frequencies (the
+same Arabic-aware normalization as full-text search); the passage text is
+read from the transcript's segments when a chat turn needs it rather than
+stored twice.
+For a chat turn about a transcript, the passages are ranked against the
+message with BM25 over that transcript's chunks and the best ones are sent
+upstream, up to CHAT_CONTEXT_TOKENS, instead of leaving the n8n workflow to
+re-read an hour-long transcript.
+
+Token counts are estimated at four characters per token; n8n's model
+tokenizer is not available here.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+from sqlalchemy import event, insert
+
+from models import db, Transcript, TranscriptChunk
+import search
+import segments
+
+CHAT_CHUNK_TOKENS = int(os.environ.get('CHAT_CHUNK_TOKENS', 200))
+CHAT_CONTEXT_TOKENS = int(os.environ.get('CHAT_CONTEXT_TOKENS', 1200))
+CHAT_TOP_K = int(os.environ.get('CHAT_TOP_K', 6))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?؟])\s+|\n+')
+_WORD_RE = re.compile(r'\S+')
+
+
+def estimate_tokens(value):
+    return max(1, len(value) // 4)
+
+
+def _sentences(value):
+    """(start, end) of each non-blank sentence of value, surrounding whitespace trimmed"""
+    start = 0
+    for match in [*_SENTENCE_RE.finditer(value), None]:
+        end = match.start() if match else len(value)
+        text = value[start:end]
+        if text.strip():
+            yield start + len(text) - len(text.lstrip()), end - len(text) + len(text.rstrip())
+        if match:
+            start = match.end()
+
+
+def split_chunks(value, max_tokens=CHAT_CHUNK_TOKENS):
+    """Split text into passages of at most max_tokens, on sentence breaks where possible.
+
+    Returns (start, end) character ranges of value, in order.
+    """
+    value = value or ''
+    chunks = []
+    current = None
+
+    for start, end in _sentences(value):
+        tokens = estimate_tokens(value[start:end])
+        if tokens > max_tokens:
+            # A run-on sentence (common in auto transcripts): cut it by words
+            if current:
+                chunks.append(current)
+                current = None
+            words = [match.span() for match in _WORD_RE.finditer(value[start:end])]
+            step = max(1, len(words) * max_tokens // tokens)
+            for first in range(0, len(words), step):
+                last = words[min(first + step, len(words)) - 1]
+                chunks.append((start + words[first][0], start + last[1]))
+            continue
+        if current and estimate_tokens(value[current[0]:end]) > max_tokens:
+            chunks.append(current)
+            current = None
+        current = (current[0] if current else start, end)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_rows(transcript_id, full_content):
+    rows = []
+    for position, (start, end) in enumerate(split_chunks(full_content)):
+        content = full_content[start:end]
+        terms = search.tokenize(content)
+        rows.append({
+            'transcript_id': transcript_id,
+            'position': position,
+            'char_offset': start,
+            'char_length': end - start,
+            'token_count': estimate_tokens(content),
+            'terms': dict(Counter(terms)),
+            'length': len(terms)
+        })
+    return rows
+
+
+def _write_chunks(conn, transcript_id, full_content):
+    conn.execute(TranscriptChunk.__table__.delete().where(TranscriptChunk.transcript_id == transcript_id))
+    rows = chunk_rows(transcript_id, full_content)
+    if rows:
+        conn.execute(insert(TranscriptChunk.__table__), rows)
+    return len(rows)
+
+
+@event.listens_for(Transcript, 'after_insert')
+def _chunk_new_transcript(mapper, connection, target):
+    _write_chunks(connection, target.id, target.full_content)
+
+
+@event.listens_for(Transcript, 'after_update')
+def _rechunk_transcript(mapper, connection, target):
+    if db.inspect(target).attrs.full_content.history.has_changes():
+        _write_chunks(connection, target.id, target.full_content)
+
+
+@event.listens_for(Transcript, 'before_delete')
+def _drop_chunks(mapper, connection, target):
+    # Before, not after: the chunks reference the row through a foreign key
+    connection.execute(TranscriptChunk.__table__.delete().where(TranscriptChunk.transcript_id == target.id))
+
+
+def backfill(batch_size=100):
+    """Chunk every transcript that has no chunks yet; returns how many were chunked"""
+    chunked = db.select(TranscriptChunk.transcript_id)
+    count = 0
+    while True:
+        rows = db.session.query(Transcript.id, Transcript.full_content).filter(
+            Transcript.full_content.isnot(None),
+            Transcript.id.notin_(chunked)
+        ).order_by(Transcript.id).limit(batch_size).all()
+        if not rows:
+            return count
+        with db.engine.begin() as conn:
+            for row in rows:
+                if not _write_chunks(conn, row.id, row.full_content):
+                    # Nothing to index; a placeholder keeps it out of the next batch
+                    conn.execute(insert(TranscriptChunk.__table__), [{
+                        'transcript_id': row.id, 'position': 0, 'char_offset': 0, 'char_length': 0,
+                        'token_count': 0, 'terms': {}, 'length': 0
+                    }])
+        count += len(rows)
+
+
+def _bm25(query_terms, chunks):
+    """Score each (id, terms, length) chunk against the query, Okapi BM25"""
+    total = len(chunks)
+    average_length = sum(chunk.length for chunk in chunks) / total or 1
+    document_frequency = Counter()
+    for chunk in chunks:
+        document_frequency.update(term for term in set(query_terms) if term in chunk.terms)
+
+    scores = {}
+    for chunk in chunks:
+        score = 0.0
+        for term in query_terms:
+            frequency = chunk.terms.get(term)
+            if not frequency:
+                continue
+            idf = math.log(1 + (total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / average_length)
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        scores[chunk.id] = score
+    return scores
+
+
+def select_context(transcript_id, message, top_k=CHAT_TOP_K, max_tokens=CHAT_CONTEXT_TOKENS):
+    """The transcript passages most relevant to message, in transcript order.
+
+    Falls back to the opening passages when no term of the message matches.
+    """
+    chunks = db.session.query(
+        TranscriptChunk.id, TranscriptChunk.position, TranscriptChunk.char_offset, TranscriptChunk.char_length,
+        TranscriptChunk.token_count, TranscriptChunk.terms, TranscriptChunk.length
+    ).filter(TranscriptChunk.transcript_id == transcript_id, TranscriptChunk.length > 0).all()
+    if not chunks:
+        return []
+
+    scores = _bm25(search.tokenize(message), chunks)
+    if any(scores.values()):
+        ranked = sorted((c for c in chunks if scores[c.id] > 0), key=lambda c: (-scores[c.id], c.position))
+    else:
+        ranked = sorted(chunks, key=lambda c: c.position)
+
+    chosen = []
+    budget = max_tokens
+    for chunk in ranked:
+        if len(chosen) >= top_k:
+            break
+        if chunk.token_count > budget:
+            continue
+        chosen.append(chunk)
+        budget -= chunk.token_count
+
+    # Read through the segments, so only the few that hold these passages are decompressed
+    contents = segments.read_ranges(transcript_id, [(chunk.char_offset, chunk.char_length) for chunk in chosen])
+    passages = [
+        {'position': chunk.position, 'content': content, 'score': round(scores[chunk.id], 3)}
+        for chunk, content in zip(chosen, contents)
+    ]
+    return sorted(passages, key=lambda p: p['position'])
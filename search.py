@@ -0,0 +1,420 @@
+"""Full-text search over a user's transcripts.
+
+The index lives in its own `transcript_search` table, kept in step with
+`transcripts` by mapper events so every insert made by get_transcript (or a
+job) is searchable as soon as it commits. It holds only the index, never a
+copy of the text:
+
+* SQLite: a contentless FTS5 table (content='') ranked with bm25()
+* PostgreSQL: a weighted tsvector per transcript with a GIN index, ranked
+  with ts_rank_cd()
+
+Text is normalized in Python before indexing and querying, so Arabic words
+match whether or not they carry tashkeel or tatweel, and regardless of the
+hamza form of alef or the dotless final ya. Common proclitics (the article
+ال and و/ف/ب/ك/ل) are split off into words of their own, so "ذكاء" finds
+"والذكاء".
+
+The normalized form is only ever matched against. Snippets are cut from the
+original columns of the returned rows, so users see the text as it was
+written, with the words that matched highlighted. full_content is only read
+when the title, summary and main points have no match, and then only
+SNIPPET_SCAN_CHARS of it around the first place a term can occur.
+"""
+import html
+import logging
+import os
+import re
+import unicodedata
+
+from sqlalchemy import event, select, text
+
+from models import db, Transcript
+
+log = logging.getLogger(__name__)
+
+SEARCH_PG_CONFIG = os.environ.get('SEARCH_PG_CONFIG', 'simple')
+SEARCH_MAX_TERMS = 10
+SEARCH_MAX_LIMIT = 50
+SNIPPET_WORDS = 24
+SNIPPET_SCAN_CHARS = 2000
+SNIPPET_LEAD_CHARS = 200  # context kept before the first candidate in full_content
+
+FIELDS = ('video_title', 'summary', 'main_points', 'full_content')
+SHORT_FIELDS = FIELDS[:-1]
+
+# Alef variants and alef maksura fold to plain letters; tatweel and tashkeel are dropped
+_ARABIC_FOLD = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي',
+    'ـ': None, 'ً': None, 'ٌ': None, 'ٍ': None, 'َ': None,
+    'ُ': None, 'ِ': None, 'ّ': None, 'ْ': None, 'ٰ': None
+})
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+_ARABIC_WORD_RE = re.compile(r'[\u0621-\u064A]+')
+# A word as written: tashkeel and tatweel are not \w, but belong to the word
+_SOURCE_WORD_RE = re.compile(r'[\w\u0640\u064B-\u0652\u0670]+', re.UNICODE)
+# What a folded letter may have been written as, for locating terms in raw text
+_LETTER_VARIANTS = {'ا': 'اأإآٱ', 'ي': 'يى'}
+_WRITTEN_MARKS = '[\u0640\u064B-\u0652\u0670]*'
+# (prefix, shortest stem it may leave), longest prefixes first
+_PROCLITICS = (
+    ('وال', 2), ('فال', 2), ('بال', 2), ('كال', 2), ('لل', 2), ('ال', 2),
+    ('و', 4), ('ف', 4), ('ب', 4), ('ك', 4), ('ل', 4)
+)
+
+# Snippet markers that cannot appear in transcripts, swapped for <mark> after escaping
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+_enabled = None  # unknown until this worker first touches the index
+
+
+def _split_proclitic(word):
+    for prefix, min_stem in _PROCLITICS:
+        if word.startswith(prefix) and len(word) - len(prefix) >= min_stem:
+            return prefix, word[len(prefix):]
+    return '', word
+
+
+def _mark_proclitic(match):
+    prefix, stem = _split_proclitic(match.group(0))
+    return f'{prefix} {stem}' if prefix else stem
+
+
+def normalize(value):
+    """Fold Arabic letter variants and split proclitics for indexing"""
+    return _ARABIC_WORD_RE.sub(_mark_proclitic, (value or '').translate(_ARABIC_FOLD))
+
+
+def tokenize(value):
+    """Every normalized term of a text, with Arabic proclitics dropped"""
+    return [_split_proclitic(term)[1] for term in _TERM_RE.findall((value or '').translate(_ARABIC_FOLD).lower())]
+
+
+def query_terms(q):
+    """Normalized search terms, with Arabic proclitics dropped"""
+    return tokenize(q)[:SEARCH_MAX_TERMS]
+
+
+def _dialect(bind):
+    return bind.dialect.name
+
+
+def _index_exists(conn):
+    dialect = _dialect(conn)
+    if dialect == 'sqlite':
+        return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'transcript_search'")).first() is not None
+    if dialect == 'postgresql':
+        return conn.execute(text("SELECT to_regclass('transcript_search')")).scalar() is not None
+    return False
+
+
+def _is_enabled(conn):
+    # Checked lazily, so worker startup never has to look for the index
+    global _enabled
+    if _enabled is None:
+        _enabled = _index_exists(conn)
+    return _enabled
+
+
+def _pg_config():
+    if not re.match(r'^[a-z_]+$', SEARCH_PG_CONFIG):
+        raise ValueError(f'Invalid SEARCH_PG_CONFIG: {SEARCH_PG_CONFIG}')
+    return SEARCH_PG_CONFIG
+
+
+def ensure_index():
+    """Create the search table if missing and backfill it from transcripts.
+
+    Run by the migrations; workers find the table on first use. Errors
+    propagate, so a failed build is never recorded as an applied migration.
+    """
+    global _enabled
+    try:
+        with db.engine.begin() as conn:
+            dialect = _dialect(conn)
+            if dialect not in ('sqlite', 'postgresql'):
+                log.warning("Full-text search is not supported on %s", dialect)
+                return
+            exists = _index_exists(conn)
+            if not exists and dialect == 'sqlite':
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE transcript_search USING fts5("
+                    "video_title, summary, main_points, full_content, content='', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                ))
+            elif not exists:
+                _pg_config()
+                conn.execute(text(
+                    "CREATE TABLE transcript_search ("
+                    "transcript_id INTEGER PRIMARY KEY REFERENCES transcripts(id) ON DELETE CASCADE, "
+                    "user_id INTEGER NOT NULL, "
+                    "document tsvector NOT NULL)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX ix_transcript_search_document ON transcript_search USING GIN (document)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX ix_transcript_search_user_id ON transcript_search (user_id)"
+                ))
+
+            _enabled = True
+            if not exists:
+                log.info("Built search index for %s transcripts", rebuild(conn))
+    except Exception:
+        # The transaction rolled back; look for the table again on next use
+        _enabled = None
+        raise
+
+
+def rebuild(conn, batch_size=200):
+    """Index every transcript; returns the number of rows indexed"""
+    if _dialect(conn) == 'sqlite':
+        # A contentless table cannot be DELETEd from, only cleared as a whole
+        conn.execute(text("INSERT INTO transcript_search (transcript_search) VALUES ('delete-all')"))
+    else:
+        conn.execute(text('DELETE FROM transcript_search'))
+    rows = conn.execution_options(yield_per=batch_size).execute(
+        select(Transcript.id, Transcript.user_id, *[getattr(Transcript, f) for f in FIELDS])
+    )
+    count = 0
+    for row in rows:
+        _write(conn, row.id, row.user_id, {f: getattr(row, f) for f in FIELDS})
+        count += 1
+    return count
+
+
+def _write(conn, transcript_id, user_id, values):
+    params = {f: normalize(values.get(f)) for f in FIELDS}
+    params.update(transcript_id=transcript_id, user_id=user_id)
+
+    if _dialect(conn) == 'sqlite':
+        conn.execute(text(
+            f"INSERT INTO transcript_search (rowid, {', '.join(FIELDS)}) "
+            f"VALUES (:transcript_id, {', '.join(f':{f}' for f in FIELDS)})"
+        ), params)
+    else:
+        config = _pg_config()
+        document = ' || '.join(
+            f"setweight(to_tsvector('{config}'::regconfig, :{field}), '{weight}')"
+            for field, weight in zip(FIELDS, 'ABCD')
+        )
+        conn.execute(text(
+            'INSERT INTO transcript_search (transcript_id, user_id, document) '
+            f'VALUES (:transcript_id, :user_id, {document}) '
+            'ON CONFLICT (transcript_id) DO UPDATE SET user_id = EXCLUDED.user_id, document = EXCLUDED.document'
+        ), params)
+
+
+def _unindex(conn, transcript_id):
+    """Drop a transcript from the index; runs while its row still holds the indexed text"""
+    if _dialect(conn) != 'sqlite':
+        conn.execute(text('DELETE FROM transcript_search WHERE transcript_id = :id'), {'id': transcript_id})
+        return
+    # A contentless FTS5 table forgets a row by being handed the text it indexed
+    row = conn.execute(
+        select(*[getattr(Transcript, f) for f in FIELDS]).where(Transcript.id == transcript_id)
+    ).first()
+    if row is None:
+        return
+    params = {f: normalize(getattr(row, f)) for f in FIELDS}
+    params['transcript_id'] = transcript_id
+    conn.execute(text(
+        f"INSERT INTO transcript_search (transcript_search, rowid, {', '.join(FIELDS)}) "
+        f"VALUES ('delete', :transcript_id, {', '.join(f':{f}' for f in FIELDS)})"
+    ), params)
+
+
+def _fields_changed(target):
+    state = db.inspect(target)
+    return any(state.attrs[f].history.has_changes() for f in FIELDS)
+
+
+@event.listens_for(Transcript, 'after_insert')
+def _index_transcript(mapper, connection, target):
+    if _is_enabled(connection):
+        _write(connection, target.id, target.user_id, {f: getattr(target, f) for f in FIELDS})
+
+
+@event.listens_for(Transcript, 'before_update')
+def _unindex_changed_transcript(mapper, connection, target):
+    if _dialect(connection) == 'sqlite' and _is_enabled(connection) and _fields_changed(target):
+        _unindex(connection, target.id)
+
+
+@event.listens_for(Transcript, 'after_update')
+def _reindex_transcript(mapper, connection, target):
+    if _is_enabled(connection) and _fields_changed(target):
+        _write(connection, target.id, target.user_id, {f: getattr(target, f) for f in FIELDS})
+
+
+@event.listens_for(Transcript, 'before_delete')
+def _unindex_transcript(mapper, connection, target):
+    if _is_enabled(connection):
+        _unindex(connection, target.id)
+
+
+def _fold(word):
+    """A source word as its search terms, diacritics stripped as unicode61 does"""
+    decomposed = unicodedata.normalize('NFD', word)
+    return tokenize(''.join(c for c in decomposed if not unicodedata.combining(c)))
+
+
+def _matches(word, terms):
+    return any(token.startswith(term) for token in _fold(word) for term in terms)
+
+
+def _term_pattern(term):
+    """A loose regex for term as it may be written: any alef form, tashkeel between letters"""
+    return _WRITTEN_MARKS.join(
+        f'[{_LETTER_VARIANTS[c]}]' if c in _LETTER_VARIANTS else re.escape(c) for c in term
+    )
+
+
+def _word_start(value, pos):
+    while pos > 0 and not value[pos - 1].isspace():
+        pos -= 1
+    return pos
+
+
+def _scan_range(value, terms):
+    """(start, end) of the part of a long text worth scanning for a snippet.
+
+    A cheap regex finds the first place any term may occur; only the words
+    around it are folded and matched. Without a candidate, the opening.
+    """
+    locate = re.compile('|'.join(_term_pattern(term) for term in terms), re.IGNORECASE)
+    found = locate.search(value)
+    start = _word_start(value, max(0, found.start() - SNIPPET_LEAD_CHARS)) if found else 0
+    end = start + SNIPPET_SCAN_CHARS
+    if end >= len(value):
+        return start, len(value)
+    boundary = _word_start(value, end)
+    return start, boundary if boundary > start else end
+
+
+def _best_window(value, terms, start=0, end=None):
+    """(matched words, snippet with markers) for the densest SNIPPET_WORDS-word window of value[start:end]"""
+    end = len(value) if end is None else end
+    words = list(_SOURCE_WORD_RE.finditer(value, start, end))
+    if not words:
+        return 0, ''
+    hits = [_matches(word.group(0), terms) for word in words]
+    best_start, best_count, count = 0, 0, 0
+    for last in range(len(words)):
+        count += hits[last]
+        if last >= SNIPPET_WORDS:
+            count -= hits[last - SNIPPET_WORDS]
+        if count > best_count:
+            best_start, best_count = max(0, last - SNIPPET_WORDS + 1), count
+    if best_count:
+        # Open the window on its first match, with a little context before it
+        first_hit = hits.index(True, best_start)
+        best_start = max(0, min(first_hit - 3, len(words) - SNIPPET_WORDS))
+    window = range(best_start, min(best_start + SNIPPET_WORDS, len(words)))
+
+    pieces = ['…'] if best_start or start else []
+    for k in window:
+        word = words[k]
+        if k != window.start:
+            gap = value[words[k - 1].end():word.start()]
+            pieces.append(' ' if gap.isspace() else gap)
+        pieces.append(f'{_MARK_START}{word.group(0)}{_MARK_END}' if hits[k] else word.group(0))
+    if window.stop < len(words) or end < len(value):
+        pieces.append('…')
+    return best_count, ''.join(pieces)
+
+
+def _best_short(values, terms):
+    best = (0, '')
+    for field in SHORT_FIELDS:
+        if values.get(field):
+            candidate = _best_window(values[field], terms)
+            if candidate[0] > best[0] or not best[1]:
+                best = candidate
+    return best
+
+
+def snippet(values, terms):
+    """The passage of a transcript's original fields that best matches terms, marked up.
+
+    full_content is only looked at when none of the shorter fields match.
+    """
+    best = _best_short(values, terms)
+    content = values.get('full_content')
+    if not best[0] and content:
+        candidate = _best_window(content, terms, *_scan_range(content, terms))
+        if candidate[0] or not best[1]:
+            best = candidate
+    return best[1]
+
+
+def _render_snippet(raw):
+    escaped = html.escape(raw or '')
+    return escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search(user_id, q, limit=20, offset=0):
+    """Rank a user's transcripts against q; returns a list of result dicts"""
+    terms = query_terms(q)
+    if not terms or not _is_enabled(db.session.connection()):
+        return []
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+
+    if _dialect(db.engine) == 'sqlite':
+        # Quote every term so user input is never parsed as FTS5 syntax; * allows suffixes
+        match = ' '.join(f'"{term}"*' for term in terms)
+        ranked = db.session.execute(text(
+            "SELECT t.id, -bm25(transcript_search, 10.0, 4.0, 2.0, 1.0) AS score "
+            "FROM transcript_search JOIN transcripts t ON t.id = transcript_search.rowid "
+            "WHERE transcript_search MATCH :match AND t.user_id = :user_id "
+            "ORDER BY score DESC LIMIT :limit OFFSET :offset"
+        ), {'match': match, 'user_id': user_id, 'limit': limit, 'offset': offset}).all()
+    else:
+        config = _pg_config()
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        ranked = db.session.execute(text(
+            f"SELECT s.transcript_id AS id, ts_rank_cd(s.document, to_tsquery('{config}', :tsquery)) AS score "
+            "FROM transcript_search s "
+            f"WHERE s.user_id = :user_id AND s.document @@ to_tsquery('{config}', :tsquery) "
+            "ORDER BY score DESC LIMIT :limit OFFSET :offset"
+        ), {'tsquery': tsquery, 'user_id': user_id, 'limit': limit, 'offset': offset}).all()
+    if not ranked:
+        return []
+
+    # Snippets come from the stored text of just the returned rows; full_content
+    # (large, compressed) is only loaded for rows whose short fields do not match
+    rows = {row.id: row for row in db.session.query(
+        Transcript.id, Transcript.video_url, Transcript.created_at, *[getattr(Transcript, f) for f in SHORT_FIELDS]
+    ).filter(Transcript.id.in_([r.id for r in ranked]), Transcript.user_id == user_id)}
+
+    snippets = {}
+    unmatched = []
+    for row in rows.values():
+        count, raw = _best_short({f: getattr(row, f) for f in SHORT_FIELDS}, terms)
+        if count:
+            snippets[row.id] = raw
+        else:
+            unmatched.append(row.id)
+    if unmatched:
+        for id_, content in db.session.query(Transcript.id, Transcript.full_content).filter(
+            Transcript.id.in_(unmatched)
+        ):
+            row = rows[id_]
+            snippets[id_] = snippet({**{f: getattr(row, f) for f in SHORT_FIELDS}, 'full_content': content}, terms)
+
+    results = []
+    for id_, score in ranked:
+        row = rows.get(id_)
+        if row is None:
+            continue
+        results.append({
+            'id': row.id,
+            'video_url': row.video_url,
+            'videoTitle': row.video_title,
+            'created_at': row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else None,
+            'snippet': _render_snippet(snippets.get(id_)),
+            'score': round(float(score), 6)
+        })
+    return results
@@ -0,0 +1,195 @@
+"""Transcript content stored as ordered segments, for range reads.
+
+/api/transcript/<id> returns the whole full_content, which for a multi-hour
+lecture is hundreds of kilobytes while the page only shows the first screen.
+When a transcript is saved its content is also cut into segments of about
+TRANSCRIPT_SEGMENT_CHARS characters on line breaks, each with its character
+offset and, when it opens with a timestamp such as [01:02:03] or 12:34, the
+video time in seconds. /api/transcript/<id>/content serves them a page at a
+time (?offset=&limit=, or a `Range: segments=first-last` header) so the UI
+loads the rest as the reader scrolls.
+
+Segments joined in order are exactly full_content, which stays the copy that
+to_dict, search and exports read. Segment text is stored compressed like
+full_content, so the second copy costs little space, and read_ranges() lets
+chat retrieval pull a few passages without inflating the whole transcript.
+"""
+import os
+import re
+from bisect import bisect_right
+
+from sqlalchemy import event, insert
+
+from models import db, Transcript, TranscriptSegment
+
+TRANSCRIPT_SEGMENT_CHARS = int(os.environ.get('TRANSCRIPT_SEGMENT_CHARS', 4000))
+DEFAULT_SEGMENT_PAGE = 5
+MAX_SEGMENT_PAGE = 50
+
+_TIMESTAMP_RE = re.compile(r'^\s*[\[(]?(?:(\d{1,2}):)?(\d{1,2}):(\d{2})[\])]?(?=\s|$)')
+_RANGE_RE = re.compile(r'^segments=(\d*)-(\d*)$')
+
+
+def parse_timestamp(value):
+    """Seconds of a timestamp opening value, or None"""
+    match = _TIMESTAMP_RE.match(value)
+    if not match:
+        return None
+    hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _cut(line, max_chars):
+    """Split an over-long line at the last space before each max_chars boundary"""
+    pieces = []
+    while len(line) > max_chars:
+        cut = line.rfind(' ', 0, max_chars) + 1 or max_chars
+        pieces.append(line[:cut])
+        line = line[cut:]
+    if line:
+        pieces.append(line)
+    return pieces
+
+
+def split_segments(value, max_chars=TRANSCRIPT_SEGMENT_CHARS):
+    """[(offset, text)] covering value exactly, each text at most max_chars"""
+    segments = []
+    start = 0
+    current = ''
+    for line in (value or '').splitlines(keepends=True):
+        for piece in _cut(line, max_chars):
+            if current and len(current) + len(piece) > max_chars:
+                segments.append((start, current))
+                start += len(current)
+                current = ''
+            current += piece
+    if current:
+        segments.append((start, current))
+    return segments
+
+
+def segment_rows(transcript_id, full_content):
+    return [
+        {
+            'transcript_id': transcript_id,
+            'position': position,
+            'char_offset': offset,
+            'start_seconds': parse_timestamp(content),
+            'content': content
+        }
+        for position, (offset, content) in enumerate(split_segments(full_content))
+    ]
+
+
+def _write_segments(conn, transcript_id, full_content):
+    conn.execute(TranscriptSegment.__table__.delete().where(TranscriptSegment.transcript_id == transcript_id))
+    rows = segment_rows(transcript_id, full_content)
+    if rows:
+        conn.execute(insert(TranscriptSegment.__table__), rows)
+    return len(rows)
+
+
+@event.listens_for(Transcript, 'after_insert')
+def _segment_new_transcript(mapper, connection, target):
+    _write_segments(connection, target.id, target.full_content)
+
+
+@event.listens_for(Transcript, 'after_update')
+def _resegment_transcript(mapper, connection, target):
+    if db.inspect(target).attrs.full_content.history.has_changes():
+        _write_segments(connection, target.id, target.full_content)
+
+
+@event.listens_for(Transcript, 'before_delete')
+def _drop_segments(mapper, connection, target):
+    connection.execute(TranscriptSegment.__table__.delete().where(TranscriptSegment.transcript_id == target.id))
+
+
+def backfill(batch_size=100):
+    """Segment every transcript with content but no segments; returns how many"""
+    segmented = db.select(TranscriptSegment.transcript_id)
+    count = 0
+    while True:
+        rows = db.session.query(Transcript.id, Transcript.full_content).filter(
+            Transcript.full_content.isnot(None),
+            Transcript.full_content != '',
+            Transcript.id.notin_(segmented)
+        ).order_by(Transcript.id).limit(batch_size).all()
+        if not rows:
+            return count
+        with db.engine.begin() as conn:
+            for row in rows:
+                _write_segments(conn, row.id, row.full_content)
+        count += len(rows)
+
+
+def parse_range(header, total):
+    """(first, last) positions from a `segments=first-last` Range header.
+
+    None for no header or one that is malformed (ignored, as for bytes);
+    ValueError when no segment falls in it. Like byte ranges,
+    `segments=-n` means the last n and `segments=n-` the rest from n.
+    """
+    match = _RANGE_RE.match((header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        first, last = max(total - int(last), 0), total - 1
+    else:
+        first, last = int(first), min(int(last), total - 1) if last else total - 1
+    if first >= total or last < first:
+        raise ValueError('Range not satisfiable')
+    return first, last
+
+
+def page(transcript_id, first, count):
+    """The segments at positions first..first+count-1, in order"""
+    return TranscriptSegment.query.filter(
+        TranscriptSegment.transcript_id == transcript_id,
+        TranscriptSegment.position >= first,
+        TranscriptSegment.position < first + count
+    ).order_by(TranscriptSegment.position).all()
+
+
+def read_ranges(transcript_id, ranges):
+    """The text of full_content[offset:offset + length] for each (offset, length).
+
+    Only the segments the ranges fall in are loaded and decompressed.
+    """
+    starts = [row.char_offset for row in db.session.query(TranscriptSegment.char_offset).filter(
+        TranscriptSegment.transcript_id == transcript_id
+    ).order_by(TranscriptSegment.position)]
+    if not starts:
+        return ['' for _ in ranges]
+
+    spans = []
+    for offset, length in ranges:
+        first = max(bisect_right(starts, offset) - 1, 0)
+        last = max(bisect_right(starts, offset + length - 1) - 1, first)
+        spans.append((first, last))
+    needed = {position for first, last in spans for position in range(first, last + 1)}
+    contents = dict(db.session.query(TranscriptSegment.position, TranscriptSegment.content).filter(
+        TranscriptSegment.transcript_id == transcript_id,
+        TranscriptSegment.position.in_(needed)
+    ))
+
+    texts = []
+    for (offset, length), (first, last) in zip(ranges, spans):
+        joined = ''.join(contents.get(position, '') for position in range(first, last + 1))
+        start = offset - starts[first]
+        texts.append(joined[start:start + length])
+    return texts
+
+
+def summary(transcript_id):
+    """(segment count, content length in characters) of a transcript"""
+    # Segment text is compressed in the database, so its length is taken here
+    last = db.session.query(
+        TranscriptSegment.position, TranscriptSegment.char_offset, TranscriptSegment.content
+    ).filter(TranscriptSegment.transcript_id == transcript_id).order_by(
+        TranscriptSegment.position.desc()
+    ).first()
+    if last is None:
+        return 0, 0
+    return last[0] + 1, last[1] + len(last[2])
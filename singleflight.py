@@ -0,0 +1,169 @@
+"""Single-flight coalescing of identical upstream calls across workers.
+
+The first request for a key takes a lease row in `transcript_leases` and does
+the work; concurrent requests for the same key, in any gunicorn worker, wait
+for the lease to go away and read the leader's published result instead of
+starting their own n8n workflow. A leader extends its lease while it works
+(extend), so followers wait for as long as the lease stays live however long
+the workflow takes; a crashed worker stops extending, its lease expires and
+a follower takes over.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, TranscriptLease
+
+log = logging.getLogger(__name__)
+
+LEASE_SECONDS = int(os.environ.get('SINGLEFLIGHT_LEASE_SECONDS', 330))
+POLL_SECONDS = float(os.environ.get('SINGLEFLIGHT_POLL_SECONDS', 2.0))
+
+
+# Per-worker counters
+_stats_lock = threading.Lock()
+_stats = {'leader_calls': 0, 'coalesced': 0, 'takeovers': 0, 'errors': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def acquire(key):
+    """Take the lease for key; returns an owner token, or None if it is held"""
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=LEASE_SECONDS)
+
+    try:
+        db.session.add(TranscriptLease(video_id=key, owner=token, acquired_at=now, expires_at=expires))
+        db.session.commit()
+        return token
+    except IntegrityError:
+        db.session.rollback()
+
+    # Held by someone; take it over only if their lease has run out
+    taken = TranscriptLease.query.filter(
+        TranscriptLease.video_id == key,
+        TranscriptLease.expires_at < now
+    ).update({'owner': token, 'acquired_at': now, 'expires_at': expires}, synchronize_session=False)
+    db.session.commit()
+    if taken:
+        _count('takeovers')
+        return token
+    return None
+
+
+def release(key, token):
+    try:
+        TranscriptLease.query.filter_by(video_id=key, owner=token).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _count('errors')
+        log.warning("Single-flight release error for %s: %s", key, e)
+
+
+def extend(key):
+    """Push back the expiry of key's lease while its leader is still working"""
+    try:
+        TranscriptLease.query.filter_by(video_id=key).update(
+            {'expires_at': datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}, synchronize_session=False
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _count('errors')
+        log.warning("Single-flight extend error for %s: %s", key, e)
+
+
+@contextmanager
+def heartbeat(key):
+    """Keep extending key's lease for the duration of the block.
+
+    A background thread (a greenlet under gevent) extends it every third of
+    LEASE_SECONDS, so a leader blocked in a long upstream call keeps its lease
+    however long the call takes, and loses it soon after its worker dies.
+    """
+    app = current_app._get_current_object()
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(LEASE_SECONDS / 3):
+            with app.app_context():
+                extend(key)
+
+    extend(key)
+    thread = threading.Thread(target=beat, name=f'lease-{key}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def is_held(key):
+    now = datetime.utcnow()
+    return db.session.query(
+        TranscriptLease.query.filter(
+            TranscriptLease.video_id == key,
+            TranscriptLease.expires_at >= now
+        ).exists()
+    ).scalar()
+
+
+def run(key, compute, lookup, on_wait=None):
+    """Return compute() for key, run at most once at a time across workers.
+
+    lookup() must return the result published by a finished leader, or None.
+    It is checked right after taking the lease too, which closes the race
+    where a leader finishes between our cache miss and our acquire. There is
+    no fixed wait limit: the lease expiring is what tells a follower that its
+    leader has gone.
+    """
+    while True:
+        token = acquire(key)
+        if token:
+            try:
+                result = lookup()
+                if result is not None:
+                    _count('coalesced')
+                    return result
+                _count('leader_calls')
+                return compute()
+            finally:
+                release(key, token)
+
+        if on_wait:
+            on_wait()
+
+        while is_held(key):
+            # Don't keep a transaction open while sleeping
+            db.session.rollback()
+            time.sleep(POLL_SECONDS)
+
+            result = lookup()
+            if result is not None:
+                _count('coalesced')
+                return result
+
+        # The leader is gone; take over if it left no result behind
+        result = lookup()
+        if result is not None:
+            _count('coalesced')
+            return result
+
+
+def stats():
+    """Snapshot of this worker's counters; `coalesced` is upstream calls saved"""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,9 @@
+"""Server-Sent Events helpers shared by the streaming routes."""
+import json
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def format_event(event, payload):
+    """Encode one SSE frame with a JSON data line"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
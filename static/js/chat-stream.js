@@ -0,0 +1,72 @@
+/**
+ * إرسال رسائل الشات مع استقبال الرد تدريجياً
+ * Sends a chat message to /api/chat and reads the reply as Server-Sent Events,
+ * falling back to the buffered JSON reply when the server does not stream.
+ */
+
+/**
+ * @param {Object} payload - { message, sessionId }
+ * @param {Function} onToken - called with (token, textSoFar) as chunks arrive
+ * @returns {Promise<{ok: boolean, data: Object, streamed: boolean}>}
+ */
+async function streamChat(payload, onToken) {
+    const response = await fetch('/api/chat', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream, application/json'
+        },
+        body: JSON.stringify({ ...payload, stream: true })
+    });
+
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.includes('text/event-stream') || !response.body) {
+        const data = await response.json();
+        return { ok: response.ok, data: data, streamed: false };
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let final = null;
+    let error = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            const dataLines = [];
+            frame.split('\n').forEach((line) => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length === 0) continue;
+
+            const data = JSON.parse(dataLines.join('\n'));
+            if (event === 'token') {
+                text += data.content;
+                if (onToken) onToken(data.content, text);
+            } else if (event === 'done') {
+                final = data;
+            } else if (event === 'error') {
+                error = data;
+            }
+        }
+    }
+
+    if (error || !final) {
+        return { ok: false, data: error || { error: 'انقطع الاتصال بالشات بوت' }, streamed: text.length > 0 };
+    }
+    return { ok: true, data: final, streamed: text.length > 0 };
+}
@@ -0,0 +1,21 @@
+// Classes are collected from the live templates and scripts only, so the
+// bundle carries no CSS for index_backup.html or the retired pdf-export.js.
+const fs = require('fs');
+const path = require('path');
+
+const root = path.join(__dirname, '..');
+const templates = path.join(root, 'templates');
+
+module.exports = {
+  content: fs.readdirSync(templates)
+    .filter((name) => name.endsWith('.html') && name !== 'index_backup.html')
+    .map((name) => path.join(templates, name))
+    .concat([
+      path.join(root, 'static', 'js', 'chat-stream.js'),
+      path.join(root, 'static', 'js', 'pdf-export-new.js'),
+    ]),
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
@@ -0,0 +1,43 @@
+"""Shared fixtures: the app on a throwaway SQLite database, migrated once."""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# Module-level settings are read from the environment at import time
+_DB_DIR = tempfile.mkdtemp(prefix='youtubetotext-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ['RATELIMIT_ENABLED'] = 'false'
+os.environ.pop('DATABASE_REPLICA_URL', None)
+
+from app import app as flask_app  # noqa: E402
+from models import db, User  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        migrations.upgrade()
+    return flask_app
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+@pytest.fixture
+def make_user(ctx):
+    def make():
+        name = uuid.uuid4().hex[:12]
+        user = User(username=name, email=f'{name}@example.com')
+        user.set_password('correct horse battery')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import admission
+from admission import AdmissionRejected
+from models import db, AdmissionSlot, AdmissionTicket
+
+
+@pytest.fixture
+def slots(ctx, monkeypatch):
+    """Two empty slots, fast polling and no configured weights"""
+    AdmissionTicket.query.delete()
+    AdmissionSlot.query.delete()
+    db.session.commit()
+    monkeypatch.setattr(admission, 'ADMISSION_SLOTS', 2)
+    monkeypatch.setattr(admission, 'ADMISSION_POLL_SECONDS', 0.01)
+    monkeypatch.setattr(admission, 'ADMISSION_WEIGHTS', {})
+    monkeypatch.setattr(admission, '_slots_ready', False)
+    admission._ensure_slots()
+
+
+def hold(slot, user_id, expires_in=60):
+    AdmissionSlot.query.filter_by(slot=slot).update({
+        'holder': f'held-{slot}', 'user_id': user_id, 'acquired_at': datetime.utcnow(),
+        'expires_at': datetime.utcnow() + timedelta(seconds=expires_in)
+    })
+    db.session.commit()
+
+
+def enqueue(ticket_id, user_id, seconds_ago, weight=1.0):
+    now = datetime.utcnow()
+    db.session.add(AdmissionTicket(
+        id=ticket_id, user_id=user_id, weight=weight, enqueued_at=now - timedelta(seconds=seconds_ago),
+        expires_at=now + timedelta(seconds=60)
+    ))
+    db.session.commit()
+
+
+def test_parse_weights():
+    assert admission._parse_weights('7:4, 12:2,,bad,3:x,5:0') == {7: 4.0, 12: 2.0, 5: 0.01}
+    assert admission._parse_weights('') == {}
+
+
+def test_retry_after_grows_per_round_of_slots(monkeypatch):
+    monkeypatch.setattr(admission, 'ADMISSION_SLOTS', 2)
+    monkeypatch.setattr(admission, 'ADMISSION_ESTIMATE_SECONDS', 60)
+    assert [admission.retry_after(p) for p in (0, 1, 2, 3, 5)] == [60, 60, 60, 120, 180]
+
+
+def test_acquire_and_release(slots):
+    token = admission.acquire(1, max_wait=0)
+    assert AdmissionSlot.query.filter_by(holder=token).one().user_id == 1
+    assert AdmissionTicket.query.count() == 0
+    assert admission.stats()['in_use'] == 1
+
+    admission.release(token)
+    assert admission.stats()['in_use'] == 0
+
+
+def test_rejected_when_every_slot_is_busy(slots):
+    hold(0, 1)
+    hold(1, 2)
+    positions = []
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire(3, max_wait=0, on_wait=positions.append)
+    assert rejected.value.position == 1
+    assert rejected.value.retry_after == admission.retry_after(1)
+    assert positions == [1]
+    # The waiter's ticket does not outlive it
+    assert AdmissionTicket.query.count() == 0
+
+
+def test_expired_slots_are_reclaimed(slots):
+    hold(0, 1, expires_in=-1)
+    hold(1, 2)
+    token = admission.acquire(3, max_wait=0)
+    assert AdmissionSlot.query.filter_by(slot=0).one().holder == token
+
+
+def test_too_many_waiting_calls_are_rejected_without_queueing(slots, monkeypatch):
+    monkeypatch.setattr(admission, 'ADMISSION_USER_MAX_WAITING', 2)
+    enqueue('a1', 1, 2)
+    enqueue('a2', 1, 1)
+    positions = []
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire(1, max_wait=10, on_wait=positions.append)
+    assert rejected.value.position == 3
+    assert positions == []
+
+
+def test_position_favours_users_with_less_running(slots):
+    hold(0, 1)
+    hold(1, 1)
+    enqueue('first', 1, 10)
+    enqueue('second', 2, 5)
+    enqueue('third', 2, 1)
+    now = datetime.utcnow()
+    # User 2 has nothing running: both tickets rank ahead of user 1's older one
+    assert [admission._position(t, now) for t in ('second', 'third', 'first')] == [0, 1, 2]
+    assert admission._position('gone', now) is None
+
+
+def test_position_honours_weights(slots):
+    hold(0, 1)
+    hold(1, 1)
+    enqueue('heavy', 1, 10, weight=4.0)
+    enqueue('light', 2, 5)
+    assert admission._position('heavy', datetime.utcnow()) == 0
+
+
+def test_slot_is_released_when_the_call_fails(slots):
+    with pytest.raises(RuntimeError):
+        with admission.slot(1, max_wait=0):
+            assert admission.stats()['in_use'] == 1
+            raise RuntimeError('n8n failed')
+    assert admission.stats()['in_use'] == 0
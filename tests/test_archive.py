@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import archive
+from models import Transcript
+
+
+def lines(*records):
+    return [json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n' for record in records]
+
+
+HEADER = {'format': archive.ARCHIVE_FORMAT, 'version': archive.ARCHIVE_VERSION}
+
+
+def test_export_then_import_round_trip(make_user):
+    # Imports expunge the session, so hold on to plain ids
+    source, target = make_user().id, make_user().id
+    result = archive.import_lines(source, lines(
+        HEADER,
+        {'video_url': 'https://www.youtube.com/watch?v=hhhhhhhhhhh', 'videoTitle': 'أول درس',
+         'fullContent': 'نص ' * 1000, 'created_at': '2024-03-01 10:00:00'},
+        {'video_url': 'https://youtu.be/iiiiiiiiiii', 'summary': 'second'}
+    ))
+    assert result.to_dict() == {'imported': 2, 'duplicates': 0, 'errors': 0, 'error_samples': []}
+
+    exported = list(archive.export_lines(source))
+    assert json.loads(exported[0])['format'] == archive.ARCHIVE_FORMAT
+    assert archive.import_lines(target, exported).imported == 2
+
+    copied = Transcript.query.filter_by(user_id=target).order_by(Transcript.id).all()
+    assert [t.video_id for t in copied] == ['hhhhhhhhhhh', 'iiiiiiiiiii']
+    assert copied[0].full_content == 'نص ' * 1000
+    assert copied[0].created_at.strftime(archive.DATE_FORMAT) == '2024-03-01 10:00:00'
+
+
+def test_import_skips_duplicates_and_reports_bad_lines(make_user, monkeypatch):
+    monkeypatch.setattr(archive, 'ARCHIVE_BATCH_SIZE', 2)
+    user_id = make_user().id
+    archive.import_lines(user_id, lines({'video_url': 'https://youtu.be/jjjjjjjjjjj'}))
+
+    body = lines(
+        HEADER,
+        {'video_url': 'https://youtu.be/jjjjjjjjjjj'},
+        {'video_url': 'https://youtu.be/kkkkkkkkkkk'},
+        {'video_url': 'https://youtu.be/kkkkkkkkkkk'},
+        {'video_url': 'https://example.com/video'},
+        {'video_url': 'https://youtu.be/lllllllllll', 'summary': 5},
+        {'video_url': 'https://youtu.be/mmmmmmmmmmm', 'created_at': 'yesterday'}
+    ) + [b'not json\n', b'[1, 2]\n', b'\n']
+    result = archive.import_lines(user_id, body)
+
+    assert (result.imported, result.duplicates, result.errors) == (1, 2, 5)
+    assert [sample['line'] for sample in result.error_samples] == [5, 6, 7, 8, 9]
+    assert Transcript.query.filter_by(user_id=user_id).count() == 2
+
+
+def test_import_rejects_other_archive_versions(make_user):
+    user = make_user()
+    with pytest.raises(ValueError):
+        archive.import_lines(user.id, lines({**HEADER, 'version': archive.ARCHIVE_VERSION + 1}))
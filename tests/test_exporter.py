@@ -0,0 +1,19 @@
+from exporter import archive_name
+
+
+def test_archive_name_keeps_readable_titles():
+    assert archive_name(3, 'درس في  الذكاء', 'md') == '3_درس_في_الذكاء.md'
+
+
+def test_archive_name_strips_unsafe_characters():
+    assert archive_name(5, 'a/b\\c:d*e?"f"<g>|h', 'pdf') == '5_abcdefgh.pdf'
+
+
+def test_archive_name_truncates_long_titles():
+    name = archive_name(9, 'x' * 200, 'docx')
+    assert name == f"9_{'x' * 60}.docx"
+
+
+def test_archive_name_falls_back_without_a_title():
+    assert archive_name(1, None, 'md') == '1_transcript.md'
+    assert archive_name(2, ' /// ', 'md') == '2_transcript.md'
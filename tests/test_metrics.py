@@ -0,0 +1,40 @@
+import pytest
+from flask import g
+from sqlalchemy import exc, text
+
+import metrics
+from models import db
+
+
+def test_statements_are_counted_per_request(app):
+    with app.test_request_context('/'):
+        g.metrics_db = [0, 0.0]
+        db.session.execute(text('SELECT 1'))
+        db.session.execute(text('SELECT 2'))
+        count, seconds = g.metrics_db
+        assert count == 2 and seconds >= 0
+        assert db.session.connection().info['metrics_started'] == []
+        db.session.rollback()
+
+
+def test_statements_outside_requests_are_ignored(ctx):
+    db.session.execute(text('SELECT 1'))
+    assert db.session.connection().info['metrics_started'] == []
+
+
+def test_request_metrics_are_rendered(app):
+    app.test_client().get('/login')
+    rendered = metrics.render()
+    assert 'http_requests_total{endpoint="login",method="GET",status="200"}' in rendered
+    assert 'db_queries_per_request_count{endpoint="login"}' in rendered
+
+
+def test_failed_statements_do_not_leave_timers_behind(app):
+    with app.test_request_context('/'):
+        g.metrics_db = [0, 0.0]
+        with pytest.raises(exc.OperationalError):
+            db.session.execute(text('SELECT * FROM no_such_table'))
+        db.session.rollback()
+        assert g.metrics_db[0] == 1
+        assert db.session.connection().info['metrics_started'] == []
+        db.session.rollback()
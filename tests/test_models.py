@@ -0,0 +1,48 @@
+import random
+import string
+
+from sqlalchemy import text
+
+from models import db, CompressedText, Transcript, COMPRESSED_MARKER, COMPRESS_MIN_LENGTH
+
+
+def test_short_values_are_stored_as_is():
+    column = CompressedText()
+    assert column.process_bind_param('short', None) == 'short'
+    assert column.process_bind_param(None, None) is None
+
+
+def test_long_values_round_trip_compressed():
+    column = CompressedText()
+    value = 'نص عربي طويل مع English words. ' * 100
+    stored = column.process_bind_param(value, None)
+    assert stored.startswith(COMPRESSED_MARKER)
+    assert len(stored) < len(value.encode('utf-8'))
+    assert column.process_result_value(stored, None) == value
+
+
+def test_incompressible_values_stay_plain():
+    column = CompressedText()
+    # Random printable text loses more to base64 than zlib saves
+    rng = random.Random(0)
+    value = ''.join(rng.choice(string.printable) for _ in range(COMPRESS_MIN_LENGTH * 2))
+    assert column.process_bind_param(value, None) == value
+
+
+def test_rows_written_before_compression_read_unchanged():
+    assert CompressedText().process_result_value('legacy text', None) == 'legacy text'
+
+
+def test_transcript_column_round_trip(make_user):
+    user = make_user()
+    content = 'line of transcript text\n' * 200
+    transcript = Transcript(user_id=user.id, video_url='https://youtu.be/abcdefghijk', full_content=content)
+    db.session.add(transcript)
+    db.session.commit()
+
+    raw = db.session.execute(
+        text('SELECT full_content FROM transcripts WHERE id = :id'), {'id': transcript.id}
+    ).scalar()
+    assert raw.startswith(COMPRESSED_MARKER)
+    db.session.expire_all()
+    assert db.session.get(Transcript, transcript.id).full_content == content
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import pagination
+from models import db, Transcript
+
+
+def test_cursor_round_trip():
+    row = SimpleNamespace(created_at=datetime(2024, 5, 1, 12, 30, 15, 123456), id=42)
+    assert pagination.decode_cursor(pagination.encode_cursor(row)) == (row.created_at, 42)
+
+
+def test_cursor_has_no_padding():
+    row = SimpleNamespace(created_at=datetime(2024, 5, 1), id=7)
+    assert '=' not in pagination.encode_cursor(row)
+
+
+def test_no_cursor():
+    assert pagination.decode_cursor(None) is None
+    assert pagination.decode_cursor('') is None
+
+
+@pytest.mark.parametrize('value', ['not-a-cursor', '!!!', 'MjAyNC0wNS0wMQ', 'fHx8'])
+def test_malformed_cursor(value):
+    with pytest.raises(ValueError):
+        pagination.decode_cursor(value)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, pagination.DEFAULT_PAGE_SIZE), ('', pagination.DEFAULT_PAGE_SIZE),
+    ('5', 5), ('0', 1), ('-3', 1), ('1000', pagination.MAX_PAGE_SIZE)
+])
+def test_parse_limit(value, expected):
+    assert pagination.parse_limit(value) == expected
+
+
+def test_parse_limit_rejects_non_integers():
+    with pytest.raises(ValueError):
+        pagination.parse_limit('ten')
+
+
+def test_parse_fields():
+    assert pagination.parse_fields(None) is None
+    assert pagination.parse_fields('videoTitle, summary') == ['id', 'videoTitle', 'summary']
+    with pytest.raises(ValueError):
+        pagination.parse_fields('videoTitle,password_hash')
+
+
+def test_pages_cover_every_row_once(make_user):
+    user = make_user()
+    created = datetime(2024, 1, 1)
+    for i in range(7):
+        # Pairs share a created_at, so the id breaks the tie
+        db.session.add(Transcript(
+            user_id=user.id, video_url=f'https://youtu.be/video{i:05d}', created_at=created + timedelta(days=i // 2)
+        ))
+    db.session.commit()
+
+    query = Transcript.query.filter_by(user_id=user.id)
+    seen = []
+    cursor = None
+    while True:
+        rows, next_cursor = pagination.transcript_page(query, 3, cursor)
+        seen.extend(row.id for row in rows)
+        if not next_cursor:
+            break
+        cursor = pagination.decode_cursor(next_cursor)
+    expected = [t.id for t in query.order_by(Transcript.created_at.desc(), Transcript.id.desc())]
+    assert seen == expected
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import retrieval
+import search
+from models import db, Transcript
+
+
+def test_split_chunks_keeps_sentences_within_the_budget():
+    value = ' '.join(f'Sentence number {i} is here.' for i in range(200))
+    chunks = retrieval.split_chunks(value, max_tokens=50)
+    assert len(chunks) > 1
+    assert all(retrieval.estimate_tokens(value[start:end]) <= 50 for start, end in chunks)
+    assert all(value[start:end].endswith('.') for start, end in chunks)
+    assert [start for start, _ in chunks] == sorted(start for start, _ in chunks)
+
+
+def test_split_chunks_cuts_run_on_sentences_by_words():
+    value = 'word ' * 1000
+    chunks = retrieval.split_chunks(value, max_tokens=50)
+    assert len(chunks) > 10
+    covered = ' '.join(value[start:end] for start, end in chunks).split()
+    assert covered == value.split()
+
+
+def test_split_chunks_of_nothing():
+    assert retrieval.split_chunks('') == []
+    assert retrieval.split_chunks(None) == []
+
+
+def chunk(id_, text):
+    terms = search.tokenize(text)
+    return SimpleNamespace(id=id_, terms={t: terms.count(t) for t in terms}, length=len(terms))
+
+
+def test_bm25_ranks_rarer_and_denser_matches_higher():
+    chunks = [
+        chunk(1, 'the cache is warm and the cache is fast'),
+        chunk(2, 'the cache is cold'),
+        chunk(3, 'the database stores rows'),
+        chunk(4, 'the database and the cache')
+    ]
+    scores = retrieval._bm25(search.tokenize('cache'), chunks)
+    assert scores[1] > scores[2] > 0
+    assert scores[3] == 0
+    # A term in every chunk still scores, just less than a rare one
+    rare = retrieval._bm25(search.tokenize('rows'), chunks)
+    common = retrieval._bm25(search.tokenize('the'), chunks)
+    assert rare[3] > common[3] > 0
+
+
+def test_select_context_returns_matching_passages_in_order(make_user):
+    user = make_user()
+    content = ' '.join(
+        'Gradient descent updates the weights.' if i in (30, 80) else f'Unrelated remark number {i}.'
+        for i in range(120)
+    )
+    transcript = Transcript(user_id=user.id, video_url='https://youtu.be/fffffffffff', full_content=content)
+    db.session.add(transcript)
+    db.session.commit()
+
+    passages = retrieval.select_context(transcript.id, 'how does gradient descent work?', top_k=2)
+    assert len(passages) == 2
+    assert all('Gradient descent' in p['content'] for p in passages)
+    assert passages[0]['position'] < passages[1]['position']
+    assert all(p['content'] in content for p in passages)
+
+
+def test_select_context_falls_back_to_the_opening(make_user):
+    user = make_user()
+    content = ' '.join(f'Sentence {i} of the lecture.' for i in range(300))
+    transcript = Transcript(user_id=user.id, video_url='https://youtu.be/ggggggggggg', full_content=content)
+    db.session.add(transcript)
+    db.session.commit()
+
+    passages = retrieval.select_context(transcript.id, 'zzz qqq', top_k=2)
+    assert [p['position'] for p in passages] == [0, 1]
+    assert content.startswith(passages[0]['content'])
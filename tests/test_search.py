@@ -0,0 +1,76 @@
+import search
+from models import db, Transcript
+
+
+def marked(value):
+    return value.replace(search._MARK_START, '[').replace(search._MARK_END, ']')
+
+
+def test_tokenize_folds_arabic_and_drops_proclitics():
+    assert search.tokenize('والكتاب إلى المدرسة') == search.tokenize('كتاب الى مدرسة')
+    assert search.tokenize('Machine Learning') == ['machine', 'learning']
+
+
+def test_query_terms_are_capped():
+    assert len(search.query_terms(' '.join(f'word{i}' for i in range(30)))) == search.SEARCH_MAX_TERMS
+
+
+def test_snippet_marks_matches_in_short_fields():
+    values = {'video_title': 'Intro to databases', 'summary': 'How indexes make queries fast'}
+    assert marked(search.snippet(values, search.query_terms('indexes'))) == 'How [indexes] make queries fast'
+
+
+def test_snippet_matches_term_prefixes_and_arabic_variants():
+    values = {'summary': 'شرح مفصل عن الأنظمة الموزعة'}
+    assert '[الأنظمة]' in marked(search.snippet(values, search.query_terms('انظم')))
+
+
+def test_snippet_prefers_short_fields_over_full_content():
+    values = {'summary': 'caching basics', 'full_content': 'caching ' * 5000}
+    assert marked(search.snippet(values, ['caching'])) == '[caching] basics'
+
+
+def test_snippet_scans_full_content_near_the_first_match():
+    content = 'filler words here. ' * 3000 + 'the rare keyword appears once. ' + 'more filler. ' * 3000
+    result = marked(search.snippet({'video_title': 'Talk', 'full_content': content}, ['keyword']))
+    assert '[keyword]' in result
+    assert result.startswith('…') and result.endswith('…')
+    assert len(result) < 400
+
+
+def test_snippet_without_a_match_shows_the_opening():
+    assert search.snippet({'video_title': 'Plain title'}, ['absent']) == 'Plain title'
+
+
+def test_search_ranks_and_marks_only_the_users_rows(make_user):
+    owner, other = make_user(), make_user()
+    db.session.add_all([
+        Transcript(user_id=owner.id, video_url='https://youtu.be/aaaaaaaaaaa', video_title='Kubernetes operators',
+                   summary='Writing a kubernetes operator in Go'),
+        Transcript(user_id=owner.id, video_url='https://youtu.be/bbbbbbbbbbb', video_title='Cooking pasta',
+                   full_content='boil water. ' * 300 + 'kubernetes was mentioned once.'),
+        Transcript(user_id=other.id, video_url='https://youtu.be/ccccccccccc', video_title='Kubernetes at scale')
+    ])
+    db.session.commit()
+
+    results = search.search(owner.id, 'kubernetes')
+    assert [r['videoTitle'] for r in results] == ['Kubernetes operators', 'Cooking pasta']
+    assert '<mark>kubernetes</mark>' in results[1]['snippet']
+    # Terms match as prefixes, and FTS syntax in the query is never parsed
+    assert [r['id'] for r in search.search(owner.id, 'kube*')] == [r['id'] for r in results]
+
+
+def test_search_follows_updates_and_deletes(make_user):
+    user = make_user()
+    transcript = Transcript(user_id=user.id, video_url='https://youtu.be/ddddddddddd', video_title='Old title')
+    db.session.add(transcript)
+    db.session.commit()
+
+    transcript.video_title = 'Renamed lecture'
+    db.session.commit()
+    assert search.search(user.id, 'old') == []
+    assert [r['id'] for r in search.search(user.id, 'renamed')] == [transcript.id]
+
+    db.session.delete(transcript)
+    db.session.commit()
+    assert search.search(user.id, 'renamed') == []
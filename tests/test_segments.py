@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+import segments
+from models import db, Transcript
+
+
+def test_split_segments_covers_the_text_exactly():
+    value = ''.join(f'[{i // 60:02d}:{i % 60:02d}] line number {i} of the talk\n' for i in range(300))
+    parts = segments.split_segments(value, max_chars=500)
+    assert ''.join(text for _, text in parts) == value
+    assert all(len(text) <= 500 for _, text in parts)
+    assert [offset for offset, _ in parts] == [sum(len(t) for _, t in parts[:i]) for i in range(len(parts))]
+
+
+def test_split_segments_cuts_overlong_lines_at_spaces():
+    value = 'word ' * 300
+    parts = segments.split_segments(value, max_chars=100)
+    assert ''.join(text for _, text in parts) == value
+    assert all(text.endswith(' ') for _, text in parts[:-1])
+
+
+def test_parse_timestamp():
+    assert segments.parse_timestamp('[01:02:03] hello') == 3723
+    assert segments.parse_timestamp('(4:05) hello') == 245
+    assert segments.parse_timestamp('no time here') is None
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None), ('bytes=0-10', None), ('segments=-', None),
+    ('segments=0-2', (0, 2)), ('segments=3-', (3, 9)), ('segments=-4', (6, 9)),
+    ('segments=8-100', (8, 9)), ('segments=-100', (0, 9))
+])
+def test_parse_range(header, expected):
+    assert segments.parse_range(header, 10) == expected
+
+
+@pytest.mark.parametrize('header', ['segments=10-12', 'segments=5-2'])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(ValueError):
+        segments.parse_range(header, 10)
+
+
+def test_read_ranges_matches_full_content(make_user):
+    user = make_user()
+    rng = random.Random(1)
+    content = ''.join(f'sentence {i} ' + 'كلمة ' * rng.randint(1, 20) + '\n' for i in range(2000))
+    transcript = Transcript(user_id=user.id, video_url='https://youtu.be/eeeeeeeeeee', full_content=content)
+    db.session.add(transcript)
+    db.session.commit()
+
+    count, length = segments.summary(transcript.id)
+    assert count > 10 and length == len(content)
+
+    ranges = [(0, 50), (len(content) - 40, 40)]
+    for _ in range(100):
+        offset = rng.randrange(len(content))
+        ranges.append((offset, rng.randint(1, min(2000, len(content) - offset))))
+    assert segments.read_ranges(transcript.id, ranges) == [content[o:o + n] for o, n in ranges]
+
+
+def test_read_ranges_without_segments(ctx):
+    assert segments.read_ranges(-1, [(0, 10)]) == ['']
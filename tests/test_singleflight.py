@@ -0,0 +1,93 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import singleflight
+from models import db, TranscriptLease
+
+
+@pytest.fixture
+def key(ctx):
+    return uuid.uuid4().hex[:11]
+
+
+def expire(key):
+    TranscriptLease.query.filter_by(video_id=key).update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+
+def test_one_holder_at_a_time(key):
+    token = singleflight.acquire(key)
+    assert token
+    assert singleflight.acquire(key) is None
+    assert singleflight.is_held(key)
+
+    singleflight.release(key, 'someone-else')
+    assert singleflight.is_held(key)
+    singleflight.release(key, token)
+    assert not singleflight.is_held(key)
+    assert singleflight.acquire(key)
+
+
+def test_expired_lease_is_taken_over(key):
+    first = singleflight.acquire(key)
+    expire(key)
+    assert not singleflight.is_held(key)
+    takeovers = singleflight.stats()['takeovers']
+
+    second = singleflight.acquire(key)
+    assert second and second != first
+    assert singleflight.stats()['takeovers'] == takeovers + 1
+    # The old leader can no longer release the new one's lease
+    singleflight.release(key, first)
+    assert singleflight.is_held(key)
+
+
+def test_extend_pushes_back_the_expiry(key):
+    singleflight.acquire(key)
+    expire(key)
+    singleflight.extend(key)
+    assert singleflight.is_held(key)
+
+
+def test_heartbeat_keeps_a_long_call_leased(key, monkeypatch):
+    monkeypatch.setattr(singleflight, 'LEASE_SECONDS', 0.3)
+    token = singleflight.acquire(key)
+    with singleflight.heartbeat(key):
+        time.sleep(0.6)
+        db.session.rollback()
+        assert singleflight.is_held(key)
+    singleflight.release(key, token)
+
+
+def test_leader_computes_and_releases(key):
+    calls = []
+    result = singleflight.run(key, lambda: calls.append(1) or 'fresh', lambda: None)
+    assert result == 'fresh' and calls == [1]
+    assert not singleflight.is_held(key)
+
+
+def test_published_result_is_reused(key):
+    result = singleflight.run(key, lambda: pytest.fail('computed again'), lambda: 'cached')
+    assert result == 'cached'
+
+
+def test_follower_waits_for_the_leader(key, monkeypatch):
+    monkeypatch.setattr(singleflight, 'POLL_SECONDS', 0.01)
+    leader = singleflight.acquire(key)
+    published = []
+
+    def lookup():
+        # The leader finishes while the follower polls
+        if not published:
+            published.append('from leader')
+            singleflight.release(key, leader)
+            return None
+        return published[0]
+
+    waits = []
+    result = singleflight.run(key, lambda: pytest.fail('follower computed'), lookup, on_wait=lambda: waits.append(1))
+    assert result == 'from leader'
+    assert waits == [1]
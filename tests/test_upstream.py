@@ -0,0 +1,26 @@
+import requests
+from urllib3.exceptions import NewConnectionError, ProtocolError
+
+import upstream
+
+
+def test_max_call_seconds_idempotent_reads_on_every_attempt():
+    attempts = upstream.MAX_RETRIES + 1
+    backoff = upstream.RETRY_BACKOFF * (2 ** upstream.MAX_RETRIES - 1)
+    assert upstream.max_call_seconds(30) == attempts * (upstream.CONNECT_TIMEOUT + 30) + backoff
+
+
+def test_max_call_seconds_non_idempotent_reads_once():
+    attempts = upstream.MAX_RETRIES + 1
+    backoff = upstream.RETRY_BACKOFF * (2 ** upstream.MAX_RETRIES - 1)
+    assert upstream.max_call_seconds(30, idempotent=False) == attempts * upstream.CONNECT_TIMEOUT + 30 + backoff
+
+
+def test_never_sent():
+    refused = requests.exceptions.ConnectionError(
+        type('MaxRetryError', (), {'reason': NewConnectionError(None, 'refused')})()
+    )
+    assert upstream._never_sent(refused)
+    assert upstream._never_sent(requests.exceptions.ConnectTimeout())
+    reset = requests.exceptions.ConnectionError(ProtocolError('Connection aborted.'))
+    assert not upstream._never_sent(reset)
@@ -0,0 +1,168 @@
+"""Shared transcript result cache keyed by canonical YouTube video ID.
+
+The n8n workflow is slow and expensive, and its output only depends on the
+video, so one result can be reused for every user who submits the same video.
+Entries live in the `transcript_cache` table so all gunicorn workers share them.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+
+from models import db, TranscriptCache
+
+log = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = int(os.environ.get('TRANSCRIPT_CACHE_TTL', 7 * 24 * 3600))  # 7 days
+CACHE_MAX_ENTRIES = int(os.environ.get('TRANSCRIPT_CACHE_MAX_ENTRIES', 2000))
+
+_VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+_PATH_PREFIXES = ('shorts', 'embed', 'live', 'v', 'e')
+
+# Per-worker counters
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'errors': 0}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def extract_video_id(url):
+    """Return the 11-character video ID for any common YouTube URL form, or None"""
+    if not url:
+        return None
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+
+    host = (parsed.hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    segments = [s for s in parsed.path.split('/') if s]
+
+    video_id = None
+    if host == 'youtu.be':
+        video_id = segments[0] if segments else None
+    elif host in ('youtube.com', 'youtube-nocookie.com'):
+        if segments[:1] == ['watch']:
+            video_id = (parse_qs(parsed.query).get('v') or [None])[0]
+        elif len(segments) >= 2 and segments[0] in _PATH_PREFIXES:
+            video_id = segments[1]
+
+    if video_id and _VIDEO_ID_RE.match(video_id):
+        return video_id
+    return None
+
+
+def get(video_id):
+    """Return the cached n8n result for a video, or None on miss/expiry"""
+    try:
+        entry = db.session.get(TranscriptCache, video_id)
+        if entry is None:
+            _count('misses')
+            return None
+
+        now = datetime.utcnow()
+        if entry.created_at < now - timedelta(seconds=CACHE_TTL_SECONDS):
+            db.session.delete(entry)
+            db.session.commit()
+            _count('misses')
+            _count('evictions')
+            return None
+
+        entry.last_accessed_at = now
+        entry.hit_count = (entry.hit_count or 0) + 1
+        payload = json.loads(entry.payload)
+        db.session.commit()
+        _count('hits')
+        return payload
+    except Exception as e:
+        db.session.rollback()
+        _count('errors')
+        log.warning("Transcript cache read error: %s", e)
+        return None
+
+
+def peek(video_id, fresh_since=None):
+    """Read an entry without touching counters or access time.
+
+    With fresh_since, entries stored before that moment are ignored.
+    """
+    try:
+        entry = db.session.get(TranscriptCache, video_id, populate_existing=True)
+        if entry is None:
+            return None
+        if entry.created_at < datetime.utcnow() - timedelta(seconds=CACHE_TTL_SECONDS):
+            return None
+        if fresh_since and entry.created_at < fresh_since:
+            return None
+        return json.loads(entry.payload)
+    except Exception as e:
+        db.session.rollback()
+        _count('errors')
+        log.warning("Transcript cache read error: %s", e)
+        return None
+
+
+def put(video_id, data):
+    """Store an n8n result and trim the cache back to CACHE_MAX_ENTRIES"""
+    try:
+        now = datetime.utcnow()
+        entry = db.session.get(TranscriptCache, video_id)
+        if entry is None:
+            entry = TranscriptCache(video_id=video_id, hit_count=0)
+            db.session.add(entry)
+        entry.payload = json.dumps(data, ensure_ascii=False)
+        entry.created_at = now
+        entry.last_accessed_at = now
+        db.session.commit()
+        _count('stores')
+        _evict()
+    except Exception as e:
+        db.session.rollback()
+        _count('errors')
+        log.warning("Transcript cache write error: %s", e)
+
+
+def _evict():
+    """Drop expired entries, then least recently used ones over the size limit"""
+    cutoff = datetime.utcnow() - timedelta(seconds=CACHE_TTL_SECONDS)
+    removed = TranscriptCache.query.filter(TranscriptCache.created_at < cutoff).delete(synchronize_session=False)
+
+    overflow = TranscriptCache.query.count() - CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale_ids = [
+            row.video_id for row in
+            db.session.query(TranscriptCache.video_id)
+            .order_by(TranscriptCache.last_accessed_at.asc())
+            .limit(overflow)
+        ]
+        removed += TranscriptCache.query.filter(
+            TranscriptCache.video_id.in_(stale_ids)
+        ).delete(synchronize_session=False)
+
+    db.session.commit()
+    if removed:
+        _count('evictions', removed)
+
+
+def stats():
+    """Snapshot of this worker's cache counters"""
+    with _stats_lock:
+        snapshot = dict(_stats)
+    lookups = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_ratio'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+    snapshot['ttl_seconds'] = CACHE_TTL_SECONDS
+    snapshot['max_entries'] = CACHE_MAX_ENTRIES
+    return snapshot
@@ -0,0 +1,242 @@
+"""Transcript pipeline shared by the /api/transcript route and background jobs.
+
+Validates the URL, consults the shared result cache, calls the n8n webhook
+and stores the result as a Transcript row for the requesting user.
+"""
+import logging
+import os
+import re
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+import requests
+
+from models import db, Transcript
+import admission
+import logs
+import singleflight
+import transcript_cache
+import upstream
+
+log = logging.getLogger(__name__)
+
+# n8n webhook URL (point at bench/stub_n8n.py for offline runs)
+N8N_WEBHOOK_URL = os.environ.get('N8N_WEBHOOK_URL', 'https://n8n.srv968786.hstgr.cloud/webhook/youtube_text')
+N8N_TIMEOUT = float(os.environ.get('N8N_TIMEOUT', 300))  # 5 minutes
+
+YOUTUBE_URL_REGEX = r'(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+'
+
+# Longest a transcript call to n8n can last, retries included
+N8N_CALL_SECONDS = upstream.max_call_seconds(N8N_TIMEOUT, idempotent=False)
+if admission.ADMISSION_SLOT_SECONDS <= N8N_CALL_SECONDS:
+    log.warning(
+        "ADMISSION_SLOT_SECONDS=%s is shorter than an n8n call can last (%.0fs); "
+        "a slot could expire and be handed out again mid-call",
+        admission.ADMISSION_SLOT_SECONDS, N8N_CALL_SECONDS
+    )
+
+
+class TranscriptError(Exception):
+    """Pipeline failure carrying the HTTP status and message for the client"""
+
+    def __init__(self, message, status_code=500, details=None, retry_after=None, queue_position=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+
+    def to_dict(self):
+        payload = {'error': self.message}
+        if self.details:
+            payload['details'] = self.details
+        if self.queue_position:
+            payload['queue_position'] = self.queue_position
+        return payload
+
+
+def is_youtube_url(url):
+    return bool(url and re.match(YOUTUBE_URL_REGEX, url))
+
+
+def save_transcript(user_id, url, data):
+    """Store an n8n transcript result as a Transcript row for the user"""
+    transcript = Transcript(
+        user_id=user_id,
+        video_url=url,
+        video_id=transcript_cache.extract_video_id(url),
+        video_title=data.get('videoTitle') or data.get('output', {}).get('subject'),
+        introduction=data.get('introduction') or data.get('output', {}).get('introduction'),
+        summary=data.get('summary'),
+        main_points=data.get('mainPoints'),
+        full_content=data.get('fullContent') or data.get('fullcontent')
+    )
+    db.session.add(transcript)
+    db.session.commit()
+    return transcript
+
+
+def fetch_from_n8n(url):
+    """Run the n8n workflow for a video.
+
+    Returns (data, parsed) where parsed is False when n8n answered with a
+    body that is not JSON; that raw text is passed through but never stored.
+    """
+    try:
+        # n8n expects a GET with the video URL as a query parameter; each call
+        # starts the workflow, so it is only retried when it never got through
+        response = upstream.client.get(
+            N8N_WEBHOOK_URL,
+            read_timeout=N8N_TIMEOUT,
+            idempotent=False,
+            params={'url': url}
+        )
+    except upstream.CircuitOpenError as e:
+        log.warning("n8n circuit open, retry after %ss", e.retry_after)
+        raise TranscriptError(
+            'خدمة n8n غير متاحة حالياً، يرجى المحاولة لاحقاً', 503, retry_after=e.retry_after
+        )
+    except requests.exceptions.Timeout:
+        log.warning("n8n request timeout for %s", url)
+        raise TranscriptError('Request timeout - video processing takes too long', 504)
+    except requests.exceptions.ConnectionError as e:
+        log.error("Could not reach n8n: %s", e)
+        raise TranscriptError('تعذر الاتصال بخدمة n8n', 502)
+
+    if response.status_code != 200:
+        log.error("n8n returned %s for %s: %s", response.status_code, url, logs.payload(response.text))
+        raise TranscriptError(
+            f'n8n returned status {response.status_code}',
+            response.status_code,
+            details=response.text[:500]
+        )
+
+    try:
+        data = response.json()
+    except ValueError as json_error:
+        log.warning("n8n returned non-JSON for %s: %s", url, json_error)
+        return {'fullContent': response.text}, False
+
+    # Check if it's just a workflow started message
+    if isinstance(data, dict) and data.get('message') == 'Workflow was started':
+        log.warning("n8n returned 'Workflow was started' - webhook might be async")
+        raise TranscriptError(
+            'n8n workflow بدأ لكن لم يرجع البيانات. '
+            'تأكد من إعدادات Respond to Webhook في n8n',
+            500
+        )
+
+    # Handle array response from n8n
+    if isinstance(data, list) and len(data) > 0:
+        data = data[0]
+
+    return data, True
+
+
+def process_transcript(user_id, url, refresh=False, on_stage=None, on_queue=None, admission_wait=None):
+    """Produce a transcript for the user, from cache or n8n.
+
+    Returns (data, transcript); transcript is None when n8n's reply could not
+    be parsed and nothing was saved. on_stage(name) is called as the pipeline
+    moves between 'cache', 'waiting', 'admission', 'n8n' and 'saving', and
+    on_queue(position) while the call waits up to admission_wait seconds
+    (default ADMISSION_SYNC_WAIT_SECONDS) for an n8n slot.
+    """
+    def stage(name):
+        if on_stage:
+            on_stage(name)
+
+    def fetch(on_wait=None, lease_key=None):
+        return _fetch_admitted(user_id, url, stage, on_queue, on_wait, admission_wait, lease_key)
+
+    if not is_youtube_url(url):
+        raise TranscriptError('رابط يوتيوب غير صحيح', 400)
+
+    requested_at = datetime.utcnow()
+    video_id = transcript_cache.extract_video_id(url)
+
+    # Serve from the shared cache unless the client asks for a fresh run
+    if video_id and not refresh:
+        stage('cache')
+        cached = transcript_cache.get(video_id)
+        if cached is not None:
+            stage('saving')
+            transcript = save_transcript(user_id, url, cached)
+            log.info("Cache hit for video %s, saved transcript ID: %s", video_id, transcript.id)
+            return cached, transcript
+
+    if video_id:
+        data, parsed = _fetch_coalesced(video_id, requested_at if refresh else None, stage, fetch)
+    else:
+        data, parsed = fetch()
+    if not parsed:
+        return data, None
+
+    stage('saving')
+    transcript = save_transcript(user_id, url, data)
+    log.info("Saved transcript ID: %s", transcript.id)
+    return data, transcript
+
+
+def _fetch_admitted(user_id, url, stage, on_queue, on_wait, max_wait, lease_key=None):
+    """Call n8n once one of the shared admission slots is free.
+
+    With a lease_key the single-flight lease is kept alive for the whole call,
+    so no other worker takes it over and starts a second workflow.
+    """
+    last_position = []
+
+    def queued(position):
+        if last_position != [position]:
+            last_position[:] = [position]
+            stage('admission')
+            if on_queue:
+                on_queue(position)
+        if on_wait:
+            on_wait()
+
+    if max_wait is None:
+        max_wait = admission.ADMISSION_SYNC_WAIT_SECONDS
+    try:
+        with admission.slot(user_id, max_wait, on_wait=queued):
+            stage('n8n')
+            with singleflight.heartbeat(lease_key) if lease_key else nullcontext():
+                # Don't hold a pooled DB connection for the length of the workflow
+                db.session.rollback()
+                return fetch_from_n8n(url)
+    except admission.AdmissionRejected as e:
+        log.info("Admission rejected for user %s at queue position %s", user_id, e.position)
+        raise TranscriptError(
+            'الخادم مشغول حالياً، يرجى المحاولة بعد قليل', 429,
+            retry_after=e.retry_after, queue_position=e.position
+        )
+
+
+def _fetch_coalesced(video_id, fresh_since, stage, fetch):
+    """Call n8n for a video unless another request is already doing so.
+
+    Followers wait for the leader and reuse the result it publishes to the
+    shared cache; a refresh only accepts results stored after fresh_since.
+    """
+    def lookup():
+        cached = transcript_cache.peek(video_id, fresh_since=fresh_since)
+        return (cached, True) if cached is not None else None
+
+    extended_at = [time.monotonic()]
+
+    def keep_lease():
+        # Queued for admission: don't let our lease lapse and invite a takeover
+        if time.monotonic() - extended_at[0] >= singleflight.LEASE_SECONDS / 3:
+            singleflight.extend(video_id)
+            extended_at[0] = time.monotonic()
+
+    def compute():
+        data, parsed = fetch(on_wait=keep_lease, lease_key=video_id)
+        if parsed:
+            # Publish before the lease is released so waiters find it
+            transcript_cache.put(video_id, data)
+        return data, parsed
+
+    return singleflight.run(video_id, compute, lookup, on_wait=lambda: stage('waiting'))
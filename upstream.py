@@ -0,0 +1,269 @@
+"""Shared HTTP client for the n8n webhooks.
+
+Each worker process keeps one requests.Session so calls to the n8n host reuse
+pooled keep-alive connections instead of paying a TCP/TLS handshake every
+time. Calls get separate connect and read timeouts, jittered retries for
+failures that are safe to repeat, and a per-host circuit breaker that fails
+fast while n8n is unhealthy instead of letting threads pile up on timeouts.
+
+Webhooks that start a workflow are not safe to repeat even when they are
+GETs; callers pass idempotent=False and only failures to connect, where the
+request never left this process, are retried.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 5))
+POOL_MAXSIZE = int(os.environ.get('UPSTREAM_POOL_MAXSIZE', 10))
+MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))
+RETRY_BACKOFF = float(os.environ.get('UPSTREAM_RETRY_BACKOFF', 0.5))
+BREAKER_FAILURES = int(os.environ.get('UPSTREAM_BREAKER_FAILURES', 5))
+BREAKER_COOLDOWN = float(os.environ.get('UPSTREAM_BREAKER_COOLDOWN', 30))
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+# Gateway answers that mean the request never reached a healthy n8n.
+# 504 is left out: the workflow may already be running behind the proxy.
+RETRY_STATUSES = {502, 503}
+FAILURE_STATUSES = {502, 503, 504}
+
+
+def max_call_seconds(read_timeout, idempotent=True):
+    """Longest a request() can take: every attempt running into its timeouts, plus the backoff.
+
+    A non-idempotent call only retries failed connects, so it reads at most once.
+    """
+    backoff = RETRY_BACKOFF * (2 ** MAX_RETRIES - 1)
+    if idempotent:
+        return (MAX_RETRIES + 1) * (CONNECT_TIMEOUT + read_timeout) + backoff
+    return (MAX_RETRIES + 1) * CONNECT_TIMEOUT + read_timeout + backoff
+
+
+def _never_sent(error):
+    """True when a ConnectionError happened before the request reached the server"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f'Circuit open for {host}')
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half_open -> closed"""
+
+    def __init__(self, host, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(0, int(self.cooldown - (time.monotonic() - self.opened_at)) + 1)
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+
+            # Half-open lets exactly one trial call through
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            if self.state != 'closed':
+                self.rejected += 1
+                raise CircuitOpenError(self.host, self.retry_after())
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                    log.warning("Circuit breaker opened for %s after %s failures", self.host, self.failures)
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'retry_after': self.retry_after() if self.state == 'open' else 0
+            }
+
+
+class UpstreamClient:
+    """Pooled, retrying, circuit-broken HTTP client (one session per process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._breakers = {}
+        self._stats = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def _get_session(self):
+        # Sessions must not be shared across a fork, so rebuild per process
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
+
+    def breaker(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host)
+            return self._breakers[host]
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _backoff(self, attempt):
+        # Full jitter keeps workers from retrying in lockstep
+        time.sleep(random.uniform(0, RETRY_BACKOFF * (2 ** attempt)))
+
+    def _send(self, session, host, method, url, read_timeout, **kwargs):
+        """One attempt, timed for /metrics (streamed bodies: time to headers)"""
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=(CONNECT_TIMEOUT, read_timeout), **kwargs)
+        except Exception as e:
+            metrics.observe_upstream(host, method, time.perf_counter() - started, type(e).__name__)
+            raise
+        size = response.headers.get('Content-Length', '')
+        metrics.observe_upstream(
+            host, method, time.perf_counter() - started, response.status_code,
+            int(size) if size.isdigit() else None
+        )
+        return response
+
+    def request(self, method, url, read_timeout, idempotent=None, **kwargs):
+        """Send a request; raises CircuitOpenError or requests exceptions.
+
+        idempotent defaults to whether the method is; pass False for calls
+        with side effects, such as a GET webhook that starts a workflow.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        breaker = self.breaker(url)
+        breaker.before_call()
+        session = self._get_session()
+
+        attempt = 0
+        while True:
+            self._count('requests')
+            try:
+                response = self._send(session, breaker.host, method, url, read_timeout, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                # A failed connect never reached n8n, so it is always safe to retry
+                retryable = idempotent or _never_sent(e)
+                if retryable and attempt < MAX_RETRIES:
+                    self._count('retries')
+                    self._backoff(attempt)
+                    attempt += 1
+                    continue
+                self._count('failures')
+                breaker.record_failure()
+                raise
+            except requests.exceptions.Timeout:
+                self._count('failures')
+                breaker.record_failure()
+                raise
+            except Exception:
+                breaker.record_failure()
+                raise
+
+            if response.status_code in RETRY_STATUSES and idempotent and attempt < MAX_RETRIES:
+                response.close()
+                self._count('retries')
+                self._backoff(attempt)
+                attempt += 1
+                continue
+
+            if response.status_code in FAILURE_STATUSES:
+                self._count('failures')
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+    def get(self, url, read_timeout, idempotent=None, **kwargs):
+        return self.request('GET', url, read_timeout, idempotent, **kwargs)
+
+    def post(self, url, read_timeout, idempotent=None, **kwargs):
+        return self.request('POST', url, read_timeout, idempotent, **kwargs)
+
+    def stats(self):
+        """Pool and breaker state for this worker"""
+        with self._lock:
+            result = dict(self._stats)
+            breakers = dict(self._breakers)
+            session = self._session if self._pid == os.getpid() else None
+
+        pools = []
+        if session is not None:
+            pool_manager = session.get_adapter('https://').poolmanager
+            for key in list(pool_manager.pools.keys()):
+                pool = pool_manager.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle': pool.pool.qsize() if pool.pool else 0,
+                    'max_size': pool.pool.maxsize if pool.pool else 0
+                })
+
+        result['pools'] = pools
+        result['breakers'] = {host: b.snapshot() for host, b in breakers.items()}
+        return result
+
+
+client = UpstreamClient()